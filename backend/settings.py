@@ -140,4 +140,6 @@ CORS_ALLOWED_ORIGINS = [
 # Media (用户上传文件) 配置
 import os
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'media') # 指向 DeepCAD_WebApp/media
\ No newline at end of file
+MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'media') # 指向 DeepCAD_WebApp/media
+# 近似重复上传检测：占据网格 Jaccard 相似度阈值，设为 None 时只做指纹精确匹配
+FINGERPRINT_SIMILARITY = 0.9
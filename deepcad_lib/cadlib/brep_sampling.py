@@ -0,0 +1,136 @@
+import numpy as np
+from OCC.Core.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_Curve2d
+from OCC.Core.BRepGProp import brepgprop
+from OCC.Core.GProp import GProp_GProps
+from OCC.Core.GeomAbs import GeomAbs_Plane, GeomAbs_Cylinder, GeomAbs_Line
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE, TopAbs_REVERSED
+from OCC.Core.TopoDS import topods
+from OCC.Core.gp import gp_Pnt, gp_Vec
+
+
+def _xyz(v):
+    return np.array([v.X(), v.Y(), v.Z()])
+
+
+def face_uv_boundary(face, n_curve_samples=32):
+    """boundary of a face in its UV domain as segments (S, 2, 2), from the discretized pcurves of all its edges.
+    Seam edges appear twice, once per side of the parameter domain."""
+    segments = []
+    explorer = TopExp_Explorer(face, TopAbs_EDGE)
+    while explorer.More():
+        edge = topods.Edge(explorer.Current())
+        explorer.Next()
+        curve = BRepAdaptor_Curve2d(edge, face)
+        n = 2 if curve.GetType() == GeomAbs_Line else n_curve_samples
+        ts = np.linspace(curve.FirstParameter(), curve.LastParameter(), n)
+        uv = np.array([[p.X(), p.Y()] for p in (curve.Value(t) for t in ts)])
+        segments.append(np.stack([uv[:-1], uv[1:]], axis=1))
+    return np.concatenate(segments, axis=0)
+
+
+def points_in_uv_boundary(uv, segments):
+    """even-odd ray casting of points (K, 2) against boundary segments (S, 2, 2), handles holes"""
+    a, b = segments[None, :, 0], segments[None, :, 1]  # (1, S, 2)
+    u, v = uv[:, None, 0], uv[:, None, 1]  # (K, 1)
+    straddle = (a[..., 1] > v) != (b[..., 1] > v)
+    dv = np.where(straddle, b[..., 1] - a[..., 1], 1.0)
+    u_cross = a[..., 0] + (v - a[..., 1]) * (b[..., 0] - a[..., 0]) / dv
+    crossings = np.sum(straddle & (u < u_cross), axis=1)
+    return crossings % 2 == 1
+
+
+def _surface_d1(surface, uv):
+    """points and first derivatives (K, 3) of a face surface at uv, closed form for planes and cylinders"""
+    surface_type = surface.GetType()
+    u, v = uv[:, :1], uv[:, 1:]
+    if surface_type == GeomAbs_Plane:
+        pos = surface.Plane().Position()
+        o, x, y = _xyz(pos.Location()), _xyz(pos.XDirection()), _xyz(pos.YDirection())
+        du = np.broadcast_to(x, (len(uv), 3))
+        dv = np.broadcast_to(y, (len(uv), 3))
+        return o + u * x + v * y, du, dv
+    if surface_type == GeomAbs_Cylinder:
+        cylinder = surface.Cylinder()
+        pos, r = cylinder.Position(), cylinder.Radius()
+        o, x, y, z = _xyz(pos.Location()), _xyz(pos.XDirection()), _xyz(pos.YDirection()), _xyz(pos.Direction())
+        radial = np.cos(u) * x + np.sin(u) * y
+        du = r * (-np.sin(u) * x + np.cos(u) * y)
+        return o + r * radial + v * z, du, np.broadcast_to(z, (len(uv), 3))
+
+    points, dus, dvs = [], [], []
+    for pu, pv in uv:
+        p, d1u, d1v = gp_Pnt(), gp_Vec(), gp_Vec()
+        surface.D1(float(pu), float(pv), p, d1u, d1v)
+        points.append(_xyz(p))
+        dus.append(_xyz(d1u))
+        dvs.append(_xyz(d1v))
+    return np.array(points), np.array(dus), np.array(dvs)
+
+
+def sample_face(face, n_points, max_rounds=100):
+    """uniformly sample n_points on one trimmed face: candidates are drawn uniformly in the UV bounds,
+    kept if inside the trimming boundary and, for curved surfaces with varying area element, by rejection on it"""
+    surface = BRepAdaptor_Surface(face, True)
+    segments = face_uv_boundary(face)
+    uv_min, uv_max = segments.reshape(-1, 2).min(axis=0), segments.reshape(-1, 2).max(axis=0)
+    constant_jacobian = surface.GetType() in (GeomAbs_Plane, GeomAbs_Cylinder)
+
+    points, normals = [], []
+    n_found = 0
+    accept_ratio = 0.5
+    for _ in range(max_rounds):
+        n_candidates = int((n_points - n_found) / accept_ratio * 1.2) + 16
+        uv = uv_min + np.random.random((n_candidates, 2)) * (uv_max - uv_min)
+        uv = uv[points_in_uv_boundary(uv, segments)]
+        pts, du, dv = _surface_d1(surface, uv)
+        cross = np.cross(du, dv)
+        jacobian = np.linalg.norm(cross, axis=1)
+        keep = jacobian > 1e-12
+        if not constant_jacobian and keep.any():
+            keep &= np.random.random(len(jacobian)) * jacobian.max() <= jacobian
+        accept_ratio = max(keep.sum() / n_candidates, 0.01)
+
+        points.append(pts[keep])
+        normals.append(cross[keep] / jacobian[keep, None])
+        n_found += keep.sum()
+        if n_found >= n_points:
+            break
+    else:
+        raise ValueError("failed to sample face")
+
+    normals = np.concatenate(normals, axis=0)[:n_points]
+    if face.Orientation() == TopAbs_REVERSED:
+        normals = -normals
+    return np.concatenate(points, axis=0)[:n_points], normals
+
+
+def sample_brep_surface(shape, n_points, return_normals=False):
+    """sample n_points uniformly on the surface of a shape directly from its B-rep faces, without meshing.
+    Samples are allocated to faces by their area (BRepGProp); normals point along the outward face normal."""
+    faces, areas = [], []
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        face = topods.Face(explorer.Current())
+        explorer.Next()
+        props = GProp_GProps()
+        brepgprop.SurfaceProperties(face, props)
+        faces.append(face)
+        areas.append(props.Mass())
+    areas = np.array(areas)
+    if len(faces) == 0 or areas.sum() <= 0:
+        raise ValueError("shape has no surface")
+
+    counts = np.random.multinomial(n_points, areas / areas.sum())
+    points, normals = [], []
+    for face, count in zip(faces, counts):
+        if count == 0:
+            continue
+        pts, nms = sample_face(face, count)
+        points.append(pts)
+        normals.append(nms)
+    perm = np.random.permutation(n_points)
+    points = np.concatenate(points, axis=0)[perm]
+    if not return_normals:
+        return points
+    return points, np.concatenate(normals, axis=0)[perm]
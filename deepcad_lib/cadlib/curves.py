@@ -4,6 +4,11 @@ import matplotlib.patches as patches
 from .math_utils import rads_to_degs, angle_from_vector_to_x
 from .macro import *
 
+# padding of curve vectors, see to_vector
+LINE_PAD = [PAD_VAL] * (N_ARGS - 2)
+ARC_PAD = [PAD_VAL] * (1 + N_ARGS_EXT)
+CIRCLE_PAD = [PAD_VAL] * N_ARGS_EXT
+
 
 # FIXME: these two functions can be treated as static method
 def construct_curve_from_dict(stat):
@@ -34,7 +39,10 @@ def construct_curve_from_vector(vec, start_point, is_numerical=True):
 
 #######################  base  #######################
 class CurveBase(object):
-    """Base class for curve. All types of curves shall inherit from this."""
+    """Base class for curve. All types of curves shall inherit from this.
+    Curves are created by the million in dataset conversion, so subclasses declare __slots__."""
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -88,6 +96,8 @@ class CurveBase(object):
 
 ####################### curves #######################
 class Line(CurveBase):
+    __slots__ = ('start_point', 'end_point')
+
     def __init__(self, start_point, end_point):
         super(Line, self).__init__()
         self.start_point = start_point
@@ -140,8 +150,7 @@ class Line(CurveBase):
         self.end_point = self.end_point.round().clip(min=0, max=n-1).astype(np.int)
 
     def to_vector(self):
-        vec = [LINE_IDX, self.end_point[0], self.end_point[1]]
-        return np.array(vec + [PAD_VAL] * (1 + N_ARGS - len(vec)))
+        return np.array([LINE_IDX, self.end_point[0], self.end_point[1], *LINE_PAD])
 
     def draw(self, ax, color):
         xdata = [self.start_point[0], self.end_point[0]]
@@ -156,6 +165,9 @@ class Line(CurveBase):
 
 
 class Arc(CurveBase):
+    __slots__ = ('start_point', 'end_point', 'center', 'radius', 'normal', 'start_angle', 'end_angle', 'ref_vec',
+                 'mid_point')
+
     def __init__(self, start_point, end_point, center, radius,
                  normal=None, start_angle=None, end_angle=None, ref_vec=None):
         super(Arc, self).__init__()
@@ -303,8 +315,7 @@ class Arc(CurveBase):
 
     def to_vector(self):
         sweep_angle = max(abs(self.start_angle - self.end_angle), 1)
-        return np.array([ARC_IDX, self.end_point[0], self.end_point[1], sweep_angle, int(self.clock_sign), PAD_VAL,
-                         *[PAD_VAL] * N_ARGS_EXT])
+        return np.array([ARC_IDX, self.end_point[0], self.end_point[1], sweep_angle, int(self.clock_sign), *ARC_PAD])
 
     def draw(self, ax, color):
         ref_vec_angle = rads_to_degs(angle_from_vector_to_x(self.ref_vec))
@@ -343,6 +354,8 @@ class Arc(CurveBase):
 
 
 class Circle(CurveBase):
+    __slots__ = ('center', 'radius', 'normal')
+
     def __init__(self, center, radius, normal=None):
         super(Circle, self).__init__()
         self.center = center
@@ -404,8 +417,7 @@ class Circle(CurveBase):
         self.radius = np.round(self.radius).clip(min=1, max=n-1).astype(np.int)
 
     def to_vector(self):
-        vec = [CIRCLE_IDX, self.center[0], self.center[1], PAD_VAL, PAD_VAL, self.radius]
-        return np.array(vec + [PAD_VAL] * (1 + N_ARGS - len(vec)))
+        return np.array([CIRCLE_IDX, self.center[0], self.center[1], PAD_VAL, PAD_VAL, self.radius, *CIRCLE_PAD])
 
     def draw(self, ax, color):
         ap = patches.Circle((self.center[0], self.center[1]), self.radius,
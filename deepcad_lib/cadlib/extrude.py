@@ -1,12 +1,16 @@
 import numpy as np
 import random
-from .sketch import Profile
+from .sketch import Profile, EOS_ROW
 from .macro import *
 from .math_utils import cartesian2polar, polar2cartesian, polar_parameterization, polar_parameterization_inverse
 
+SKETCH_PAD = [PAD_VAL] * N_ARGS_SKETCH
+
 
 class CoordSystem(object):
     """Local coordinate system for sketch plane."""
+    __slots__ = ('origin', '_theta', '_phi', '_gamma', '_y_axis', 'is_numerical')
+
     def __init__(self, origin, theta, phi, gamma, y_axis=None, is_numerical=False):
         self.origin = origin
         self._theta = theta # 0~pi
@@ -77,6 +81,9 @@ class CoordSystem(object):
 class Extrude(object):
     """Single extrude operation with corresponding a sketch profile.
     NOTE: only support single sketch profile. Extrusion with multiple profiles is decomposed."""
+    __slots__ = ('profile', 'sketch_plane', 'operation', 'extent_type', 'extent_one', 'extent_two',
+                 'sketch_pos', 'sketch_size')
+
     def __init__(self, profile: Profile, sketch_plane: CoordSystem,
                  operation, extent_type, extent_one, extent_two, sketch_pos, sketch_size):
         """
@@ -148,7 +155,7 @@ class Extrude(object):
     def from_vector(vec, is_numerical=False, n=256):
         """vector representation: commands [SOL, ..., SOL, ..., EXT]"""
         assert vec[-1][0] == EXT_IDX and vec[0][0] == SOL_IDX
-        profile_vec = np.concatenate([vec[:-1], EOS_VEC[np.newaxis]])
+        profile_vec = np.concatenate([vec[:-1], EOS_ROW])
         profile = Profile.from_vector(profile_vec, is_numerical=is_numerical)
         ext_vec = vec[-1][-N_ARGS_EXT:]
 
@@ -218,16 +225,18 @@ class Extrude(object):
         sket_plane_orientation = self.sketch_plane.to_vector()[3:]
         ext_param = list(sket_plane_orientation) + list(self.sketch_pos) + [self.sketch_size] + \
                     [self.extent_one, self.extent_two, self.operation, self.extent_type]
-        ext_vec = np.array([EXT_IDX, *[PAD_VAL] * N_ARGS_SKETCH, *ext_param])
+        ext_vec = np.array([EXT_IDX, *SKETCH_PAD, *ext_param])
         vec = np.concatenate([profile_vec[:-1], ext_vec[np.newaxis], profile_vec[-1:]], axis=0) # NOTE: last one is EOS
         if pad:
             pad_len = max_n_loops * max_len_loop - vec.shape[0]
-            vec = np.concatenate([vec, EOS_VEC[np.newaxis].repeat(pad_len, axis=0)], axis=0)
+            vec = np.concatenate([vec, EOS_ROW.repeat(pad_len, axis=0)], axis=0)
         return vec
 
 
 class CADSequence(object):
     """A CAD modeling sequence, a series of extrude operations."""
+    __slots__ = ('seq', 'bbox')
+
     def __init__(self, extrude_seq, bbox=None):
         self.seq = extrude_seq
         self.bbox = bbox
@@ -272,12 +281,12 @@ class CADSequence(object):
             vec_seq.append(vec)
 
         vec_seq = np.concatenate(vec_seq, axis=0)
-        vec_seq = np.concatenate([vec_seq, EOS_VEC[np.newaxis]], axis=0)
+        vec_seq = np.concatenate([vec_seq, EOS_ROW], axis=0)
 
         # add EOS padding
         if pad and vec_seq.shape[0] < max_total_len:
             pad_len = max_total_len - vec_seq.shape[0]
-            vec_seq = np.concatenate([vec_seq, EOS_VEC[np.newaxis].repeat(pad_len, axis=0)], axis=0)
+            vec_seq = np.concatenate([vec_seq, EOS_ROW.repeat(pad_len, axis=0)], axis=0)
 
         return vec_seq
 
@@ -0,0 +1,208 @@
+"""OCC-free triangle meshes of CAD sequences for instant preview.
+Each Extrude becomes a prism over its triangulated profile; boolean operations are not evaluated,
+every extrude is returned as a separate part tagged with its operation."""
+import json
+import numpy as np
+from copy import deepcopy
+from .extrude import CADSequence, Extrude
+from .sketch import Loop, Profile
+from .curves import Line, Arc, Circle
+from .macro import *
+
+
+def vec2preview(vec, is_numerical=True, n=256):
+    """preview mesh of a CAD vector, see create_preview_mesh"""
+    cad = CADSequence.from_vector(vec, is_numerical=is_numerical, n=n)
+    return create_preview_mesh(cad)
+
+
+def create_preview_mesh(cad_seq: CADSequence):
+    """triangle mesh of all extrudes of a CADSequence.
+
+    Returns:
+        vertices (np.array): (N, 3)
+        faces (np.array): (M, 3) vertex indices, counter-clockwise seen from outside
+        parts (list): one (operation name, first face, number of faces) per extrude
+    """
+    all_vertices, all_faces, parts = [], [], []
+    n_vertices, n_faces = 0, 0
+    for extrude_op in cad_seq.seq:
+        try:
+            vertices, faces = create_extrude_mesh(extrude_op)
+        except ValueError: # degenerate profile
+            continue
+        all_vertices.append(vertices)
+        all_faces.append(faces + n_vertices)
+        parts.append((EXTRUDE_OPERATIONS[extrude_op.operation], n_faces, len(faces)))
+        n_vertices += len(vertices)
+        n_faces += len(faces)
+    if len(all_faces) == 0:
+        raise ValueError("no valid extrude to preview")
+    return np.concatenate(all_vertices, axis=0), np.concatenate(all_faces, axis=0), parts
+
+
+def create_extrude_mesh(extrude_op: Extrude, n_arc=16, n_circle=32):
+    """prism mesh of a single extrude, following the extent types of create_by_extrude"""
+    profile = deepcopy(extrude_op.profile)
+    profile.denormalize(extrude_op.sketch_size)
+    points_2d, triangles, loops = triangulate_profile(profile, n_arc, n_circle)
+
+    if extrude_op.extent_type == EXTENT_TYPE.index("SymmetricFeatureExtentType"):
+        extent_lo, extent_hi = -extrude_op.extent_one, extrude_op.extent_one
+    elif extrude_op.extent_type == EXTENT_TYPE.index("TwoSidesFeatureExtentType"):
+        extent_lo, extent_hi = -extrude_op.extent_two, extrude_op.extent_one
+    else:
+        extent_lo, extent_hi = 0, extrude_op.extent_one
+    extent_lo, extent_hi = min(extent_lo, extent_hi), max(extent_lo, extent_hi)
+    if extent_hi - extent_lo < 1e-8:
+        raise ValueError("zero extent")
+
+    plane = extrude_op.sketch_plane
+    base = extrude_op.sketch_pos + points_2d[:, :1] * plane.x_axis + points_2d[:, 1:] * plane.y_axis
+    vertices = np.concatenate([base + extent_lo * plane.normal, base + extent_hi * plane.normal], axis=0)
+
+    n = len(points_2d)
+    faces = [triangles[:, ::-1], triangles + n] # bottom cap faces -normal, top cap +normal
+    for loop in loops: # outer loop counter-clockwise, holes clockwise, so side quads face outwards
+        a, b = loop, np.roll(loop, -1)
+        faces.append(np.stack([a, b, b + n], axis=1))
+        faces.append(np.stack([a, b + n, a + n], axis=1))
+    return vertices, np.concatenate(faces, axis=0)
+
+
+def discretize_loop(loop: Loop, n_arc=16, n_circle=32):
+    """polygon (K, 2) following a sketch loop, without repeating the start point"""
+    points = []
+    for curve in loop.children:
+        if isinstance(curve, Circle):
+            points.append(curve.sample_points(n_circle))
+            continue
+        if isinstance(curve, Line):
+            curve_points = np.stack([curve.start_point, curve.end_point], axis=0)
+        elif isinstance(curve, Arc):
+            curve_points = curve.sample_points(n_arc)
+            # sample_points goes counter-clockwise, not necessarily from start to end
+            if np.linalg.norm(curve_points[0] - curve.start_point) > np.linalg.norm(curve_points[-1] - curve.start_point):
+                curve_points = curve_points[::-1]
+        else:
+            raise NotImplementedError(type(curve))
+        points.append(curve_points[:-1])
+    polygon = np.concatenate(points, axis=0)
+
+    # drop repeated points left by zero-length curves
+    keep = np.linalg.norm(polygon - np.roll(polygon, 1, axis=0), axis=1) > 1e-9
+    return polygon[keep]
+
+
+def signed_area(polygon):
+    x, y = polygon[:, 0], polygon[:, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+
+def triangulate_profile(profile: Profile, n_arc=16, n_circle=32):
+    """triangulate a profile; the first loop is the outer boundary and the others are holes, as in create_profile_face.
+
+    Returns:
+        points (np.array): (N, 2) all loop vertices
+        triangles (np.array): (M, 3) counter-clockwise
+        loops (list): vertex indices of each loop, outer counter-clockwise and holes clockwise
+    """
+    polygons = []
+    for i, loop in enumerate(profile.children):
+        polygon = discretize_loop(loop, n_arc, n_circle)
+        if len(polygon) < 3:
+            if i == 0:
+                raise ValueError("degenerate outer loop")
+            continue
+        is_ccw = signed_area(polygon) > 0
+        if is_ccw != (i == 0):
+            polygon = polygon[::-1]
+        polygons.append(polygon)
+
+    points = np.concatenate(polygons, axis=0)
+    loops = []
+    start = 0
+    for polygon in polygons:
+        loops.append(np.arange(start, start + len(polygon)))
+        start += len(polygon)
+
+    ring = list(loops[0])
+    for hole in sorted(loops[1:], key=lambda h: -points[h, 0].max()):
+        ring = _bridge_hole(points, ring, list(hole), loops)
+    triangles = _ear_clip(points, ring)
+    return points, triangles, loops
+
+
+def _segments_intersect(p, q, a, b):
+    """proper intersection of segments pq and ab (shared end points do not count)"""
+    def orient(u, v, w):
+        return (v[0] - u[0]) * (w[1] - u[1]) - (v[1] - u[1]) * (w[0] - u[0])
+    d1, d2 = orient(p, q, a), orient(p, q, b)
+    d3, d4 = orient(a, b, p), orient(a, b, q)
+    return d1 * d2 < 0 and d3 * d4 < 0
+
+
+def _bridge_hole(points, ring, hole, loops):
+    """splice a hole into the outer ring through a visible vertex pair, giving one weakly simple polygon"""
+    m = hole[int(np.argmax(points[hole, 0]))]
+    edges = [(loop[i], loop[(i + 1) % len(loop)]) for loop in loops for i in range(len(loop))]
+    candidates = sorted(range(len(ring)), key=lambda i: np.linalg.norm(points[ring[i]] - points[m]))
+    bridge = candidates[0]
+    for i in candidates:
+        v = ring[i]
+        if not any(_segments_intersect(points[m], points[v], points[a], points[b])
+                   for a, b in edges if v not in (a, b) and m not in (a, b)):
+            bridge = i
+            break
+    j = hole.index(m)
+    hole = hole[j:] + hole[:j + 1]
+    return ring[:bridge + 1] + hole + ring[bridge:]
+
+
+def _ear_clip(points, ring):
+    """ear clipping of a counter-clockwise (weakly) simple polygon given as vertex indices"""
+    ring = list(ring)
+    triangles = []
+    n_fail = 0
+    i = 0
+    while len(ring) > 3:
+        n = len(ring)
+        a, b, c = ring[(i - 1) % n], ring[i % n], ring[(i + 1) % n]
+        pa, pb, pc = points[a], points[b], points[c]
+        cross = (pb[0] - pa[0]) * (pc[1] - pa[1]) - (pb[1] - pa[1]) * (pc[0] - pa[0])
+        if abs(cross) <= 1e-12 or n_fail > n: # collinear vertex, or stuck on degenerate input
+            if cross > 1e-12:
+                triangles.append((a, b, c))
+            ring.pop(i % n)
+            n_fail = 0
+        elif cross > 0 and not _any_point_in_triangle(points, ring, pa, pb, pc):
+            triangles.append((a, b, c))
+            ring.pop(i % n)
+            n_fail = 0
+        else:
+            i += 1
+            n_fail += 1
+    triangles.append(tuple(ring))
+    return np.array(triangles, dtype=np.int64)
+
+
+def _any_point_in_triangle(points, ring, pa, pb, pc):
+    p = points[ring]
+    # points coinciding with a corner (bridge duplicates, the corners themselves) never block an ear
+    at_corner = (np.linalg.norm(p - pa, axis=1) < 1e-12) | (np.linalg.norm(p - pb, axis=1) < 1e-12) | \
+                (np.linalg.norm(p - pc, axis=1) < 1e-12)
+    d1 = (pb[0] - pa[0]) * (p[:, 1] - pa[1]) - (pb[1] - pa[1]) * (p[:, 0] - pa[0])
+    d2 = (pc[0] - pb[0]) * (p[:, 1] - pb[1]) - (pc[1] - pb[1]) * (p[:, 0] - pb[0])
+    d3 = (pa[0] - pc[0]) * (p[:, 1] - pc[1]) - (pa[1] - pc[1]) * (p[:, 0] - pc[0])
+    inside = (d1 >= 0) & (d2 >= 0) & (d3 >= 0)
+    return bool(np.any(inside & ~at_corner))
+
+
+def save_preview_json(vertices, faces, parts, path):
+    """write a preview mesh as JSON (flat positions, indices and parts) for the web viewer"""
+    with open(path, "w") as fp:
+        json.dump({
+            "positions": np.asarray(vertices, dtype=np.float32).reshape(-1).round(5).tolist(),
+            "indices": np.asarray(faces).reshape(-1).tolist(),
+            "parts": [{"operation": op, "start": 3 * start, "count": 3 * count} for op, start, count in parts],
+        }, fp)
@@ -0,0 +1,576 @@
+"""Struct-of-arrays form of one or many CADSequences: one table of curves, one of loops and one of extrudes,
+linked by offsets, with the transforms of the object form (transform, normalize, flip, numericalize, ...)
+applied to whole tables at once. Converts losslessly to and from CADSequence."""
+import numpy as np
+from .extrude import CADSequence, Extrude, CoordSystem
+from .sketch import Loop, Profile, EOS_ROW
+from .curves import Line, Arc, Circle
+from .macro import *
+from .vector_batch import parse_cad_vectors
+
+CURVE_FIELDS = ('curve_type', 'start_point', 'end_point', 'mid_point', 'center', 'radius',
+                'start_angle', 'end_angle', 'ref_vec', 'normal')
+LOOP_FIELDS = ('is_outer',)
+EXTRUDE_FIELDS = ('origin', 'plane', 'y_axis', 'sketch_pos', 'sketch_size', 'extent_one', 'extent_two',
+                  'operation', 'extent_type')
+FLIP_AXES = ['x', 'y', 'xy']
+FLIP_SIGNS = np.array([[1, -1], [-1, 1], [-1, -1]])
+
+
+def _allclose_rows(a, b, rtol=1e-5, atol=1e-8):
+    """np.allclose(a[i], b[i]) for every row i"""
+    return np.all(np.abs(a - b) <= atol + rtol * np.abs(b), axis=-1)
+
+
+def _angle_from_vector_to_x(vec):
+    """math_utils.angle_from_vector_to_x of every row of vec (K, 2)"""
+    x, y = vec[..., 0], vec[..., 1]
+    with np.errstate(invalid='ignore'):
+        asin_y, asin_neg_y = np.arcsin(y), np.arcsin(-y)
+    return np.where(x >= 0, np.where(y >= 0, asin_y, 2.0 * np.pi - asin_neg_y),
+                    np.where(y >= 0, np.pi - asin_y, np.pi + asin_neg_y))
+
+
+def _as_int_if_integral(value):
+    value = np.asarray(value)
+    if np.all(np.isfinite(value)) and np.all(value == np.round(value)):
+        return value.astype(int)
+    return value
+
+
+class CADSequenceArrays(object):
+    """One or more CAD sequences as tables.
+
+    - curves (C,): curve_type, start_point, end_point, mid_point, center (C, 2), radius, start_angle, end_angle,
+      ref_vec (C, 2) and normal (C, 3); fields a curve type does not have are NaN. Circle start/end points are
+      kept in sync with center and radius.
+    - loops (P,): is_outer (-1 if unknown); the curves of loop l are loop_curve_offsets[l]:loop_curve_offsets[l + 1]
+    - extrudes (E,): sketch plane origin (E, 3), plane (E, 3) theta/phi/gamma, y_axis (E, 2) (NaN if unset),
+      sketch_pos (E, 3), sketch_size, extent_one, extent_two, operation, extent_type;
+      the loops of extrude e are ext_loop_offsets[e]:ext_loop_offsets[e + 1]
+    - sequences (S,): bbox (S, 2, 3) (NaN if unknown); the extrudes of sequence s are
+      seq_ext_offsets[s]:seq_ext_offsets[s + 1]
+
+    Curves and loops are stored in children order. sketch_quantized/ext_quantized tell whether the profiles and
+    the extrude parameters currently hold quantized values, as after numericalize.
+    """
+    def __init__(self, curves, loop_curve_offsets, loops, ext_loop_offsets, extrudes, seq_ext_offsets=None,
+                 bbox=None, sketch_quantized=False, ext_quantized=False):
+        for name in CURVE_FIELDS:
+            setattr(self, name, curves[name])
+        for name in LOOP_FIELDS:
+            setattr(self, name, loops[name])
+        for name in EXTRUDE_FIELDS:
+            setattr(self, name, extrudes[name])
+        self.loop_curve_offsets = loop_curve_offsets
+        self.ext_loop_offsets = ext_loop_offsets
+        self.seq_ext_offsets = np.array([0, self.n_extrudes]) if seq_ext_offsets is None else seq_ext_offsets
+        self.bbox = np.full((self.n_sequences, 2, 3), np.nan) if bbox is None else bbox
+        self.sketch_quantized = sketch_quantized
+        self.ext_quantized = ext_quantized
+        self._sync_circles()
+
+    ####################### conversion #######################
+    @staticmethod
+    def from_cad_sequence(cad_seq: CADSequence):
+        curves = {name: [] for name in CURVE_FIELDS}
+        loop_curve_offsets, is_outer, ext_loop_offsets = [0], [], [0]
+        extrudes = {name: [] for name in EXTRUDE_FIELDS}
+        nan2, nan3 = np.full(2, np.nan), np.full(3, np.nan)
+        sketch_quantized = False
+        for ext in cad_seq.seq:
+            for loop in ext.profile.children:
+                for curve in loop.children:
+                    is_arc, is_circle = isinstance(curve, Arc), isinstance(curve, Circle)
+                    curves['curve_type'].append(ARC_IDX if is_arc else CIRCLE_IDX if is_circle else LINE_IDX)
+                    curves['start_point'].append(curve.start_point)
+                    curves['end_point'].append(curve.end_point)
+                    curves['mid_point'].append(curve.mid_point if is_arc else nan2)
+                    curves['center'].append(curve.center if is_arc or is_circle else nan2)
+                    curves['radius'].append(curve.radius if is_arc or is_circle else np.nan)
+                    curves['start_angle'].append(curve.start_angle if is_arc else np.nan)
+                    curves['end_angle'].append(curve.end_angle if is_arc else np.nan)
+                    curves['ref_vec'].append(curve.ref_vec if is_arc else nan2)
+                    normal = getattr(curve, 'normal', None)
+                    curves['normal'].append(nan3 if normal is None else normal)
+                    sketch_quantized |= np.asarray(curve.end_point).dtype.kind in 'iu'
+                loop_curve_offsets.append(loop_curve_offsets[-1] + len(loop.children))
+                is_outer.append(int(getattr(loop, 'is_outer', -1)))
+            ext_loop_offsets.append(ext_loop_offsets[-1] + len(ext.profile.children))
+
+            plane = ext.sketch_plane
+            extrudes['origin'].append(plane.origin)
+            extrudes['plane'].append([plane._theta, plane._phi, plane._gamma])
+            extrudes['y_axis'].append(nan2 if plane._y_axis is None else plane._y_axis)
+            extrudes['sketch_pos'].append(ext.sketch_pos)
+            extrudes['sketch_size'].append(ext.sketch_size)
+            extrudes['extent_one'].append(ext.extent_one)
+            extrudes['extent_two'].append(ext.extent_two)
+            extrudes['operation'].append(ext.operation)
+            extrudes['extent_type'].append(ext.extent_type)
+
+        curve_shapes = {'start_point': 2, 'end_point': 2, 'mid_point': 2, 'center': 2, 'ref_vec': 2, 'normal': 3}
+        curves = {name: np.array(v, dtype=int if name == 'curve_type' else float).reshape(-1, *(
+                  [curve_shapes[name]] if name in curve_shapes else [])) for name, v in curves.items()}
+        ext_shapes = {'origin': 3, 'plane': 3, 'y_axis': 2, 'sketch_pos': 3}
+        extrudes = {name: np.array(v, dtype=int if name in ('operation', 'extent_type') else float).reshape(-1, *(
+                    [ext_shapes[name]] if name in ext_shapes else [])) for name, v in extrudes.items()}
+        ext_quantized = len(cad_seq.seq) > 0 and bool(cad_seq.seq[0].sketch_plane.is_numerical)
+        bbox = None if cad_seq.bbox is None else np.asarray(cad_seq.bbox, dtype=float)[np.newaxis]
+        return CADSequenceArrays(curves, np.array(loop_curve_offsets), {'is_outer': np.array(is_outer, dtype=int)},
+                                 np.array(ext_loop_offsets), extrudes, None, bbox, sketch_quantized, ext_quantized)
+
+    @staticmethod
+    def from_cad_sequences(cad_seqs):
+        return CADSequenceArrays.concatenate([CADSequenceArrays.from_cad_sequence(seq) for seq in cad_seqs])
+
+    @staticmethod
+    def concatenate(all_seqs):
+        """stack several CADSequenceArrays into one"""
+        def stack_offsets(offsets):
+            shifts = np.cumsum([0] + [o[-1] for o in offsets[:-1]])
+            return np.concatenate([[0]] + [o[1:] + shift for o, shift in zip(offsets, shifts)])
+        curves = {name: np.concatenate([getattr(seq, name) for seq in all_seqs]) for name in CURVE_FIELDS}
+        loops = {name: np.concatenate([getattr(seq, name) for seq in all_seqs]) for name in LOOP_FIELDS}
+        extrudes = {name: np.concatenate([getattr(seq, name) for seq in all_seqs]) for name in EXTRUDE_FIELDS}
+        return CADSequenceArrays(curves, stack_offsets([seq.loop_curve_offsets for seq in all_seqs]), loops,
+                                 stack_offsets([seq.ext_loop_offsets for seq in all_seqs]), extrudes,
+                                 stack_offsets([seq.seq_ext_offsets for seq in all_seqs]),
+                                 np.concatenate([seq.bbox for seq in all_seqs]),
+                                 all(seq.sketch_quantized for seq in all_seqs), all(seq.ext_quantized for seq in all_seqs))
+
+    @staticmethod
+    def from_vector(vec, is_numerical=False, n=256):
+        """same as CADSequenceArrays.from_cad_sequence(CADSequence.from_vector(vec, is_numerical, n))"""
+        return CADSequenceArrays.from_vectors(vec[np.newaxis], is_numerical, n)
+
+    @staticmethod
+    def from_vectors(vecs, is_numerical=False, n=256):
+        """all CAD vectors (B, L, 1 + N_ARGS), or a list of (L_i, 1 + N_ARGS), as one CADSequenceArrays"""
+        batch = parse_cad_vectors(vecs, is_numerical, n)
+        if not batch.valid.all():
+            raise ValueError("invalid CAD vectors: {}".format(np.flatnonzero(~batch.valid).tolist()))
+        return CADSequenceArrays.from_vector_batch(batch)
+
+    @staticmethod
+    def from_vector_batch(batch):
+        """CADSequenceArrays of a parsed CADVectorBatch. Sequences that are not batch.valid keep what was parsed."""
+        is_numerical = batch.is_numerical
+        n_curves = len(batch.curve_type)
+        is_arc = batch.is_arc
+        curve_type = np.where((batch.curve_type == ARC_IDX) & ~is_arc, LINE_IDX, batch.curve_type)
+        is_circle = curve_type == CIRCLE_IDX
+
+        center = np.where(is_arc[:, None], batch.center, np.where(is_circle[:, None], batch.end_point, np.nan))
+        radius = np.where(is_arc, batch.radius, np.where(is_circle, batch.curve_args[:, 4], np.nan))
+        end_angle = np.where(is_arc, batch.sweep_angle, np.nan)
+        ref_vec = np.where(is_arc[:, None], batch.ref_vec, np.nan)
+        # Arc.get_mid_point
+        mid_angle = end_angle / 2
+        cos, sin = np.cos(mid_angle), np.sin(mid_angle)
+        mid_vec = np.stack([cos * ref_vec[:, 0] - sin * ref_vec[:, 1], sin * ref_vec[:, 0] + cos * ref_vec[:, 1]], axis=1)
+        curves = {'curve_type': curve_type, 'start_point': batch.start_point.astype(float),
+                  'end_point': batch.end_point.astype(float), 'mid_point': center + mid_vec * radius[:, None],
+                  'center': center, 'radius': radius, 'start_angle': np.where(is_arc, 0.0, np.nan),
+                  'end_angle': end_angle, 'ref_vec': ref_vec, 'normal': np.full((n_curves, 3), np.nan)}
+        extrudes = {'origin': batch.sketch_pos.astype(float), 'plane': batch.sketch_plane.astype(float),
+                    'y_axis': np.full((len(batch.operation), 2), np.nan),
+                    'sketch_pos': batch.sketch_pos.astype(float), 'sketch_size': batch.sketch_size.astype(float),
+                    'extent_one': batch.extent_one.astype(float), 'extent_two': batch.extent_two.astype(float),
+                    'operation': batch.operation, 'extent_type': batch.extent_type}
+        n_loops = len(batch.loop_curve_offsets) - 1
+        seq = CADSequenceArrays(curves, batch.loop_curve_offsets, {'is_outer': np.full(n_loops, -1)},
+                                batch.ext_loop_offsets, extrudes, batch.ext_offsets, sketch_quantized=is_numerical)
+        # Loop and Profile reorder their children on construction
+        seq._reorder_loops(np.arange(n_loops))
+        seq._reorder_profiles(np.arange(seq.n_extrudes))
+        return seq
+
+    def to_cad_sequence(self, i=0):
+        """CADSequence of the i-th sequence"""
+        seq = []
+        for e in range(self.seq_ext_offsets[i], self.seq_ext_offsets[i + 1]):
+            loops = []
+            for l in range(self.ext_loop_offsets[e], self.ext_loop_offsets[e + 1]):
+                loop = Loop([self._to_curve(c) for c in range(self.loop_curve_offsets[l], self.loop_curve_offsets[l + 1])],
+                            reorder=False)
+                if self.is_outer[l] >= 0:
+                    loop.is_outer = bool(self.is_outer[l])
+                loops.append(loop)
+            cast = _as_int_if_integral if self.ext_quantized else np.asarray
+            y_axis = None if np.isnan(self.y_axis[e]).all() else self.y_axis[e].copy()
+            sketch_plane = CoordSystem(cast(self.origin[e].copy()), *cast(self.plane[e]), y_axis=y_axis,
+                                       is_numerical=self.ext_quantized)
+            seq.append(Extrude(Profile(loops, reorder=False), sketch_plane, int(self.operation[e]), int(self.extent_type[e]),
+                               cast(self.extent_one[e])[()], cast(self.extent_two[e])[()], cast(self.sketch_pos[e].copy()),
+                               cast(self.sketch_size[e])[()]))
+        bbox = None if np.isnan(self.bbox[i]).all() else self.bbox[i].copy()
+        return CADSequence(seq, bbox)
+
+    def to_cad_sequences(self):
+        return [self.to_cad_sequence(i) for i in range(self.n_sequences)]
+
+    def _to_curve(self, c):
+        cast = _as_int_if_integral if self.sketch_quantized else np.asarray
+        normal = None if np.isnan(self.normal[c]).all() else self.normal[c].copy()
+        if self.curve_type[c] == CIRCLE_IDX:
+            return Circle(cast(self.center[c].copy()), cast(self.radius[c])[()], normal)
+        if self.curve_type[c] == ARC_IDX:
+            arc = Arc(cast(self.start_point[c].copy()), cast(self.end_point[c].copy()), cast(self.center[c].copy()),
+                      self.radius[c], normal, cast(self.start_angle[c])[()], cast(self.end_angle[c])[()],
+                      self.ref_vec[c].copy())
+            arc.mid_point = cast(self.mid_point[c].copy())
+            return arc
+        return Line(cast(self.start_point[c].copy()), cast(self.end_point[c].copy()))
+
+    @property
+    def n_extrudes(self):
+        return len(self.operation)
+
+    @property
+    def n_sequences(self):
+        return len(self.seq_ext_offsets) - 1
+
+    def _ext_seq(self):
+        """sequence index of every extrude"""
+        return np.repeat(np.arange(self.n_sequences), np.diff(self.seq_ext_offsets))
+
+    ####################### vector #######################
+    def to_vector(self, max_n_ext=10, max_n_loops=6, max_len_loop=15, max_total_len=60, pad=False):
+        """same as CADSequence.to_vector, for a single sequence"""
+        assert self.n_sequences == 1
+        return self.to_vectors(max_n_ext, max_n_loops, max_len_loop, max_total_len, pad)[0]
+
+    def to_vectors(self, max_n_ext=10, max_n_loops=6, max_len_loop=15, max_total_len=60, pad=False):
+        """CAD vector of every sequence, None for those exceeding the limits (see CADSequence.to_vector)"""
+        n_loops = np.diff(self.ext_loop_offsets)
+        n_curves = np.diff(self.loop_curve_offsets)
+        ext_seq = self._ext_seq()
+        loop_ext = np.repeat(np.arange(self.n_extrudes), n_loops)
+        curve_loop = np.repeat(np.arange(len(n_curves)), n_curves)
+
+        too_long = np.diff(self.seq_ext_offsets) > max_n_ext
+        np.logical_or.at(too_long, ext_seq, n_loops > max_n_loops)
+        np.logical_or.at(too_long, ext_seq[loop_ext], n_curves + 1 > max_len_loop)
+
+        # row index of every curve, SOL, Ext and final EOS, with all sequences one after another
+        loop_seq = ext_seq[loop_ext]
+        seq_rows = np.bincount(ext_seq, weights=n_loops + 1, minlength=self.n_sequences) + \
+                   np.bincount(loop_seq, weights=n_curves, minlength=self.n_sequences) + 1
+        seq_row_offsets = np.concatenate([[0], np.cumsum(seq_rows)]).astype(int)
+        curve_rows = np.arange(len(curve_loop)) + curve_loop + 1 + loop_ext[curve_loop] + loop_seq[curve_loop]
+        sol_rows = self.loop_curve_offsets[:-1] + np.arange(len(n_curves)) + loop_ext + loop_seq
+        ext_end = self.ext_loop_offsets[1:]
+        ext_rows = self.loop_curve_offsets[ext_end] + ext_end + np.arange(self.n_extrudes) + ext_seq
+
+        vec = np.tile(EOS_VEC.astype(float), (seq_row_offsets[-1], 1))
+        vec[sol_rows] = SOL_VEC
+
+        curve_vec = np.full((len(curve_loop), 1 + N_ARGS), PAD_VAL, dtype=float)
+        curve_type = self.curve_type
+        is_arc, is_circle = curve_type == ARC_IDX, curve_type == CIRCLE_IDX
+        curve_vec[:, 0] = curve_type
+        curve_vec[:, 1:3] = np.where(is_circle[:, None], self.center, self.end_point)
+        s2e, s2m = self.end_point - self.start_point, self.mid_point - self.start_point
+        clock_sign = (s2m[:, 0] * s2e[:, 1] - s2m[:, 1] * s2e[:, 0]) >= 0
+        curve_vec[is_arc, 3] = np.maximum(np.abs(self.start_angle - self.end_angle), 1)[is_arc]
+        curve_vec[is_arc, 4] = clock_sign[is_arc]
+        curve_vec[is_circle, 5] = self.radius[is_circle]
+        vec[curve_rows] = curve_vec
+
+        ext_vec = np.full((self.n_extrudes, 1 + N_ARGS), PAD_VAL, dtype=float)
+        ext_vec[:, 0] = EXT_IDX
+        ext_vec[:, -N_ARGS_EXT:] = np.concatenate([
+            self.plane, self.sketch_pos, self.sketch_size[:, None], self.extent_one[:, None],
+            self.extent_two[:, None], self.operation[:, None], self.extent_type[:, None]], axis=1)
+        vec[ext_rows] = ext_vec
+        if self.sketch_quantized and self.ext_quantized:
+            vec = vec.astype(int)
+
+        all_vecs = []
+        for i in range(self.n_sequences):
+            if too_long[i]:
+                all_vecs.append(None)
+                continue
+            seq_vec = vec[seq_row_offsets[i]:seq_row_offsets[i + 1]]
+            if pad and len(seq_vec) < max_total_len:
+                seq_vec = np.concatenate([seq_vec, EOS_ROW.repeat(max_total_len - len(seq_vec), axis=0)])
+            all_vecs.append(seq_vec)
+        return all_vecs
+
+    ####################### extrude-level transforms #######################
+    def transform(self, translation, scale):
+        """CADSequence.transform; translation and scale may also be given per extrude, (E, 3) and (E,)"""
+        scale = np.asarray(scale, dtype=float)
+        scale_3d = scale[:, None] if scale.ndim == 1 else scale
+        self.origin = (self.origin + translation) * scale_3d
+        self.extent_one = self.extent_one * scale
+        self.extent_two = self.extent_two * scale
+        self.sketch_pos = (self.sketch_pos + translation) * scale_3d
+        self.sketch_size = self.sketch_size * scale
+
+    def normalize(self, size=1.0):
+        """(1)normalize every shape into unit cube (-1~1). """
+        scale = size * NORM_FACTOR / np.max(np.abs(self.bbox), axis=(1, 2))
+        self.transform(0.0, scale[self._ext_seq()])
+
+    def numericalize(self, n=256):
+        """quantize curves and extrude parameters, CADSequence.numericalize"""
+        assert np.all(np.abs(self.extent_one) <= 2.0) and np.all(np.abs(self.extent_two) <= 2.0)
+
+        def quantize(x, lo=0):
+            return x.round().clip(min=lo, max=n - 1)
+        for name in ('start_point', 'end_point', 'mid_point', 'center'):
+            setattr(self, name, quantize(getattr(self, name)))
+        is_arc = self.curve_type == ARC_IDX
+        for name in ('start_angle', 'end_angle'):
+            setattr(self, name, np.where(is_arc, quantize(getattr(self, name) / (2 * np.pi) * n), np.nan))
+        self.radius = np.where(self.curve_type == CIRCLE_IDX, quantize(self.radius, lo=1), self.radius)
+        self._sync_circles()
+
+        self.origin = quantize((self.origin + 1.0) / 2 * n)
+        self.plane = quantize((self.plane / np.pi + 1.0) / 2 * n)
+        self.extent_one = quantize((self.extent_one + 1.0) / 2 * n)
+        self.extent_two = quantize((self.extent_two + 1.0) / 2 * n)
+        self.sketch_pos = quantize((self.sketch_pos + 1.0) / 2 * n)
+        self.sketch_size = quantize(self.sketch_size / 2 * n)
+        self.sketch_quantized = self.ext_quantized = True
+
+    def denumericalize(self, n=256):
+        """de-quantize the extrude parameters, Extrude.denumericalize (sketches stay in the normalized space)"""
+        self.origin = self.origin / n * 2 - 1.0
+        self.plane = (self.plane / n * 2 - 1.0) * np.pi
+        self.extent_one = self.extent_one / n * 2 - 1.0
+        self.extent_two = self.extent_two / n * 2 - 1.0
+        self.sketch_pos = self.sketch_pos / n * 2 - 1.0
+        self.sketch_size = self.sketch_size / n * 2
+        self.ext_quantized = False
+
+    ####################### sketch-level transforms #######################
+    def _curve_ext(self):
+        """extrude index of every curve"""
+        loop_ext = np.repeat(np.arange(self.n_extrudes), np.diff(self.ext_loop_offsets))
+        return np.repeat(loop_ext, np.diff(self.loop_curve_offsets))
+
+    def transform_sketch(self, translate, scale, exts=None):
+        """Profile.transform of the given extrudes (all by default), translate (E, 2) and scale (E,) per extrude"""
+        curve_ext = self._curve_ext()
+        sel = np.arange(len(curve_ext)) if exts is None else np.flatnonzero(np.isin(curve_ext, exts))
+        ext_idx = np.arange(self.n_extrudes) if exts is None else np.asarray(exts)
+        translate = np.broadcast_to(translate, (len(ext_idx), 2))
+        scale = np.broadcast_to(scale, (len(ext_idx),))
+        lookup = np.zeros(self.n_extrudes, dtype=int)
+        lookup[ext_idx] = np.arange(len(ext_idx))
+        self._transform_curves(sel, translate[lookup[curve_ext[sel]]], scale[lookup[curve_ext[sel]]])
+
+    def _transform_curves(self, sel, translate, scale):
+        """curve.transform(translate, scale) of the curves sel, with a scalar scale per curve"""
+        for name in ('start_point', 'end_point', 'mid_point', 'center'):
+            points = getattr(self, name)
+            points[sel] = (points[sel] + translate) * scale[:, None]
+        radius = self.radius[sel] * scale
+        self.radius[sel] = np.where(self.curve_type[sel] == ARC_IDX, np.abs(radius), radius)
+        self._sync_circles()
+
+    def normalize_sketch(self, size=256, exts=None):
+        """Profile.normalize of the given extrudes (all by default)"""
+        exts = np.arange(self.n_extrudes) if exts is None else np.asarray(exts)
+        exts = exts[np.diff(self.ext_loop_offsets)[exts] > 0]
+        bbox_min, bbox_max = self._profile_bbox(exts)
+        start_point = self.start_point[self.loop_curve_offsets[self.ext_loop_offsets[exts]]]
+        bbox_size = np.max(np.abs(np.concatenate([bbox_max - start_point, bbox_min - start_point], axis=1)), axis=1)
+        scale = (size / 2 * NORM_FACTOR - 1) / bbox_size
+        self.transform_sketch(-start_point, scale, exts)
+        self.transform_sketch(np.array((size / 2, size / 2)), 1, exts)
+
+    def flip_sketch(self, axis, exts=None):
+        """Extrude.flip_sketch of the given extrudes (all by default); axis is 'x', 'y', 'xy' or one of them per extrude"""
+        exts = np.arange(self.n_extrudes) if exts is None else np.asarray(exts)
+        axis = np.broadcast_to([FLIP_AXES.index(a) for a in np.atleast_1d(axis)], (len(exts),))
+        ext_axis = np.full(self.n_extrudes, -1)
+        ext_axis[exts] = axis
+        curve_axis = ext_axis[self._curve_ext()]
+        sel = np.flatnonzero(curve_axis >= 0)
+        self._flip_curves(sel, curve_axis[sel])
+
+        loop_ext = np.repeat(np.arange(self.n_extrudes), np.diff(self.ext_loop_offsets))
+        self._reorder_loops(np.flatnonzero(np.isin(loop_ext, exts)))
+        self._reorder_profiles(exts)
+        self.normalize_sketch(exts=exts)
+
+    def _flip_curves(self, sel, axis):
+        """curve.flip of the curves sel, axis index into FLIP_AXES per curve"""
+        sign = FLIP_SIGNS[axis]
+        for name in ('start_point', 'end_point', 'mid_point', 'center'):
+            points = getattr(self, name)
+            points[sel] = points[sel] * sign
+        is_arc = self.curve_type[sel] == ARC_IDX
+        arcs, arc_axis = sel[is_arc], axis[is_arc]
+        self.radius[arcs[arc_axis == 2]] = np.abs(self.radius[arcs[arc_axis == 2]])
+        angle = _angle_from_vector_to_x(self.ref_vec[arcs]) + self.end_angle[arcs] - self.start_angle[arcs]
+        ref_vec = np.stack([np.cos(angle), np.sin(angle)], axis=1) * FLIP_SIGNS[arc_axis]
+        self.ref_vec[arcs] = np.where((arc_axis == 2)[:, None], -self.ref_vec[arcs], ref_vec)
+        self._sync_circles()
+
+    def random_transform(self):
+        """CADSequence.random_transform, with all random parameters drawn at once"""
+        n_ext = self.n_extrudes
+        scale = np.random.uniform(0.8, 1.2, n_ext)
+        self.transform_sketch(-np.array([128, 128]), scale)
+        translate = np.random.randint(-5, 6, (n_ext, 2)) + 128
+        self.transform_sketch(translate, 1)
+
+        t = 0.05
+        translate = np.random.uniform(-t, t, (n_ext, 3))
+        scale = np.random.uniform(0.8, 1.2, (n_ext, 1))
+        self.sketch_pos = (self.sketch_pos + translate) * scale
+        self.extent_one = self.extent_one * np.random.uniform(0.8, 1.2, n_ext)
+        self.extent_two = self.extent_two * np.random.uniform(0.8, 1.2, n_ext)
+        self.sketch_quantized = False
+
+    def random_flip_sketch(self):
+        flip_idx = np.random.randint(0, 4, self.n_extrudes)
+        exts = np.flatnonzero(flip_idx > 0)
+        if len(exts) > 0:
+            self.flip_sketch([FLIP_AXES[i - 1] for i in flip_idx[exts]], exts)
+            self.sketch_quantized = False
+
+    ####################### geometry helpers #######################
+    def _sync_circles(self):
+        """circle start/end points are defined by center and radius, see Circle"""
+        is_circle = self.curve_type == CIRCLE_IDX
+        offset = np.stack([self.radius[is_circle], np.zeros(is_circle.sum())], axis=1)
+        self.start_point[is_circle] = self.center[is_circle] - offset
+        self.end_point[is_circle] = self.center[is_circle] + offset
+
+    def _reverse_curves(self, curves):
+        curves = curves[self.curve_type[curves] != CIRCLE_IDX]
+        self.start_point[curves], self.end_point[curves] = self.end_point[curves], self.start_point[curves]
+
+    def _curve_bbox(self):
+        """bounding box min/max (C, 2) of every curve, as curve.bbox"""
+        bbox_min = np.minimum(self.start_point, self.end_point)
+        bbox_max = np.maximum(self.start_point, self.end_point)
+        is_circle = self.curve_type == CIRCLE_IDX
+        bbox_min[is_circle] = self.center[is_circle] - self.radius[is_circle, None]
+        bbox_max[is_circle] = self.center[is_circle] + self.radius[is_circle, None]
+
+        arcs = np.flatnonzero(self.curve_type == ARC_IDX)
+        center, radius = self.center[arcs], self.radius[arcs]
+        angle_s, angle_e = self._arc_angles_counterclockwise(arcs)
+        pi = np.pi
+        extremes = [(np.array([1, 0]), [0]), (np.array([0, 1]), [pi / 2, -pi / 2 * 3]),
+                    (np.array([-1, 0]), [pi, -pi]), (np.array([0, -1]), [pi / 2 * 3, -pi / 2])]
+        for direction, angles in extremes:
+            inside = np.zeros(len(arcs), dtype=bool)
+            for angle in angles:
+                inside |= (angle_s < angle) & (angle < angle_e)
+            point = center + direction * radius[:, None]
+            bbox_min[arcs[inside]] = np.minimum(bbox_min[arcs[inside]], point[inside])
+            bbox_max[arcs[inside]] = np.maximum(bbox_max[arcs[inside]], point[inside])
+        return bbox_min, bbox_max
+
+    def _arc_angles_counterclockwise(self, arcs, eps=1e-8):
+        """Arc.get_angles_counterclockwise of the given arcs"""
+        center = self.center[arcs]
+
+        def angle_of(points):
+            vec = points - center
+            return _angle_from_vector_to_x(vec / (np.linalg.norm(vec, axis=1, keepdims=True) + eps))
+        angle_s, angle_m, angle_e = angle_of(self.start_point[arcs]), angle_of(self.mid_point[arcs]), \
+                                    angle_of(self.end_point[arcs])
+        angle_s, angle_e = np.minimum(angle_s, angle_e), np.maximum(angle_s, angle_e)
+        wrap = ~((angle_s < angle_m) & (angle_m < angle_e))
+        return np.where(wrap, angle_e - np.pi * 2, angle_s), np.where(wrap, angle_s, angle_e)
+
+    def _loop_bbox(self):
+        curve_min, curve_max = self._curve_bbox()
+        starts = self.loop_curve_offsets[:-1]
+        if len(starts) == 0:
+            return np.zeros((0, 2)), np.zeros((0, 2))
+        return np.minimum.reduceat(curve_min, starts, axis=0), np.maximum.reduceat(curve_max, starts, axis=0)
+
+    def _profile_bbox(self, exts):
+        """bounding box min/max of the profiles of the given (non-empty) extrudes"""
+        loop_min, loop_max = self._loop_bbox()
+        if len(exts) == 0:
+            return np.zeros((0, 2)), np.zeros((0, 2))
+        starts, ends = self.ext_loop_offsets[exts], self.ext_loop_offsets[exts + 1]
+        bbox_min = np.stack([loop_min[s:e].min(axis=0) for s, e in zip(starts, ends)])
+        bbox_max = np.stack([loop_max[s:e].max(axis=0) for s, e in zip(starts, ends)])
+        return bbox_min, bbox_max
+
+    def _permute_curves(self, perm):
+        for name in CURVE_FIELDS:
+            setattr(self, name, getattr(self, name)[perm])
+
+    def _reorder_loops(self, loops):
+        """Loop.reorder of the given loops: start from the left-most point and go mostly counter-clockwise.
+        The sequential steps of Loop.reorder run over curve positions, for all loops at once."""
+        n_curves = np.diff(self.loop_curve_offsets)
+        loops = np.asarray(loops, dtype=int)
+        loops = loops[n_curves[loops] > 1]
+        if len(loops) == 0:
+            return
+        counts = n_curves[loops]
+        positions = np.arange(counts.max())
+        valid = positions < counts[:, None]
+        children = np.where(valid, self.loop_curve_offsets[loops][:, None] + positions, 0)
+
+        # correct start-end point order
+        first, second = children[:, 0], children[:, 1]
+        flip = _allclose_rows(self.start_point[first], self.start_point[second]) | \
+               _allclose_rows(self.start_point[first], self.end_point[second])
+        self._reverse_curves(first[flip])
+        for i in range(children.shape[1] - 1):
+            active = valid[:, i + 1]
+            cur, nxt = children[active, i], children[active, i + 1]
+            self._reverse_curves(nxt[_allclose_rows(self.end_point[cur], self.end_point[nxt])])
+
+        # start from the left-most start point (lowest y on ties, first one on full ties)
+        start = np.round(self.start_point[children], 6)
+        sx = np.where(valid, start[..., 0], np.inf)
+        candidate = sx == sx.min(axis=1, keepdims=True)
+        sy = np.where(candidate, start[..., 1], np.inf)
+        candidate &= sy == sy.min(axis=1, keepdims=True)
+        start_idx = np.argmax(candidate, axis=1)
+        rotated = (start_idx[:, None] + positions) % counts[:, None]
+        children = np.take_along_axis(children, rotated, axis=1)
+
+        # ensure mostly counter-clockwise, unless the first or last curve is a circle
+        first, last = children[:, 0], children[np.arange(len(loops)), counts - 1]
+        is_line_first, is_line_last = self.curve_type[first] == LINE_IDX, self.curve_type[last] == LINE_IDX
+        start_vec = np.where(is_line_first[:, None], self.end_point[first], self.mid_point[first]) - \
+                    self.start_point[first]
+        end_vec = self.end_point[last] - np.where(is_line_last[:, None], self.start_point[last], self.mid_point[last])
+        cross = end_vec[:, 0] * start_vec[:, 1] - end_vec[:, 1] * start_vec[:, 0]
+        has_circle = (self.curve_type[first] == CIRCLE_IDX) | (self.curve_type[last] == CIRCLE_IDX)
+        backwards = ~has_circle & (cross <= 0)
+        self._reverse_curves(children[backwards][valid[backwards]])
+        reversed_positions = np.where(valid, counts[:, None] - 1 - positions, positions)
+        children[backwards] = np.take_along_axis(children[backwards], reversed_positions[backwards], axis=1)
+
+        perm = np.arange(len(self.curve_type))
+        perm[(self.loop_curve_offsets[loops][:, None] + positions)[valid]] = children[valid]
+        self._permute_curves(perm)
+
+    def _reorder_profiles(self, exts):
+        """Profile.reorder of the given extrudes: sort loops by the min corner of their bounding box"""
+        exts = np.asarray(exts, dtype=int)
+        n_loops = np.diff(self.ext_loop_offsets)
+        loop_ext = np.repeat(np.arange(self.n_extrudes), n_loops)
+        selected = np.isin(loop_ext, exts[n_loops[exts] > 1])
+        if not selected.any():
+            return
+        loop_min = np.round(self._loop_bbox()[0], 6)
+        key_x = np.where(selected, loop_min[:, 0], np.arange(len(loop_ext)))
+        key_y = np.where(selected, loop_min[:, 1], 0)
+        order = np.lexsort((key_y, key_x, loop_ext))
+
+        n_curves = np.diff(self.loop_curve_offsets)[order]
+        new_offsets = np.concatenate([[0], np.cumsum(n_curves)])
+        perm = np.repeat(self.loop_curve_offsets[order] - new_offsets[:-1], n_curves) + np.arange(new_offsets[-1])
+        self._permute_curves(perm)
+        self.loop_curve_offsets = new_offsets
+        for name in LOOP_FIELDS:
+            setattr(self, name, getattr(self, name)[order])
@@ -0,0 +1,213 @@
+"""Bounded LRU caches of OpenCASCADE shapes: ExtrudeCache holds the solids built by create_by_extrude, so that an
+extrude repeated across decoding candidates, augmentations or parts of a dataset is built only once;
+BodyPrefixCache holds the intermediate bodies of create_CAD in a trie, so that candidates sharing their first
+extrudes only evaluate the boolean operations after the shared prefix."""
+import threading
+from collections import OrderedDict
+import numpy as np
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE, TopAbs_VERTEX
+from .extrude import Extrude
+from .macro import EXTRUDE_OPERATIONS
+from .curves import Line, Arc, Circle
+
+KEY_RESOLUTION = 1e-6 # parameters closer than this share a cache entry
+# rough memory of one B-rep entity (TShape, geometry and pcurves), to estimate the bytes held
+FACE_BYTES, EDGE_BYTES, VERTEX_BYTES = 1500, 800, 150
+
+
+def extrude_key(extrude_op: Extrude, *extra):
+    """hashable key of everything create_by_extrude depends on: sketch plane (normal, x and y axes, as a mirrored
+    plane has the same normal and x axis but the opposite y axis), sketch size, extents, extent type
+    and every profile curve as create_edge_3d sees it (line end points, arc start/mid/end, circle center/radius).
+    The boolean operation is not part of it, the primitive is the same for all operations."""
+    plane = extrude_op.sketch_plane
+    values = [plane.normal, plane.x_axis, plane.y_axis, extrude_op.sketch_pos,
+              [extrude_op.sketch_size, extrude_op.extent_one, extrude_op.extent_two, extrude_op.extent_type], extra]
+    for loop in extrude_op.profile.children:
+        values.append([-1]) # loop separator
+        for curve in loop.children:
+            if isinstance(curve, Circle):
+                values.append([0, *curve.center, curve.radius])
+            elif isinstance(curve, Arc):
+                values.append([1, *curve.start_point, *curve.mid_point, *curve.end_point])
+            elif isinstance(curve, Line):
+                values.append([2, *curve.start_point, *curve.end_point])
+            else:
+                raise NotImplementedError(type(curve))
+    flat = np.concatenate([np.asarray(v, dtype=np.float64).reshape(-1) for v in values])
+    return np.round(flat / KEY_RESOLUTION).astype(np.int64).tobytes()
+
+
+def estimate_shape_bytes(shape):
+    """approximate memory of a shape from its number of faces, edges and vertices"""
+    total = 0
+    for shape_type, n_bytes in ((TopAbs_FACE, FACE_BYTES), (TopAbs_EDGE, EDGE_BYTES), (TopAbs_VERTEX, VERTEX_BYTES)):
+        explorer = TopExp_Explorer(shape, shape_type)
+        while explorer.More():
+            total += n_bytes
+            explorer.Next()
+    return total
+
+
+class ExtrudeCache(object):
+    """LRU cache from extrude_key to the TopoDS_Shape built for it, bounded by both the number of entries and
+    the estimated bytes held. Thread-safe; a shape is built outside the lock, so two threads missing the same
+    key may both build it. Cached shapes are shared between callers: treat them as read-only (boolean_op runs
+    non-destructively, so using them as boolean arguments is fine)."""
+    def __init__(self, max_items=4096, max_bytes=256 * 2 ** 20):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._shapes = OrderedDict() # key -> (shape, n_bytes)
+        self._lock = threading.Lock()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def get_or_build(self, extrude_op: Extrude, build, *extra):
+        """the cached shape of extrude_op, or build() stored under its key; extra values (e.g. build options)
+        are added to the key"""
+        key = extrude_key(extrude_op, *extra)
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is not None:
+                self._shapes.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        shape = build()
+        self._put(key, shape, estimate_shape_bytes(shape))
+        return shape
+
+    def _put(self, key, shape, n_bytes):
+        with self._lock:
+            if key in self._shapes:
+                return
+            self._shapes[key] = (shape, n_bytes)
+            self.n_bytes += n_bytes
+            while len(self._shapes) > 0 and (len(self._shapes) > self.max_items or self.n_bytes > self.max_bytes):
+                _, (_, evicted_bytes) = self._shapes.popitem(last=False)
+                self.n_bytes -= evicted_bytes
+
+    def clear(self):
+        with self._lock:
+            self._shapes.clear()
+            self.n_bytes = 0
+
+    @property
+    def hit_rate(self):
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups > 0 else 0.0
+
+    def stats(self):
+        return {'items': len(self._shapes), 'bytes': self.n_bytes, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate}
+
+
+def prefix_keys(extrudes, *extra):
+    """trie keys of a sequence of extrudes: extrude_key and boolean operation of each one. The operation of the
+    first extrude is ignored by create_CAD and new body is applied as join, the keys do the same."""
+    keys = []
+    for i, extrude_op in enumerate(extrudes):
+        operation = extrude_op.operation
+        if i == 0:
+            operation = -1
+        elif operation == EXTRUDE_OPERATIONS.index("NewBodyFeatureOperation"):
+            operation = EXTRUDE_OPERATIONS.index("JoinFeatureOperation")
+        keys.append((extrude_key(extrude_op, *extra), int(operation)))
+    return keys
+
+
+class _PrefixNode(object):
+    __slots__ = ('parent', 'key', 'children', 'body', 'n_bytes')
+
+    def __init__(self, parent, key):
+        self.parent = parent
+        self.key = key
+        self.children = {}
+        self.body = None
+        self.n_bytes = 0
+
+
+class BodyPrefixCache(object):
+    """trie of the bodies create_CAD builds, keyed by the prefix_keys of the extrudes applied so far.
+    A node holds the body after the extrudes on its path (only where create_CAD had one, i.e. after each group
+    of boolean operations). Bodies are evicted least recently used first once more than max_bodies are held or
+    their estimated size exceeds max_bytes; nodes left without a body or children are pruned.
+    Thread-safe; bodies are shared between callers and must be treated as read-only, as for ExtrudeCache."""
+    def __init__(self, max_bodies=1024, max_bytes=256 * 2 ** 20):
+        self.max_bodies = max_bodies
+        self.max_bytes = max_bytes
+        self._root = _PrefixNode(None, None)
+        self._lru = OrderedDict() # id(node) -> node, nodes holding a body
+        self._lock = threading.Lock()
+        self.n_bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.extrudes_reused = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    def longest_prefix(self, keys):
+        """(depth, body) of the longest prefix of keys with a cached body, (0, None) if there is none"""
+        with self._lock:
+            self.lookups += 1
+            node, depth, found = self._root, 0, None
+            for key in keys:
+                node = node.children.get(key)
+                if node is None:
+                    break
+                depth += 1
+                if node.body is not None:
+                    found = (depth, node)
+            if found is None:
+                return 0, None
+            depth, node = found
+            self._lru.move_to_end(id(node))
+            self.hits += 1
+            self.extrudes_reused += depth
+            return depth, node.body
+
+    def put(self, keys, body):
+        """store the body built from the extrudes of keys"""
+        n_bytes = estimate_shape_bytes(body)
+        with self._lock:
+            node = self._root
+            for key in keys:
+                child = node.children.get(key)
+                if child is None:
+                    child = node.children[key] = _PrefixNode(node, key)
+                node = child
+            if node.body is None:
+                node.body, node.n_bytes = body, n_bytes
+                self.n_bytes += n_bytes
+            self._lru[id(node)] = node
+            self._lru.move_to_end(id(node))
+            while len(self._lru) > 0 and (len(self._lru) > self.max_bodies or self.n_bytes > self.max_bytes):
+                _, evicted = self._lru.popitem(last=False)
+                self._drop(evicted)
+
+    def _drop(self, node):
+        self.n_bytes -= node.n_bytes
+        node.body, node.n_bytes = None, 0
+        while node.parent is not None and node.body is None and len(node.children) == 0:
+            del node.parent.children[node.key]
+            node = node.parent
+
+    def clear(self):
+        with self._lock:
+            self._root = _PrefixNode(None, None)
+            self._lru.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        return {'bodies': len(self._lru), 'bytes': self.n_bytes, 'lookups': self.lookups, 'hits': self.hits,
+                'extrudes_reused': self.extrudes_reused}
+
+
+# shared by all callers of one process
+extrude_cache = ExtrudeCache()
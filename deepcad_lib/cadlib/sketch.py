@@ -5,10 +5,15 @@ import matplotlib.pyplot as plt
 from .curves import *
 from .macro import *
 
+SOL_ROW = SOL_VEC[np.newaxis]
+EOS_ROW = EOS_VEC[np.newaxis]
+
 
 ##########################   base  ###########################
 class SketchBase(object):
     """Base class for sketch (a collection of curves). """
+    __slots__ = ('children',)
+
     def __init__(self, children, reorder=True):
         self.children = children
 
@@ -117,6 +122,8 @@ class SketchBase(object):
 ####################### loop & profile #######################
 class Loop(SketchBase):
     """Sketch loop, a sequence of connected curves."""
+    __slots__ = ('is_outer',)
+
     @staticmethod
     def from_dict(stat):
         all_curves = [construct_curve_from_dict(item) for item in stat['profile_curves']]
@@ -130,14 +137,10 @@ class Loop(SketchBase):
     @staticmethod
     def from_vector(vec, start_point=None, is_numerical=True):
         all_curves = []
-        if start_point is None:
-            # FIXME: explicit for loop can be avoided here
-            for i in range(vec.shape[0]):
-                if vec[i][0] == EOS_IDX:
-                    start_point = vec[i - 1][1:3]
-                    break
-        for i in range(vec.shape[0]):
-            type = vec[i][0]
+        commands = vec[:, 0].tolist()
+        if start_point is None and EOS_IDX in commands:
+            start_point = vec[commands.index(EOS_IDX) - 1][1:3]
+        for i, type in enumerate(commands):
             if type == SOL_IDX:
                 continue
             elif type == EOS_IDX:
@@ -185,16 +188,16 @@ class Loop(SketchBase):
     def to_vector(self, max_len=None, add_sol=True, add_eos=True):
         loop_vec = np.stack([curve.to_vector() for curve in self.children], axis=0)
         if add_sol:
-            loop_vec = np.concatenate([SOL_VEC[np.newaxis], loop_vec], axis=0)
+            loop_vec = np.concatenate([SOL_ROW, loop_vec], axis=0)
         if add_eos:
-            loop_vec = np.concatenate([loop_vec, EOS_VEC[np.newaxis]], axis=0)
+            loop_vec = np.concatenate([loop_vec, EOS_ROW], axis=0)
         if max_len is None:
             return loop_vec
 
         if loop_vec.shape[0] > max_len:
             return None
         elif loop_vec.shape[0] < max_len:
-            pad_vec = np.tile(EOS_VEC, max_len - loop_vec.shape[0]).reshape((-1, len(EOS_VEC)))
+            pad_vec = EOS_ROW.repeat(max_len - loop_vec.shape[0], axis=0)
             loop_vec = np.concatenate([loop_vec, pad_vec], axis=0) # (max_len, 1 + N_ARGS)
         return loop_vec
 
@@ -211,6 +214,8 @@ class Loop(SketchBase):
 class Profile(SketchBase):
     """Sketch profile，a closed region formed by one or more loops. 
     The outer-most loop is placed at first."""
+    __slots__ = ()
+
     @staticmethod
     def from_dict(stat):
         all_loops = [Loop.from_dict(item) for item in stat['loops']]
@@ -227,7 +232,7 @@ class Profile(SketchBase):
         indices = np.where(command[:end_idx] == SOL_IDX)[0].tolist() + [end_idx]
         for i in range(len(indices) - 1):
             loop_vec = vec[indices[i]:indices[i + 1]]
-            loop_vec = np.concatenate([loop_vec, EOS_VEC[np.newaxis]], axis=0)
+            loop_vec = np.concatenate([loop_vec, EOS_ROW], axis=0)
             if loop_vec[0][0] == SOL_IDX and loop_vec[1][0] not in [SOL_IDX, EOS_IDX]:
                 all_loops.append(Loop.from_vector(loop_vec, is_numerical=is_numerical))
         return Profile(all_loops)
@@ -252,10 +257,10 @@ class Profile(SketchBase):
             if max_len_loop is not None and vec.shape[0] > max_len_loop:
                 return None
         profile_vec = np.concatenate(loop_vecs, axis=0)
-        profile_vec = np.concatenate([profile_vec, EOS_VEC[np.newaxis]], axis=0)
+        profile_vec = np.concatenate([profile_vec, EOS_ROW], axis=0)
         if pad:
             pad_len = max_n_loops * max_len_loop - profile_vec.shape[0]
-            profile_vec = np.concatenate([profile_vec, EOS_VEC[np.newaxis].repeat(pad_len, axis=0)], axis=0)
+            profile_vec = np.concatenate([profile_vec, EOS_ROW.repeat(pad_len, axis=0)], axis=0)
         return profile_vec
 
     def sample_points(self, n=32):
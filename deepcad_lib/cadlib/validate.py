@@ -0,0 +1,179 @@
+"""Cheap numeric checks of CAD vectors and sequences before handing them to OpenCASCADE.
+Catches the configurations that make create_CAD fail or build an invalid solid (bad command grammar,
+open or degenerate loops, collinear arcs, zero radius, zero extent, ...) from array operations alone,
+so that doomed samples can be skipped without paying for a B-rep build."""
+from collections import namedtuple
+import numpy as np
+from .extrude import CADSequence
+from .macro import *
+from .vector_batch import parse_cad_vectors, stack_cad_vectors
+from .sequence_arrays import CADSequenceArrays, _allclose_rows
+
+Issue = namedtuple('Issue', ['reason', 'extrude', 'loop', 'curve', 'fatal'])
+Issue.__doc__ = """a problem found in a CAD sequence; extrude/loop/curve index its location (in children order)
+or are -1 where they do not apply. Fatal issues make create_CAD raise or return an invalid shape."""
+
+FATAL_REASONS = ('no_extrude', 'missing_sol', 'bad_command', 'empty_profile', 'empty_loop', 'open_loop',
+                 'degenerate_loop', 'circle_in_loop', 'collinear_arc', 'zero_radius', 'zero_sketch_size',
+                 'zero_extent', 'non_finite')
+WARNING_REASONS = ('zero_length_line', 'trailing_commands', 'truncated_profile', 'bad_operation')
+
+LENGTH_TOL = 1e-7 # Precision::Confusion
+AREA_TOL = 1e-6 # loop area relative to its squared bounding box span
+COLLINEAR_TOL = 1e-9 # arc mid point offset from the chord, relative to the squared chord length
+
+
+def validate_vectors(vecs, is_numerical=True, n=256):
+    """check CAD vectors (B, L, 1 + N_ARGS), or a list of (L_i, 1 + N_ARGS), in one pass.
+    Returns one list of Issue per vector."""
+    if not isinstance(vecs, np.ndarray) or vecs.ndim != 3:
+        vecs = stack_cad_vectors(vecs)
+    batch = parse_cad_vectors(vecs, is_numerical, n)
+    issues = _check_grammar(vecs[..., 0], batch)
+    geometry = _check_arrays(CADSequenceArrays.from_vector_batch(batch))
+    return [grammar + geo for grammar, geo in zip(issues, geometry)]
+
+
+def validate_vector(vec, is_numerical=True, n=256):
+    """list of Issue of a single CAD vector (L, 1 + N_ARGS)"""
+    return validate_vectors(vec[None], is_numerical, n)[0]
+
+
+def validate_cad_sequence(cad_seq: CADSequence, n=256):
+    """list of Issue of a CADSequence (sketches in the normalized space, as from from_vector or from_dict)"""
+    arrays = CADSequenceArrays.from_cad_sequence(cad_seq)
+    if arrays.ext_quantized:
+        arrays.denumericalize(n)
+    return _check_arrays(arrays)[0]
+
+
+def is_valid(issues):
+    """True if no issue is fatal"""
+    return not any(issue.fatal for issue in issues)
+
+
+def format_issues(issues):
+    """short readable summary, e.g. 'zero_extent (extrude 1), collinear_arc (extrude 0, loop 1, curve 2)'"""
+    texts = []
+    for issue in issues:
+        where = ["{} {}".format(name, index) for name, index in
+                 zip(('extrude', 'loop', 'curve'), (issue.extrude, issue.loop, issue.curve)) if index >= 0]
+        texts.append("{} ({})".format(issue.reason, ", ".join(where)) if where else issue.reason)
+    return ", ".join(texts)
+
+
+def _issue(reason, extrude=-1, loop=-1, curve=-1):
+    return Issue(reason, int(extrude), int(loop), int(curve), reason in FATAL_REASONS)
+
+
+def _check_grammar(commands, batch):
+    """issues of the command sequences (B, L): extrudes must start with SOL and hold only SOL and curves
+    up to their first EOS; commands after the last Ext are ignored by from_vector"""
+    is_ext = commands == EXT_IDX
+    is_eos = commands == EOS_IDX
+    # index of the extrude each row belongs to, within its sequence
+    row_ext = np.cumsum(is_ext, axis=1) - is_ext
+    truncated = batch.in_extrude & ~batch.in_profile & ~is_ext & ~is_eos
+    trailing = ~batch.in_extrude & ~is_eos
+
+    issues = [[] for _ in range(len(commands))]
+    for reason, mask in (('missing_sol', batch.bad_start), ('bad_command', batch.bad_command),
+                         ('truncated_profile', truncated)):
+        seq_idx, row_idx = np.nonzero(mask)
+        for i, e in sorted(set(zip(seq_idx.tolist(), row_ext[seq_idx, row_idx].tolist()))): # one per extrude
+            issues[i].append(_issue(reason, e))
+    for i in np.flatnonzero(trailing.any(axis=1)):
+        issues[i].append(_issue('trailing_commands'))
+    return issues
+
+
+def _check_arrays(arrays: CADSequenceArrays):
+    """geometric issues of every sequence in arrays (sketches in the normalized space, extrudes de-quantized)"""
+    issues = [[] for _ in range(arrays.n_sequences)]
+    n_ext = arrays.n_extrudes
+    n_loops = len(arrays.loop_curve_offsets) - 1
+    n_curves = len(arrays.curve_type)
+
+    ext_seq = arrays._ext_seq()
+    loop_ext = np.repeat(np.arange(n_ext), np.diff(arrays.ext_loop_offsets))
+    curve_loop = np.repeat(np.arange(n_loops), np.diff(arrays.loop_curve_offsets))
+    ext_first_loop = arrays.ext_loop_offsets[:-1]
+    seq_first_ext = arrays.seq_ext_offsets[:-1]
+
+    def add(reason, exts, loops=None, curves=None):
+        for k in range(len(exts)):
+            e = exts[k]
+            s = ext_seq[e]
+            loop = -1 if loops is None else loops[k] - ext_first_loop[e]
+            curve = -1 if curves is None else curves[k] - arrays.loop_curve_offsets[loops[k]]
+            issues[s].append(_issue(reason, e - seq_first_ext[s], loop, curve))
+
+    # curves
+    start, end = arrays.start_point, arrays.end_point
+    is_line = arrays.curve_type == LINE_IDX
+    is_arc = arrays.curve_type == ARC_IDX
+    is_circle = arrays.curve_type == CIRCLE_IDX
+    zero_line = is_line & _allclose_rows(start, end) # skipped by create_edge_3d
+    with np.errstate(invalid='ignore'):
+        chord = end - start
+        offset = arrays.mid_point - start
+        chord_sq = np.sum(chord ** 2, axis=1)
+        cross = chord[:, 0] * offset[:, 1] - chord[:, 1] * offset[:, 0]
+        finite_arc = np.isfinite(arrays.mid_point).all(axis=1) & np.isfinite(arrays.radius)
+        collinear = is_arc & ~(finite_arc & (chord_sq > 0) & (np.abs(cross) > COLLINEAR_TOL * chord_sq))
+        zero_radius = is_circle & ~(np.abs(arrays.radius) > LENGTH_TOL) # also NaN
+    non_finite = (is_line | is_arc) & ~(np.isfinite(start).all(axis=1) & np.isfinite(end).all(axis=1))
+    collinear &= ~non_finite
+
+    # loops: lines of zero length are left out of the wire, the rest must close and enclose an area
+    effective = ~zero_line
+    n_effective = np.bincount(curve_loop, weights=effective, minlength=n_loops)
+    n_circles = np.bincount(curve_loop, weights=is_circle, minlength=n_loops)
+    n_arcs = np.bincount(curve_loop, weights=is_arc, minlength=n_loops)
+    offsets = arrays.loop_curve_offsets
+    has_curves = np.diff(offsets) > 0
+    nxt = np.arange(n_curves) + 1
+    nxt[offsets[1:][has_curves] - 1] = offsets[:-1][has_curves]
+    with np.errstate(invalid='ignore'):
+        gap = ~_allclose_rows(end, start[nxt]) & ~is_circle
+        area = 0.5 * np.bincount(curve_loop, weights=start[:, 0] * start[nxt, 1] - start[nxt, 0] * start[:, 1],
+                                 minlength=n_loops)
+    lo = np.full((n_loops, 2), np.inf)
+    hi = np.full((n_loops, 2), -np.inf)
+    np.minimum.at(lo, curve_loop, start)
+    np.maximum.at(hi, curve_loop, start)
+    span = np.max(hi - lo, axis=1) if n_loops > 0 else np.zeros(0)
+
+    empty_loop = n_effective == 0
+    circle_in_loop = (n_circles > 0) & (n_effective > 1)
+    open_loop = ~empty_loop & ~circle_in_loop & (np.bincount(curve_loop, weights=gap, minlength=n_loops) > 0)
+    with np.errstate(invalid='ignore'):
+        flat = (n_arcs == 0) & (np.abs(area) <= AREA_TOL * span ** 2)
+    degenerate_loop = ~empty_loop & ~open_loop & (n_circles == 0) & ((n_effective == 1) | flat)
+
+    # extrudes
+    n_ext_loops = np.diff(arrays.ext_loop_offsets)
+    two_sides = arrays.extent_type == EXTENT_TYPE.index("TwoSidesFeatureExtentType")
+    with np.errstate(invalid='ignore'):
+        zero_extent = ~(np.abs(arrays.extent_one) > LENGTH_TOL) | \
+                      (two_sides & ~(np.abs(arrays.extent_two) > LENGTH_TOL))
+        zero_size = ~(np.abs(arrays.sketch_size) > LENGTH_TOL)
+    bad_operation = (arrays.operation < 0) | (arrays.operation >= len(EXTRUDE_OPERATIONS)) | \
+                    (arrays.extent_type < 0) | (arrays.extent_type >= len(EXTENT_TYPE))
+    ext_non_finite = ~(np.isfinite(arrays.sketch_pos).all(axis=1) & np.isfinite(arrays.plane).all(axis=1))
+
+    for s in np.flatnonzero(np.diff(arrays.seq_ext_offsets) == 0):
+        issues[s].append(_issue('no_extrude'))
+    for reason, mask in (('empty_profile', n_ext_loops == 0), ('zero_sketch_size', zero_size),
+                         ('zero_extent', zero_extent), ('non_finite', ext_non_finite),
+                         ('bad_operation', bad_operation)):
+        add(reason, np.flatnonzero(mask))
+    for reason, mask in (('empty_loop', empty_loop), ('open_loop', open_loop), ('degenerate_loop', degenerate_loop),
+                         ('circle_in_loop', circle_in_loop)):
+        loops = np.flatnonzero(mask)
+        add(reason, loop_ext[loops], loops)
+    for reason, mask in (('non_finite', non_finite), ('collinear_arc', collinear), ('zero_radius', zero_radius),
+                         ('zero_length_line', zero_line)):
+        curves = np.flatnonzero(mask)
+        add(reason, loop_ext[curve_loop[curves]], curve_loop[curves], curves)
+    return issues
@@ -0,0 +1,160 @@
+"""Parse a batch of CAD vectors with array operations instead of walking every command in Python.
+The result holds flat tables of extrudes, loops and curves (with offsets into each other);
+CADSequence objects are only built on demand and are identical to CADSequence.from_vector."""
+import numpy as np
+from .extrude import CADSequence, Extrude, CoordSystem
+from .sketch import Loop, Profile
+from .curves import Line, Arc, Circle
+from .macro import *
+
+
+def stack_cad_vectors(vecs):
+    """stack CAD vectors of different lengths into (B, L, 1 + N_ARGS), padded with EOS"""
+    max_len = max(len(vec) for vec in vecs)
+    dtype = np.result_type(*[np.asarray(vec).dtype for vec in vecs])
+    batch = np.tile(EOS_VEC.astype(dtype), (len(vecs), max_len, 1))
+    for i, vec in enumerate(vecs):
+        batch[i, :len(vec)] = vec
+    return batch
+
+
+def parse_cad_vectors(vecs, is_numerical=False, n=256):
+    """parse CAD vectors (B, L, 1 + N_ARGS), or a list of (L_i, 1 + N_ARGS), in one pass. See CADVectorBatch."""
+    if not isinstance(vecs, np.ndarray) or vecs.ndim != 3:
+        vecs = stack_cad_vectors(vecs)
+    return CADVectorBatch(vecs, is_numerical, n)
+
+
+class CADVectorBatch(object):
+    """A batch of CAD vectors as flat tables:
+
+    - extrudes: sketch_plane (E, 3) theta/phi/gamma, sketch_pos (E, 3), sketch_size, extent_one, extent_two,
+      operation, extent_type (E,); extrudes of sequence i are ext_offsets[i]:ext_offsets[i + 1]
+    - loops: loops of extrude e are ext_loop_offsets[e]:ext_loop_offsets[e + 1] (empty loops are dropped)
+    - curves: curve_type, curve_args (C, N_ARGS_SKETCH), start_point (C, 2), and for arcs center, radius,
+      sweep_angle, ref_vec; curves of loop l are loop_curve_offsets[l]:loop_curve_offsets[l + 1]
+
+    Extrude parameters are de-quantized, sketch curves stay in the normalized sketch space, as in from_vector.
+    valid (B,) is False for sequences that CADSequence.from_vector fails to parse; the row masks (B, L)
+    in_extrude/in_profile, bad_start (extrude not starting with SOL) and bad_command locate the rows involved.
+    """
+    def __init__(self, vecs, is_numerical=False, n=256):
+        self.is_numerical = is_numerical
+        self.n = n
+        commands = vecs[..., 0]
+        n_seq, seq_len = commands.shape
+        flat_vecs = vecs.reshape(n_seq * seq_len, -1)
+
+        # every extrude spans the rows from after the previous Ext up to its own Ext,
+        # its profile ends at the first EOS within that span
+        is_ext = commands == EXT_IDX
+        is_eos = commands == EOS_IDX
+        in_extrude = is_ext[:, ::-1].cumsum(axis=1)[:, ::-1] > 0
+        is_start = np.zeros_like(is_ext)
+        is_start[:, 0] = True
+        is_start[:, 1:] = is_ext[:, :-1]
+        eos_count = is_eos.cumsum(axis=1)
+        eos_count_at_start = np.maximum.accumulate(np.where(is_start, eos_count - is_eos, 0), axis=1)
+        in_profile = in_extrude & ~is_ext & (eos_count == eos_count_at_start)
+
+        is_sol = commands == SOL_IDX
+        is_curve = (commands == LINE_IDX) | (commands == ARC_IDX) | (commands == CIRCLE_IDX)
+        self.in_extrude, self.in_profile = in_extrude, in_profile
+        self.bad_start = is_start & in_extrude & ~is_sol
+        self.bad_command = in_profile & ~is_sol & ~is_curve
+        self.valid = ~(self.bad_start | self.bad_command).any(axis=1)
+
+        # extrudes
+        ext_rows = np.flatnonzero(is_ext)
+        self.ext_offsets = np.concatenate([[0], np.cumsum(is_ext.sum(axis=1))])
+        ext_vec = flat_vecs[ext_rows, -N_ARGS_EXT:]
+        self.sketch_plane = ext_vec[:, :N_ARGS_PLANE]
+        self.sketch_pos = ext_vec[:, N_ARGS_PLANE:N_ARGS_PLANE + 3]
+        self.sketch_size = ext_vec[:, N_ARGS_PLANE + N_ARGS_TRANS - 1]
+        self.extent_one = ext_vec[:, -N_ARGS_EXT_PARAM]
+        self.extent_two = ext_vec[:, -N_ARGS_EXT_PARAM + 1]
+        self.operation = ext_vec[:, -2].astype(int)
+        self.extent_type = ext_vec[:, -1].astype(int)
+        if is_numerical:
+            self.sketch_plane = (self.sketch_plane / n * 2 - 1.0) * np.pi
+            self.sketch_pos = self.sketch_pos / n * 2 - 1.0
+            self.sketch_size = self.sketch_size / n * 2
+            self.extent_one = self.extent_one / n * 2 - 1.0
+            self.extent_two = self.extent_two / n * 2 - 1.0
+
+        # loops and curves, in row order so that each loop's curves are contiguous; curves before the first SOL
+        # of an extrude (bad_start) belong to no loop, they must not join the previous extrude's last loop
+        sol_count = is_sol.cumsum(axis=1)
+        sol_count_at_start = np.maximum.accumulate(np.where(is_start, sol_count - is_sol, 0), axis=1)
+        after_sol = sol_count > sol_count_at_start
+        curve_rows = np.flatnonzero(is_curve & in_profile & after_sol)
+        loop_of_row = np.cumsum((is_sol & in_profile).reshape(-1)) - 1
+        ext_of_row = np.cumsum(is_ext.reshape(-1)) - is_ext.reshape(-1)
+        loop_ids, curve_loop = np.unique(loop_of_row[curve_rows], return_inverse=True)
+        n_loops = len(loop_ids)
+        self.loop_curve_offsets = np.searchsorted(curve_loop, np.arange(n_loops + 1))
+        loop_ext = ext_of_row[curve_rows[self.loop_curve_offsets[:-1]]]
+        self.ext_loop_offsets = np.searchsorted(loop_ext, np.arange(len(ext_rows) + 1))
+
+        self.curve_type = commands.reshape(-1)[curve_rows].astype(int)
+        self.curve_args = flat_vecs[curve_rows, 1:1 + N_ARGS_SKETCH]
+        self.end_point = self.curve_args[:, :2]
+        # a curve starts at the end of the previous one; the first curve of a loop at the end of the last one
+        prev = np.arange(len(curve_rows)) - 1
+        is_first = np.zeros(len(curve_rows), dtype=bool)
+        is_first[self.loop_curve_offsets[:-1]] = True
+        prev[is_first] = self.loop_curve_offsets[1:] - 1
+        self.start_point = self.end_point[prev]
+        self._arc_params()
+
+    def _arc_params(self):
+        """center, radius, sweep angle and reference vector of all arcs, as in Arc.from_vector.
+        is_arc is False for degenerate arcs (start == end), which are built as lines."""
+        args = self.curve_args
+        sweep_angle = args[:, 2] / 256 * 2 * np.pi if self.is_numerical else args[:, 2]
+        clockwise = args[:, 3] == 0
+        s2e_vec = self.end_point - self.start_point
+        s2e_len = np.linalg.norm(s2e_vec, axis=1)
+        self.is_arc = (self.curve_type == ARC_IDX) & (s2e_len != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            radius = (s2e_len / 2) / np.sin(sweep_angle / 2)
+            vertical = np.stack([s2e_vec[:, 1], -s2e_vec[:, 0]], axis=1) / s2e_len[:, None]
+            vertical[clockwise] = -vertical[clockwise]
+            center = (self.start_point + self.end_point) / 2 - vertical * (radius * np.cos(sweep_angle / 2))[:, None]
+            ref_vec = np.where(clockwise[:, None], self.end_point - center, self.start_point - center)
+            ref_vec = ref_vec / np.linalg.norm(ref_vec, axis=1, keepdims=True)
+        self.center, self.radius, self.sweep_angle, self.ref_vec = center, radius, sweep_angle, ref_vec
+
+    def __len__(self):
+        return len(self.valid)
+
+    def n_extrudes(self, i):
+        return self.ext_offsets[i + 1] - self.ext_offsets[i]
+
+    def to_cad_sequence(self, i):
+        """CADSequence of the i-th vector, equal to CADSequence.from_vector(vecs[i], is_numerical, n)"""
+        if not self.valid[i]:
+            raise ValueError("invalid CAD vector: {}".format(i))
+        return CADSequence([self.to_extrude(e) for e in range(self.ext_offsets[i], self.ext_offsets[i + 1])])
+
+    def to_cad_sequences(self):
+        """CADSequence of every vector, None for invalid ones"""
+        return [self.to_cad_sequence(i) if self.valid[i] else None for i in range(len(self))]
+
+    def to_extrude(self, e):
+        loops = [self.to_loop(l) for l in range(self.ext_loop_offsets[e], self.ext_loop_offsets[e + 1])]
+        sketch_plane = CoordSystem(self.sketch_pos[e].copy(), *self.sketch_plane[e])
+        return Extrude(Profile(loops), sketch_plane, self.operation[e], self.extent_type[e],
+                       self.extent_one[e], self.extent_two[e], self.sketch_pos[e].copy(), self.sketch_size[e])
+
+    def to_loop(self, l):
+        return Loop([self.to_curve(c) for c in range(self.loop_curve_offsets[l], self.loop_curve_offsets[l + 1])])
+
+    def to_curve(self, c):
+        curve_type = self.curve_type[c]
+        if curve_type == CIRCLE_IDX:
+            return Circle(self.end_point[c].copy(), self.curve_args[c, 4])
+        if self.is_arc[c]:
+            return Arc(self.start_point[c].copy(), self.end_point[c].copy(), self.center[c], self.radius[c],
+                       start_angle=0, end_angle=self.sweep_angle[c], ref_vec=self.ref_vec[c])
+        return Line(self.start_point[c].copy(), self.end_point[c].copy()) # lines and degenerate arcs
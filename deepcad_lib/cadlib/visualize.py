@@ -1,45 +1,129 @@
 from OCC.Core.gp import gp_Pnt, gp_Dir, gp_Circ, gp_Pln, gp_Vec, gp_Ax3, gp_Ax2, gp_Lin
-from OCC.Core.BRepBuilderAPI import (BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeFace, BRepBuilderAPI_MakeWire)
+from OCC.Core.BRepBuilderAPI import (BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeFace, BRepBuilderAPI_MakeWire,
+                                     BRepBuilderAPI_Copy)
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakePrism
 from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Cut, BRepAlgoAPI_Fuse, BRepAlgoAPI_Common
 from OCC.Core.GC import GC_MakeArcOfCircle
-from OCC.Extend.DataExchange import write_stl_file
 from OCC.Core.Bnd import Bnd_Box
 from OCC.Core.BRepBndLib import brepbndlib_Add
-from copy import copy
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.BRep import BRep_Tool
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_REVERSED
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import topods
+from OCC.Core.TopTools import TopTools_ListOfShape
+from copy import copy, deepcopy
+from itertools import chain
 from .extrude import *
 from .sketch import Loop, Profile
 from .curves import *
-import os
-import trimesh
-from trimesh.sample import sample_surface
-import random
+from .brep_sampling import sample_brep_surface
+from .shape_cache import BodyPrefixCache, prefix_keys
 
 
-def vec2CADsolid(vec, is_numerical=True, n=256):
+def vec2CADsolid(vec, is_numerical=True, n=256, cache=None):
     cad = CADSequence.from_vector(vec, is_numerical=is_numerical, n=256)
-    cad = create_CAD(cad)
+    cad = create_CAD(cad, cache=cache)
     return cad
 
 
-def create_CAD(cad_seq: CADSequence):
-    """create a 3D CAD model from CADSequence. Only support extrude with boolean operation."""
-    body = create_by_extrude(cad_seq.seq[0])
-    for extrude_op in cad_seq.seq[1:]:
-        new_body = create_by_extrude(extrude_op)
-        if extrude_op.operation == EXTRUDE_OPERATIONS.index("NewBodyFeatureOperation") or \
-                extrude_op.operation == EXTRUDE_OPERATIONS.index("JoinFeatureOperation"):
-            body = BRepAlgoAPI_Fuse(body, new_body).Shape()
-        elif extrude_op.operation == EXTRUDE_OPERATIONS.index("CutFeatureOperation"):
-            body = BRepAlgoAPI_Cut(body, new_body).Shape()
-        elif extrude_op.operation == EXTRUDE_OPERATIONS.index("IntersectFeatureOperation"):
-            body = BRepAlgoAPI_Common(body, new_body).Shape()
+def create_CAD(cad_seq: CADSequence, parallel=True, fuzzy=0.0, group=False, cache=None, prefix_cache=None):
+    """create a 3D CAD model from CADSequence. Only support extrude with boolean operation.
+
+    Extrudes are applied to the body one at a time. With group=True, runs of consecutive join (or new body)
+    extrudes are fused in one multi-argument boolean and runs of cuts are cut at once (body - a - b ==
+    body - (a + b)); intersections stay pairwise. Grouping is off by default: the general fuse of a group
+    intersects every pair of tools, and on one core it is slower than pairwise evaluation from about 5
+    extrudes on (see utils/benchmark_create_cad.py). parallel and fuzzy are passed to the OCC boolean builders.
+    cache (a shape_cache.ExtrudeCache) is used to look up and store the extrude primitives. With prefix_cache
+    (a shape_cache.BodyPrefixCache) the build starts from the body of the longest cached prefix of extrudes
+    and stores the body after every group.
+    """
+    keys = prefix_keys(cad_seq.seq, fuzzy) if prefix_cache is not None else None
+    depth, body = prefix_cache.longest_prefix(keys) if prefix_cache is not None else (0, None)
+    if body is None:
+        body = create_by_extrude(cad_seq.seq[0], parallel, fuzzy, cache)
+        depth = 1
+        if prefix_cache is not None:
+            prefix_cache.put(keys[:depth], body)
+    for operation, tools in _boolean_groups(cad_seq.seq[depth:], group):
+        depth += len(tools)
+        if operation is None:
+            continue
+        body = boolean_op(operation, body, [create_by_extrude(ext, parallel, fuzzy, cache) for ext in tools],
+                          parallel, fuzzy)
+        if prefix_cache is not None:
+            prefix_cache.put(keys[:depth], body)
     return body
 
 
-def create_by_extrude(extrude_op: Extrude):
-    """create a solid body from Extrude instance."""
-    profile = copy(extrude_op.profile) # use copy to prevent changing extrude_op internally
+def vecs2CADsolids(vecs, is_numerical=True, n=256, cache=None, prefix_cache=None):
+    """solids of several candidate vectors (None where building fails), sharing the bodies of common
+    extrude prefixes through prefix_cache (a new BodyPrefixCache for this call if not given)"""
+    prefix_cache = BodyPrefixCache() if prefix_cache is None else prefix_cache
+    shapes = []
+    for vec in vecs:
+        try:
+            cad = CADSequence.from_vector(vec, is_numerical=is_numerical, n=n)
+            shapes.append(create_CAD(cad, cache=cache, prefix_cache=prefix_cache))
+        except Exception:
+            shapes.append(None)
+    return shapes
+
+
+def _boolean_groups(extrudes, group=True):
+    """(operation, extrudes) runs of the boolean operations applied to the body, join and new body as join.
+    Extrudes with an unknown operation are left out of the body, as (None, [extrude])."""
+    groups = []
+    for extrude_op in extrudes:
+        if not 0 <= extrude_op.operation < len(EXTRUDE_OPERATIONS):
+            groups.append((None, [extrude_op]))
+            continue
+        operation = EXTRUDE_OPERATIONS[extrude_op.operation]
+        if operation == "NewBodyFeatureOperation":
+            operation = "JoinFeatureOperation"
+        if group and len(groups) > 0 and groups[-1][0] == operation and operation != "IntersectFeatureOperation":
+            groups[-1][1].append(extrude_op)
+        else:
+            groups.append((operation, [extrude_op]))
+    return groups
+
+
+def boolean_op(operation, body, tools, parallel=True, fuzzy=0.0):
+    """apply the boolean operation between body and all tool shapes in one builder.
+    Runs non-destructively, the input shapes may be shared (see shape_cache)."""
+    if operation == "JoinFeatureOperation":
+        builder = BRepAlgoAPI_Fuse()
+    elif operation == "CutFeatureOperation":
+        builder = BRepAlgoAPI_Cut()
+    elif operation == "IntersectFeatureOperation":
+        builder = BRepAlgoAPI_Common()
+    else:
+        raise ValueError(operation)
+    arguments, tool_list = TopTools_ListOfShape(), TopTools_ListOfShape()
+    arguments.Append(body)
+    for tool in tools:
+        tool_list.Append(tool)
+    builder.SetArguments(arguments)
+    builder.SetTools(tool_list)
+    builder.SetRunParallel(parallel)
+    builder.SetNonDestructive(True)
+    if fuzzy > 0:
+        builder.SetFuzzyValue(fuzzy)
+    builder.Build()
+    return builder.Shape()
+
+
+def create_by_extrude(extrude_op: Extrude, parallel=True, fuzzy=0.0, cache=None):
+    """create a solid body from Extrude instance. With a cache, an extrude built before is returned from it."""
+    if cache is not None:
+        return cache.get_or_build(extrude_op, lambda: _build_extrude(extrude_op, parallel, fuzzy), fuzzy)
+    return _build_extrude(extrude_op, parallel, fuzzy)
+
+
+def _build_extrude(extrude_op: Extrude, parallel=True, fuzzy=0.0):
+    profile = deepcopy(extrude_op.profile) # denormalize moves the curves in place, keep extrude_op intact
     profile.denormalize(extrude_op.sketch_size)
 
     sketch_plane = copy(extrude_op.sketch_plane)
@@ -51,11 +135,11 @@ def create_by_extrude(extrude_op: Extrude):
     body = BRepPrimAPI_MakePrism(face, ext_vec).Shape()
     if extrude_op.extent_type == EXTENT_TYPE.index("SymmetricFeatureExtentType"):
         body_sym = BRepPrimAPI_MakePrism(face, ext_vec.Reversed()).Shape()
-        body = BRepAlgoAPI_Fuse(body, body_sym).Shape()
+        body = boolean_op("JoinFeatureOperation", body, [body_sym], parallel, fuzzy)
     if extrude_op.extent_type == EXTENT_TYPE.index("TwoSidesFeatureExtentType"):
         ext_vec = gp_Vec(normal.Reversed()).Multiplied(extrude_op.extent_two)
         body_two = BRepPrimAPI_MakePrism(face, ext_vec).Shape()
-        body = BRepAlgoAPI_Fuse(body, body_two).Shape()
+        body = boolean_op("JoinFeatureOperation", body, [body_two], parallel, fuzzy)
     return body
 
 
@@ -117,17 +201,83 @@ def point_local2global(point, sketch_plane: CoordSystem, to_gp_Pnt=True):
     return g_point
 
 
-def CADsolid2pc(shape, n_points, name=None):
-    """convert opencascade solid to point clouds"""
+def CADsolid2pc(shape, n_points, name=None, backend='mesh', return_normals=False):
+    """convert opencascade solid to point clouds. Tessellation happens in memory, so it is safe to run concurrently;
+    name is no longer used (it named the temporary STL file).
+    backend 'mesh' samples a tessellation of the solid, 'brep' samples its faces exactly in their UV domain."""
     bbox = Bnd_Box()
     brepbndlib_Add(shape, bbox)
     if bbox.IsVoid():
         raise ValueError("box check failed")
 
-    if name is None:
-        name = random.randint(100000, 999999)
-    write_stl_file(shape, "tmp_out_{}.stl".format(name))
-    out_mesh = trimesh.load("tmp_out_{}.stl".format(name))
-    os.system("rm tmp_out_{}.stl".format(name))
-    out_pc, _ = sample_surface(out_mesh, n_points)
-    return out_pc
+    if backend == 'brep':
+        return sample_brep_surface(shape, n_points, return_normals)
+    if backend != 'mesh':
+        raise ValueError(backend)
+    vertices, faces = tessellate_shape(shape)
+    return sample_mesh_surface(vertices, faces, n_points, return_normals)
+
+
+def tessellate_shape(shape, linear_deflection=0.9, angular_deflection=0.5):
+    """triangulate a shape with BRepMesh_IncrementalMesh and collect the face triangulations
+    into vertices (N, 3) and triangle vertex indices (M, 3), wound along the outward face normal.
+    Default deflections are those the STL export used.
+    A copy of the shape is meshed: BRepMesh stores the triangulations on the faces it is given, and those faces
+    may be shared with shapes held by an ExtrudeCache or BodyPrefixCache, or meshed by another thread."""
+    shape = BRepBuilderAPI_Copy(shape).Shape() # geometry copied, existing triangulations are not
+    BRepMesh_IncrementalMesh(shape, linear_deflection, False, angular_deflection, True)
+
+    all_vertices = []
+    all_faces = []
+    n_vertices = 0
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        face = topods.Face(explorer.Current())
+        explorer.Next()
+        location = TopLoc_Location()
+        triangulation = BRep_Tool.Triangulation(face, location)
+        if triangulation is None:
+            continue
+
+        # read nodes and triangles straight into preallocated arrays, then apply the face location to all
+        # nodes at once instead of transforming gp_Pnt one by one
+        n_nodes, n_triangles = triangulation.NbNodes(), triangulation.NbTriangles()
+        vertices = np.fromiter(chain.from_iterable(triangulation.Node(i).Coord() for i in range(1, n_nodes + 1)),
+                               dtype=np.float64, count=3 * n_nodes).reshape(n_nodes, 3)
+        triangles = np.fromiter(chain.from_iterable(triangulation.Triangle(i).Get()
+                                                    for i in range(1, n_triangles + 1)),
+                                dtype=np.int64, count=3 * n_triangles).reshape(n_triangles, 3) - 1
+        if not location.IsIdentity():
+            trsf = location.Transformation()
+            matrix = np.array([[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)]) # scale included
+            vertices = vertices @ matrix[:, :3].T + matrix[:, 3]
+        if face.Orientation() == TopAbs_REVERSED:
+            triangles = triangles[:, ::-1]
+
+        all_vertices.append(vertices)
+        all_faces.append(triangles + n_vertices)
+        n_vertices += len(vertices)
+
+    if len(all_faces) == 0:
+        raise ValueError("tessellation failed")
+    return np.concatenate(all_vertices, axis=0), np.concatenate(all_faces, axis=0)
+
+
+def sample_mesh_surface(vertices, faces, n_points, return_normals=False):
+    """uniformly sample n_points on a triangle mesh: triangles are picked with probability proportional
+    to their area and points are placed by uniform barycentric coordinates. Optionally also returns face normals."""
+    triangles = vertices[faces]  # (M, 3, 3)
+    cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    double_areas = np.linalg.norm(cross, axis=1)
+    cum_areas = np.cumsum(double_areas)
+    face_idx = np.searchsorted(cum_areas, np.random.random(n_points) * cum_areas[-1], side='right')
+    face_idx = np.minimum(face_idx, len(faces) - 1)
+
+    r1 = np.sqrt(np.random.random((n_points, 1)))
+    r2 = np.random.random((n_points, 1))
+    tri = triangles[face_idx]
+    points = (1 - r1) * tri[:, 0] + r1 * (1 - r2) * tri[:, 1] + r1 * r2 * tri[:, 2]
+    if not return_normals:
+        return points
+    normals = cross[face_idx] / np.maximum(double_areas[face_idx, None], 1e-12)
+    return points, normals
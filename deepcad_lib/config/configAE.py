@@ -1,5 +1,5 @@
 import os
-from utils import ensure_dirs
+from utils import ensure_dirs, set_visible_gpus, get_device, init_distributed, is_main_process, barrier
 import argparse
 import json
 import shutil
@@ -8,6 +8,7 @@ from cadlib.macro import *
 
 class ConfigAE(object):
     def __init__(self, phase):
+        self.phase = phase
         self.is_train = phase == "train"
 
         self.set_configuration()
@@ -21,28 +22,30 @@ class ConfigAE(object):
             print("{0:20}".format(k), v)
             self.__setattr__(k, v)
 
+        # GPU usage, and process group when launched with torchrun
+        set_visible_gpus(args.gpu_ids)
+        self.device = get_device(args.gpu_ids)
+        init_distributed(self.device, args.dist_backend)
+
         # experiment paths
         self.exp_dir = os.path.join(self.proj_dir, self.exp_name)
-        if phase == "train" and args.cont is not True and os.path.exists(self.exp_dir):
+        if phase == "train" and args.cont is not True and os.path.exists(self.exp_dir) and is_main_process():
             response = input('Experiment log/model already exists, overwrite? (y/n) ')
             if response != 'y':
                 exit()
             shutil.rmtree(self.exp_dir)
+        barrier()
 
         self.log_dir = os.path.join(self.exp_dir, 'log')
         self.model_dir = os.path.join(self.exp_dir, 'model')
         ensure_dirs([self.log_dir, self.model_dir])
 
-        # GPU usage
-        if args.gpu_ids is not None:
-            os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
-
         # create soft link to experiment log directory
         # if not os.path.exists('train_log'):
             # os.symlink(self.exp_dir, 'train_log')
 
         # save this configuration
-        if self.is_train:
+        if self.is_train and is_main_process():
             with open('{}/config.txt'.format(self.exp_dir), 'w') as f:
                 json.dump(args.__dict__, f, indent=2)
 
@@ -79,27 +82,44 @@ class ConfigAE(object):
         parser.add_argument('--proj_dir', type=str, default="proj_log", help="path to project folder where models and logs will be saved")
         parser.add_argument('--data_root', type=str, default="data", help="path to source data folder")
         parser.add_argument('--exp_name', type=str, default=os.getcwd().split('/')[-1], help="name of this experiment")
-        parser.add_argument('-g', '--gpu_ids', type=str, default='0', help="gpu to use, e.g. 0  0,1,2. CPU not supported.")
+        parser.add_argument('-g', '--gpu_ids', type=str, default='0', help="gpu to use, e.g. 0  0,1,2. Use cpu (or -1) to run on CPU.")
 
-        parser.add_argument('--batch_size', type=int, default=512, help="batch size")
+        parser.add_argument('--dist_backend', type=str, default=None, choices=['nccl', 'gloo'], help="backend for multi-process training launched with torchrun, defaults to nccl on GPU and gloo on CPU")
+        parser.add_argument('--batch_size', type=int, default=512, help="batch size (per process)")
         parser.add_argument('--num_workers', type=int, default=8, help="number of workers for data loading")
+        parser.add_argument('--prefetch_factor', type=int, default=2, help="number of batches prefetched by each data loading worker")
+        parser.add_argument('--bucket', action='store_true', help="batch sequences of similar length and pad each batch only to its own maximum")
+        parser.add_argument('--pack', action='store_true', help="pack several short sequences into each encoder row with block-diagonal attention")
+        parser.add_argument('--pack_len', type=int, default=MAX_TOTAL_LEN, help="length of a packed encoder row, values above max_total_len enlarge the positional table")
 
         parser.add_argument('--nr_epochs', type=int, default=1000, help="total number of epochs to train")
         parser.add_argument('--lr', type=float, default=1e-3, help="initial learning rate")
+        parser.add_argument('--amp', type=str, default='none', choices=['none', 'fp16', 'bf16'], help="mixed precision training, bf16 also works on CPU")
+        parser.add_argument('--grad_accum', type=int, default=1, help="accumulate gradients over x steps before each optimizer step")
         parser.add_argument('--grad_clip', type=float, default=1.0, help="initial learning rate")
         parser.add_argument('--warmup_step', type=int, default=2000, help="step size for learning rate warm up")
         parser.add_argument('--continue', dest='cont',  action='store_true', help="continue training from checkpoint")
         parser.add_argument('--ckpt', type=str, default='latest', required=False, help="desired checkpoint to restore")
         parser.add_argument('--vis', action='store_true', default=False, help="visualize output in training")
         parser.add_argument('--save_frequency', type=int, default=500, help="save models every x epochs")
+        parser.add_argument('--keep_ckpt', type=int, default=0, help="keep only the last x numbered checkpoints, 0 keeps all")
+        parser.add_argument('--log_frequency', type=int, default=10, help="average and write training losses/throughput every x steps")
         parser.add_argument('--val_frequency', type=int, default=10, help="run validation every x iterations")
+        parser.add_argument('--external_eval', action='store_true', help="skip validation in the training loop, run eval_worker.py alongside instead")
         parser.add_argument('--vis_frequency', type=int, default=2000, help="visualize output every x iterations")
         parser.add_argument('--augment', action='store_true', help="use random data augmentation")
+        parser.add_argument('--augment_geometry', action='store_true', help="randomly flip and transform sketches and extrusions of each training batch")
         
         if not self.is_train:
             parser.add_argument('-m', '--mode', type=str, choices=['rec', 'enc', 'dec'])
             parser.add_argument('-o', '--outputs', type=str, default=None)
             parser.add_argument('--z_path', type=str, default=None)
+        if self.phase == "eval":
+            parser.add_argument('--poll_interval', type=float, default=60, help="seconds between scans of the checkpoint folder")
+            parser.add_argument('--once', action='store_true', help="evaluate the checkpoints present now and exit")
+            parser.add_argument('--cd_samples', type=int, default=0, help="also compute chamfer distance on the first x validation shapes (needs pythonocc)")
+            parser.add_argument('--pc_root', type=str, default="data/pc_cad", help="path to ground-truth point clouds for chamfer distance")
+            parser.add_argument('--n_points', type=int, default=2000, help="number of points per shape for chamfer distance")
         
         args = parser.parse_args()
         return parser, args
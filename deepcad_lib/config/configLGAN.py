@@ -1,5 +1,5 @@
 import os
-from utils import ensure_dirs
+from utils import ensure_dirs, set_visible_gpus, get_device
 import argparse
 import json
 import shutil
@@ -32,13 +32,13 @@ class ConfigLGAN(object):
         ensure_dirs([self.log_dir, self.model_dir])
 
         # GPU usage
-        if args.gpu_ids is not None:
-            os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
+        set_visible_gpus(args.gpu_ids)
+        self.device = get_device(args.gpu_ids)
 
         # save this configuration
         if not args.test:
             with open('{}/config.txt'.format(self.exp_dir), 'w') as f:
-                json.dump(self.__dict__, f, indent=2)
+                json.dump(self.__dict__, f, indent=2, default=str)
 
     def set_configuration(self):
         # network configuration
@@ -63,14 +63,19 @@ class ConfigLGAN(object):
         parser.add_argument('--test', action='store_true', help="test mode")
         parser.add_argument('--n_samples', type=int, default=100, help="number of samples to generate when testing")
         parser.add_argument('-g', '--gpu_ids', type=str, default="0",
-                            help="gpu to use, e.g. 0  0,1,2. CPU not supported.")
+                            help="gpu to use, e.g. 0  0,1,2. Use cpu (or -1) to run on CPU.")
 
         parser.add_argument('--batch_size', type=int, default=256, help="batch size")
         parser.add_argument('--num_workers', type=int, default=8, help="number of workers for data loading")
+        parser.add_argument('--prefetch_factor', type=int, default=2, help="number of batches prefetched by each data loading worker")
 
         parser.add_argument('--n_iters', type=int, default=200000, help="total number of iterations to train")
         parser.add_argument('--save_frequency', type=int, default=100000, help="save models every x iterations")
+        parser.add_argument('--keep_ckpt', type=int, default=0, help="keep only the last x numbered checkpoints, 0 keeps all")
+        parser.add_argument('--log_frequency', type=int, default=10, help="average and write training losses/throughput every x steps")
         parser.add_argument('--lr', type=float, default=2e-4, help="initial learning rate")
+        parser.add_argument('--amp', type=str, default='none', choices=['none', 'fp16', 'bf16'], help="mixed precision training, bf16 also works on CPU")
+        parser.add_argument('--grad_accum', type=int, default=1, help="accumulate gradients over x steps before each optimizer step")
 
         args = parser.parse_args()
         return parser, args
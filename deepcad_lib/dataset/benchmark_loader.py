@@ -0,0 +1,70 @@
+import time
+import torch
+import argparse
+import sys
+sys.path.append("..")
+from cadlib.macro import *
+from utils import get_device, set_visible_gpus
+
+
+def build_loader(name, args):
+    """training DataLoader of one dataset, built from a minimal config"""
+    cfg = argparse.Namespace(batch_size=args.batch_size, num_workers=args.num_workers,
+                             prefetch_factor=args.prefetch_factor, device=get_device(args.gpu_ids))
+    if name == 'cad':
+        from dataset.cad_dataset import get_dataloader
+        cfg.__dict__.update(data_root=args.data_root, augment=args.augment, bucket=False, pack=False,
+                            augment_geometry=args.augment,
+                            max_n_loops=MAX_N_LOOPS, max_n_curves=MAX_N_CURVES, max_total_len=MAX_TOTAL_LEN)
+        return get_dataloader('train', cfg, distributed=False)
+    if name == 'lgan':
+        from dataset.lgan_dataset import get_dataloader
+        cfg.data_root = args.zs_path
+        return get_dataloader(cfg)
+    if name == 'pc2cad':
+        from pc2cad import get_dataloader
+        cfg.__dict__.update(data_root=args.zs_path, pc_root=args.pc_root, packed_pc=args.packed_pc,
+                            split_path=args.data_root + "/train_val_test_split.json", n_points=2048)
+        return get_dataloader('train', cfg)
+    raise ValueError(name)
+
+
+def benchmark(dataloader, n_batches, n_warmup):
+    """batches/sec and samples/sec over n_batches, after n_warmup batches that include worker start-up"""
+    it = iter(dataloader)
+    for _ in range(n_warmup):
+        next(it)
+    n_samples = 0
+    t0 = time.perf_counter()
+    for i in range(n_batches):
+        try:
+            data = next(it)
+        except StopIteration:
+            break
+        first = data if torch.is_tensor(data) else next(v for v in data.values() if torch.is_tensor(v))
+        n_samples += first.shape[0]
+    elapsed = time.perf_counter() - t0
+    return (i + 1) / elapsed, n_samples / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="report the throughput of the training DataLoaders")
+    parser.add_argument('--datasets', type=str, nargs='+', default=['cad', 'lgan'], choices=['cad', 'lgan', 'pc2cad'])
+    parser.add_argument('--data_root', type=str, default="../data", help="path to source data folder")
+    parser.add_argument('--zs_path', type=str, default=None, help="all_zs_ckpt*.h5, for the lgan and pc2cad datasets")
+    parser.add_argument('--pc_root', type=str, default="../data/pc_cad", help="point clouds, for the pc2cad dataset")
+    parser.add_argument('--packed_pc', type=str, default=None, help="packed point clouds, for the pc2cad dataset")
+    parser.add_argument('--augment', action='store_true', help="benchmark the cad dataset with augmentation")
+    parser.add_argument('--batch_size', type=int, default=512)
+    parser.add_argument('--num_workers', type=int, default=8)
+    parser.add_argument('--prefetch_factor', type=int, default=2)
+    parser.add_argument('--n_batches', type=int, default=200)
+    parser.add_argument('--n_warmup', type=int, default=10)
+    parser.add_argument('-g', '--gpu_ids', type=str, default='0', help="decides whether batches are pinned")
+    args = parser.parse_args()
+    set_visible_gpus(args.gpu_ids)
+
+    for name in args.datasets:
+        batches_per_sec, samples_per_sec = benchmark(build_loader(name, args), args.n_batches, args.n_warmup)
+        print("{:8} workers={} prefetch={}: {:8.1f} batches/sec {:10.1f} samples/sec".format(
+            name, args.num_workers, args.prefetch_factor, batches_per_sec, samples_per_sec))
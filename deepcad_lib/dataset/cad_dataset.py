@@ -1,19 +1,168 @@
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, Sampler
+from torch.utils.data.distributed import DistributedSampler
+from torch.utils.data.dataloader import default_collate
 import torch
 import os
+from functools import partial
 import json
 import h5py
 import random
 from cadlib.macro import *
+from utils import get_rank, get_world_size
+from .loader import make_dataloader
 
 
-def get_dataloader(phase, config, shuffle=None):
+def get_dataloader(phase, config, shuffle=None, distributed=True):
+    """distributed: shard the data across processes when running under torchrun"""
     is_shuffle = phase == 'train' if shuffle is None else shuffle
+    rank, world_size = (get_rank(), get_world_size()) if distributed else (0, 1)
 
     dataset = CADDataset(phase, config)
-    dataloader = DataLoader(dataset, batch_size=config.batch_size, shuffle=is_shuffle, num_workers=config.num_workers,
-                            worker_init_fn=np.random.seed())
-    return dataloader
+    if config.pack:
+        collate_fn = partial(collate_pack_sequences, pack_len=config.pack_len)
+    elif config.bucket:
+        collate_fn = collate_trim_padding
+    else:
+        collate_fn = None
+    if config.augment_geometry and phase == 'train':
+        collate_fn = partial(collate_augment_geometry, collate_fn=collate_fn or default_collate,
+                             max_n_loops=config.max_n_loops, max_n_curves=config.max_n_curves,
+                             max_total_len=config.max_total_len)
+    if config.bucket:
+        batch_sampler = LengthBucketBatchSampler(dataset.get_lengths(), config.batch_size, shuffle=is_shuffle,
+                                                 rank=rank, world_size=world_size)
+        return make_dataloader(dataset, config, batch_sampler=batch_sampler, collate_fn=collate_fn)
+    sampler = None
+    if world_size > 1:
+        sampler = DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=is_shuffle)
+    return make_dataloader(dataset, config, shuffle=is_shuffle, sampler=sampler, collate_fn=collate_fn)
+
+
+class LengthBucketBatchSampler(Sampler):
+    """Batch sampler that groups sequences of similar true length, so that each batch can be padded only to its own maximum.
+    Indices are sorted by length (ties broken randomly), cut into batches, and the batch order is shuffled.
+    With world_size > 1, every process gets an equal share of the batches; all processes shuffle with the
+    same seed and epoch (see set_epoch), so the shares never overlap."""
+    def __init__(self, lengths, batch_size, shuffle=True, drop_last=False, rank=0, world_size=1, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.RandomState(self.seed + self.epoch)
+        if self.shuffle:
+            order = np.lexsort((rng.permutation(len(self.lengths)), self.lengths))
+        else:
+            order = np.argsort(self.lengths, kind='stable')
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        if self.drop_last and len(batches) > 0 and len(batches[-1]) < self.batch_size:
+            batches = batches[:-1]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        n_per_rank = len(batches) // self.world_size if self.world_size > 1 else len(batches)
+        for batch in batches[self.rank::self.world_size][:n_per_rank]:
+            yield batch.tolist()
+
+    def __len__(self):
+        if self.drop_last:
+            n_batches = len(self.lengths) // self.batch_size
+        else:
+            n_batches = (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        return n_batches // self.world_size if self.world_size > 1 else n_batches
+
+
+def collate_trim_padding(batch):
+    """default collate, then drop the trailing EOS padding shared by the whole batch.
+    Two extra EOS positions are kept so that the extended padding mask in CADLoss sees the same targets."""
+    data = default_collate(batch)
+    commands = data["command"]
+    seq_len = (commands != EOS_IDX).sum(dim=1).max().item() + 1 # true length including the final EOS
+    seq_len = min(seq_len + 2, commands.shape[1])
+    data["command"] = commands[:, :seq_len]
+    data["args"] = data["args"][:, :seq_len]
+    return data
+
+
+def collate_augment_geometry(batch, collate_fn=default_collate, max_n_loops=MAX_N_LOOPS, max_n_curves=MAX_N_CURVES,
+                             max_total_len=MAX_TOTAL_LEN):
+    """random sketch flips and sketch/extrusion transforms (CADSequence.random_flip_sketch and random_transform)
+    applied to the whole batch at once in struct-of-arrays form, then collate_fn.
+    Shapes whose augmented vector no longer fits keep their original vector."""
+    from cadlib.sequence_arrays import CADSequenceArrays
+
+    vecs = np.stack([np.concatenate([item["command"].numpy()[:, np.newaxis], item["args"].numpy()], axis=1)
+                     for item in batch])
+    cad = CADSequenceArrays.from_vectors(vecs, is_numerical=True)
+    cad.random_flip_sketch()
+    cad.random_transform()
+    cad.numericalize()
+    aug_vecs = cad.to_vectors(MAX_N_EXT, max_n_loops, max_n_curves, max_total_len, pad=True)
+    for item, vec in zip(batch, aug_vecs):
+        if vec is None or len(vec) > max_total_len or vec.min() < PAD_VAL or vec.max() >= ARGS_DIM:
+            continue
+        item["command"] = torch.tensor(vec[:, 0], dtype=torch.long)
+        item["args"] = torch.tensor(vec[:, 1:], dtype=torch.long)
+    return collate_fn(batch)
+
+
+def packed_split_paths(data_root, phase):
+    """paths of the packed (memory-mapped) cad vectors, lengths and ids of one split"""
+    packed_dir = os.path.join(data_root, "cad_vec_packed")
+    return (os.path.join(packed_dir, "{}_vec.npy".format(phase)),
+            os.path.join(packed_dir, "{}_len.npy".format(phase)),
+            os.path.join(packed_dir, "{}_ids.json".format(phase)))
+
+
+def collate_pack_sequences(batch, pack_len=MAX_TOTAL_LEN):
+    """default collate, plus encoder inputs with several sequences packed into each row of length pack_len.
+    Only the tokens before the first EOS are packed (the encoder masks the rest anyway); rows are filled first-fit
+    decreasing. "command"/"args" keep the padded per-sequence targets for the decoder loss.
+
+    Adds "packed": {"command", "args", "segment_ids", "positions"}, each of shape (R, pack_len, ...),
+    where segment_ids index the sequences of the batch (-1 for padding) and positions restart at 0 in every segment.
+    """
+    data = default_collate(batch)
+    commands, args = data["command"], data["args"]
+    lengths = (commands != EOS_IDX).long().cumprod(dim=1).sum(dim=1).tolist() # tokens before the first EOS
+
+    if max(lengths) > pack_len:
+        raise ValueError("pack_len {} is shorter than a sequence of length {}".format(pack_len, max(lengths)))
+
+    rows = [] # list of (free space, [segment indices])
+    for i in sorted(range(len(lengths)), key=lambda k: -lengths[k]):
+        for row in rows:
+            if row[0] >= lengths[i]:
+                row[0] -= lengths[i]
+                row[1].append(i)
+                break
+        else:
+            rows.append([pack_len - lengths[i], [i]])
+
+    packed_commands = torch.full((len(rows), pack_len), EOS_IDX, dtype=commands.dtype)
+    packed_args = torch.full((len(rows), pack_len, args.shape[-1]), PAD_VAL, dtype=args.dtype)
+    segment_ids = torch.full((len(rows), pack_len), -1, dtype=torch.long)
+    positions = torch.zeros((len(rows), pack_len), dtype=torch.long)
+    for r, (_, segs) in enumerate(rows):
+        start = 0
+        for i in segs:
+            end = start + lengths[i]
+            packed_commands[r, start:end] = commands[i, :lengths[i]]
+            packed_args[r, start:end] = args[i, :lengths[i]]
+            segment_ids[r, start:end] = i
+            positions[r, start:end] = torch.arange(lengths[i])
+            start = end
+
+    data["packed"] = {"command": packed_commands, "args": packed_args,
+                      "segment_ids": segment_ids, "positions": positions}
+    return data
 
 
 class CADDataset(Dataset):
@@ -30,50 +179,112 @@ class CADDataset(Dataset):
         with open(self.path, "r") as fp:
             self.all_data = json.load(fp)[phase]
 
+        # use the packed split produced by dataset/pack_cad_vec.py if available
+        self.packed_vec_path, packed_len_path, packed_ids_path = packed_split_paths(config.data_root, phase)
+        self.use_packed = os.path.exists(self.packed_vec_path)
+        self.packed_vec = None # opened lazily, once per worker
+        if self.use_packed:
+            print("using packed data:", self.packed_vec_path)
+            with open(packed_ids_path, "r") as fp:
+                self.all_data = json.load(fp)
+            self.packed_len = np.load(packed_len_path)
+
         self.max_n_loops = config.max_n_loops          # Number of paths (N_P)
         self.max_n_curves = config.max_n_curves            # Number of commands (N_C)
         self.max_total_len = config.max_total_len
         self.size = 256
+        # sketch-extrude segment table for augmentation, built once here in the main process so that the
+        # DataLoader workers share it instead of each reading the whole split. With the packed split its rows are
+        # the memory-mapped vectors (reopened by each worker), otherwise the concatenated h5 vectors in memory
+        self.seg_rows, self.seg_table = None, None
+        if self.aug and self.phase == "train":
+            rows, seg_start, seg_len, shape_seg_offset = self.build_segment_table()
+            self.seg_rows = None if self.use_packed else rows
+            self.seg_table = (seg_start, seg_len, shape_seg_offset)
 
     def get_data_by_id(self, data_id):
         idx = self.all_data.index(data_id)
         return self.__getitem__(idx)
 
-    def __getitem__(self, index):
-        data_id = self.all_data[index]
-        h5_path = os.path.join(self.raw_data, data_id + ".h5")
+    def open_packed(self):
+        """memory-mapped packed vectors (n_shapes, width, 1 + N_ARGS), opened once per process"""
+        if self.packed_vec is None:
+            self.packed_vec = np.load(self.packed_vec_path, mmap_mode='r')
+        return self.packed_vec
+
+    def load_vec(self, index):
+        """cad vector of one shape without padding, (len, 1 + N_ARGS)"""
+        if self.use_packed:
+            self.open_packed()
+            return np.asarray(self.packed_vec[index, :self.packed_len[index]], dtype=np.int64)
+
+        h5_path = os.path.join(self.raw_data, self.all_data[index] + ".h5")
         with h5py.File(h5_path, "r") as fp:
             cad_vec = fp["vec"][:] # (len, 1 + N_ARGS)
+        return cad_vec
+
+    def get_lengths(self):
+        """true (unpadded) sequence length of every shape"""
+        if self.use_packed:
+            return np.asarray(self.packed_len, dtype=np.int64)
+        return np.array([len(self.load_vec(i)) for i in range(len(self.all_data))], dtype=np.int64)
+
+    def build_segment_table(self):
+        """flattened table of every shape's sketch-extrude segments, used by the mixing augmentation.
+        Returns (rows, seg_start, seg_len, shape_seg_offset): segment j spans rows[seg_start[j]:seg_start[j] + seg_len[j]],
+        and the segments of shape i are j in [shape_seg_offset[i], shape_seg_offset[i + 1])."""
+        if self.use_packed:
+            # a memory map of its own, the dataset must not hold an open one when it is sent to the workers
+            packed_vec = np.load(self.packed_vec_path, mmap_mode='r')
+            n_shapes, width = packed_vec.shape[:2]
+            rows = packed_vec.reshape(n_shapes * width, -1) # padding rows are EOS, never Ext
+            shape_row_start = np.arange(n_shapes, dtype=np.int64) * width
+        else:
+            all_vecs = [self.load_vec(i) for i in range(len(self.all_data))]
+            shape_row_start = np.cumsum([0] + [len(v) for v in all_vecs[:-1]]).astype(np.int64)
+            rows = np.concatenate(all_vecs, axis=0).astype(np.int16)
+
+        ext_rows = np.where(np.asarray(rows[:, 0]) == EXT_IDX)[0]
+        seg_shape = np.searchsorted(shape_row_start, ext_rows, side='right') - 1
+        seg_end = ext_rows + 1
+        first_in_shape = np.ones(len(ext_rows), dtype=bool)
+        first_in_shape[1:] = seg_shape[1:] != seg_shape[:-1]
+        prev_end = np.concatenate([[0], seg_end[:-1]])
+        seg_start = np.where(first_in_shape, shape_row_start[seg_shape], prev_end)
+        seg_len = seg_end - seg_start
+        shape_seg_offset = np.concatenate([[0], np.cumsum(np.bincount(seg_shape, minlength=len(shape_row_start)))])
+        return rows, seg_start, seg_len, shape_seg_offset
+
+    def __getitem__(self, index):
+        data_id = self.all_data[index]
+        cad_vec = self.load_vec(index)
 
         if self.aug and self.phase == "train":
-            command1 = cad_vec[:, 0]
-            ext_indices1 = np.where(command1 == EXT_IDX)[0]
-            # if len(ext_indices1) > 1 and random.randint(0, 1) == 1:
-            if len(ext_indices1) > 1 and random.uniform(0, 1) > 0.5:
-                ext_vec1 = np.split(cad_vec, ext_indices1 + 1, axis=0)[:-1]
-
-                data_id2 = self.all_data[random.randint(0, len(self.all_data) - 1)]
-                h5_path2 = os.path.join(self.raw_data, data_id2 + ".h5")
-                with h5py.File(h5_path2, "r") as fp:
-                    cad_vec2 = fp["vec"][:]
-                command2 = cad_vec2[:, 0]
-                ext_indices2 = np.where(command2 == EXT_IDX)[0]
-                ext_vec2 = np.split(cad_vec2, ext_indices2 + 1, axis=0)[:-1]
-
-                n_replace = random.randint(1, min(len(ext_vec1) - 1, len(ext_vec2)))
-                old_idx = sorted(random.sample(list(range(len(ext_vec1))), n_replace))
-                new_idx = sorted(random.sample(list(range(len(ext_vec2))), n_replace))
-                for i in range(len(old_idx)):
-                    ext_vec1[old_idx[i]] = ext_vec2[new_idx[i]]
-
-                sum_len = 0
-                new_vec = []
-                for i in range(len(ext_vec1)):
-                    sum_len += len(ext_vec1[i])
-                    if sum_len > self.max_total_len:
-                        break
-                    new_vec.append(ext_vec1[i])
-                cad_vec = np.concatenate(new_vec, axis=0)
+            if self.use_packed:
+                packed_vec = self.open_packed()
+                rows = packed_vec.reshape(packed_vec.shape[0] * packed_vec.shape[1], -1)
+            else:
+                rows = self.seg_rows
+            seg_start, seg_len, shape_seg_offset = self.seg_table
+            n_ext1 = int(shape_seg_offset[index + 1] - shape_seg_offset[index])
+            # if n_ext1 > 1 and random.randint(0, 1) == 1:
+            if n_ext1 > 1 and random.uniform(0, 1) > 0.5:
+                index2 = random.randint(0, len(self.all_data) - 1)
+                n_ext2 = int(shape_seg_offset[index2 + 1] - shape_seg_offset[index2])
+
+                n_replace = random.randint(1, min(n_ext1 - 1, n_ext2))
+                old_idx = sorted(random.sample(list(range(n_ext1)), n_replace))
+                new_idx = sorted(random.sample(list(range(n_ext2)), n_replace))
+                segs = np.arange(shape_seg_offset[index], shape_seg_offset[index + 1])
+                segs[old_idx] = shape_seg_offset[index2] + np.array(new_idx)
+
+                # keep the leading segments that fit in max_total_len, then gather their rows in one go
+                lens = seg_len[segs]
+                ends = np.cumsum(lens)
+                keep = ends <= self.max_total_len
+                lens, ends = lens[keep], ends[keep]
+                row_idx = np.repeat(seg_start[segs[keep]] - (ends - lens), lens) + np.arange(ends[-1])
+                cad_vec = np.asarray(rows[row_idx], dtype=np.int64)
 
         pad_len = self.max_total_len - cad_vec.shape[0]
         cad_vec = np.concatenate([cad_vec, EOS_VEC[np.newaxis].repeat(pad_len, axis=0)], axis=0)
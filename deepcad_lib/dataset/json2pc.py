@@ -50,7 +50,7 @@ def process_one(data_id):
         return None
 
     try:
-        out_pc = CADsolid2pc(shape, N_POINTS, data_id.split("/")[-1])
+        out_pc = CADsolid2pc(shape, N_POINTS, data_id.split("/")[-1], backend=args.backend)
     except Exception as e:
         print("convert point cloud failed:", data_id)
         return None
@@ -71,6 +71,7 @@ with open(RECORD_FILE, "r") as fp:
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--only_test', action="store_true", help="only convert test data")
+parser.add_argument('--backend', type=str, default='mesh', choices=['mesh', 'brep'], help="sample a tessellation or the exact B-rep faces")
 args = parser.parse_args()
 
 if not args.only_test:
@@ -6,6 +6,7 @@ from joblib import Parallel, delayed
 import sys
 sys.path.append("..")
 from cadlib.extrude import CADSequence
+from cadlib.sequence_arrays import CADSequenceArrays
 from cadlib.macro import *
 
 DATA_ROOT = "../data"
@@ -18,37 +19,81 @@ if not os.path.exists(SAVE_DIR):
     os.makedirs(SAVE_DIR)
 
 
-def process_one(data_id):
-    json_path = os.path.join(RAW_DATA, data_id + ".json")
-    with open(json_path, "r") as fp:
-        data = json.load(fp)
+def process_chunk(data_ids):
+    """convert a chunk of shapes; normalization, quantization and vectorization run on the whole chunk at once.
+    If that fails, the shapes of the chunk are converted one at a time so that only the bad ones are lost."""
+    cad_seqs, seq_ids = [], []
+    for data_id in data_ids:
+        json_path = os.path.join(RAW_DATA, data_id + ".json")
+        with open(json_path, "r") as fp:
+            data = json.load(fp)
+        try:
+            cad_seqs.append(CADSequence.from_dict(data))
+            seq_ids.append(data_id)
+        except Exception as e:
+            print("failed:", data_id)
+    if len(cad_seqs) == 0:
+        return
 
     try:
-        cad_seq = CADSequence.from_dict(data)
-        cad_seq.normalize()
-        cad_seq.numericalize()
-        cad_vec = cad_seq.to_vector(MAX_N_EXT, MAX_N_LOOPS, MAX_N_CURVES, MAX_TOTAL_LEN, pad=False)
-
+        results = vectorize(cad_seqs, seq_ids)
     except Exception as e:
-        print("failed:", data_id)
-        return
+        results = []
+        for cad_seq, data_id in zip(cad_seqs, seq_ids):
+            try:
+                results.extend(vectorize([cad_seq], [data_id]))
+            except Exception as e:
+                print("failed:", data_id)
 
-    if MAX_TOTAL_LEN < cad_vec.shape[0] or cad_vec is None:
-        print("exceed length condition:", data_id, cad_vec.shape[0])
-        return
+    for data_id, cad_vec in results:
+        if cad_vec is None or MAX_TOTAL_LEN < cad_vec.shape[0]:
+            print("exceed length condition:", data_id, None if cad_vec is None else cad_vec.shape[0])
+            continue
+
+        save_path = os.path.join(SAVE_DIR, data_id + ".h5")
+        truck_dir = os.path.dirname(save_path)
+        if not os.path.exists(truck_dir):
+            os.makedirs(truck_dir)
+
+        with h5py.File(save_path, 'w') as fp:
+            fp.create_dataset("vec", data=cad_vec, dtype=np.int)
+
+
+def vectorize(cad_seqs, seq_ids):
+    """(data_id, cad_vec) of the shapes that normalize to finite extrude parameters"""
+    cad = CADSequenceArrays.from_cad_sequences(cad_seqs)
+    cad.normalize()
+    # numericalize requires finite extents within [-2, 2]
+    bad_ext = invalid_extrudes(cad)
+    if bad_ext.any():
+        bad = set(np.searchsorted(cad.seq_ext_offsets, np.flatnonzero(bad_ext), side='right') - 1)
+        for i in sorted(bad):
+            print("failed:", seq_ids[i])
+        cad_seqs = [seq for i, seq in enumerate(cad_seqs) if i not in bad]
+        seq_ids = [data_id for i, data_id in enumerate(seq_ids) if i not in bad]
+        if len(cad_seqs) == 0:
+            return []
+        cad = CADSequenceArrays.from_cad_sequences(cad_seqs)
+        cad.normalize()
+    cad.numericalize()
+    cad_vecs = cad.to_vectors(MAX_N_EXT, MAX_N_LOOPS, MAX_N_CURVES, MAX_TOTAL_LEN, pad=False)
+    return list(zip(seq_ids, cad_vecs))
 
-    save_path = os.path.join(SAVE_DIR, data_id + ".h5")
-    truck_dir = os.path.dirname(save_path)
-    if not os.path.exists(truck_dir):
-        os.makedirs(truck_dir)
 
-    with h5py.File(save_path, 'w') as fp:
-        fp.create_dataset("vec", data=cad_vec, dtype=np.int)
+def invalid_extrudes(cad):
+    """extrudes with non-finite parameters (NaN passes a plain range check) or extents outside [-2, 2]"""
+    bad = ~np.isfinite(cad.extent_one) | ~np.isfinite(cad.extent_two) | \
+          (np.abs(cad.extent_one) > 2.0) | (np.abs(cad.extent_two) > 2.0)
+    for values in (cad.origin, cad.plane, cad.sketch_pos, cad.sketch_size[:, None]):
+        bad |= ~np.isfinite(values).all(axis=1)
+    return bad
 
 
 with open(RECORD_FILE, "r") as fp:
     all_data = json.load(fp)
 
-Parallel(n_jobs=10, verbose=2)(delayed(process_one)(x) for x in all_data["train"])
-Parallel(n_jobs=10, verbose=2)(delayed(process_one)(x) for x in all_data["validation"])
-Parallel(n_jobs=10, verbose=2)(delayed(process_one)(x) for x in all_data["test"])
+CHUNK_SIZE = 256
+for phase in ["train", "validation", "test"]:
+    data_ids = all_data[phase]
+    chunks = [data_ids[i:i + CHUNK_SIZE] for i in range(0, len(data_ids), CHUNK_SIZE)]
+    Parallel(n_jobs=10, verbose=2)(delayed(process_chunk)(x) for x in chunks)
@@ -1,14 +1,19 @@
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import numpy as np
 import h5py
+from .loader import make_dataloader
 
 
 def get_dataloader(cfg):
     dataset = LGANDataset(cfg.data_root)
-    dataloader = DataLoader(dataset, batch_size=cfg.batch_size, shuffle=True,
-                              num_workers=cfg.num_workers, worker_init_fn=np.random.seed(), drop_last=True)
-    return dataloader
+    return make_dataloader(dataset, cfg, shuffle=True, drop_last=True)
+
+
+def get_device_sampler(cfg):
+    """endless shuffled batches of latent codes kept on the training device, used instead of get_dataloader"""
+    dataset = LGANDataset(cfg.data_root)
+    return DeviceBatchSampler(dataset.data, cfg.batch_size, cfg.device)
 
 
 class LGANDataset(Dataset):
@@ -24,3 +29,29 @@ class LGANDataset(Dataset):
 
     def __len__(self):
         return len(self.data)
+
+
+class DeviceBatchSampler(object):
+    """Iterator of random batches drawn directly from a tensor on the training device, with no workers,
+    collation or host-to-device copies. Each pass over the data follows a new random permutation and, as with
+    drop_last=True, the incomplete last batch of a pass is skipped. It never stops, like cycle(dataloader).
+    """
+    def __init__(self, data, batch_size, device):
+        self.data = torch.as_tensor(data, dtype=torch.float32).to(device)
+        self.batch_size = batch_size
+        self.perm = None
+        self.pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.perm is None or self.pos + self.batch_size > len(self.data):
+            self.perm = torch.randperm(len(self.data), device=self.data.device)
+            self.pos = 0
+        index = self.perm[self.pos:self.pos + self.batch_size]
+        self.pos += self.batch_size
+        return self.data.index_select(0, index)
+
+    def __len__(self):
+        return len(self.data) // self.batch_size
@@ -0,0 +1,26 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+
+def seed_worker(worker_id):
+    """seed numpy in every DataLoader worker from its torch seed (torch and python random are already seeded
+    per worker by DataLoader), so that workers do not produce identical random augmentation"""
+    np.random.seed(torch.initial_seed() % 2 ** 32)
+
+
+def make_dataloader(dataset, config, shuffle=False, sampler=None, batch_sampler=None, collate_fn=None,
+                    drop_last=False):
+    """DataLoader with the settings shared by all datasets: per-worker seeding, persistent workers,
+    config.prefetch_factor batches prefetched per worker, and pinned memory when training on GPU.
+    Either batch_sampler, or config.batch_size with shuffle/sampler/drop_last, defines the batches."""
+    kwargs = {}
+    if config.num_workers > 0:
+        kwargs.update(worker_init_fn=seed_worker, persistent_workers=True, prefetch_factor=config.prefetch_factor)
+    if batch_sampler is not None:
+        kwargs.update(batch_sampler=batch_sampler)
+    else:
+        kwargs.update(batch_size=config.batch_size, shuffle=shuffle and sampler is None, sampler=sampler,
+                      drop_last=drop_last)
+    return DataLoader(dataset, num_workers=config.num_workers, collate_fn=collate_fn,
+                      pin_memory=config.device.type == 'cuda', **kwargs)
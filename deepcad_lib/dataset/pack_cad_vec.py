@@ -0,0 +1,67 @@
+import os
+import json
+import argparse
+import numpy as np
+import h5py
+from tqdm import tqdm
+import sys
+sys.path.append("..")
+from cadlib.macro import *
+from dataset.cad_dataset import packed_split_paths
+
+
+def pack_split(data_root, phase):
+    """pack all cad vectors of one split into a single padded int16 array ([N, MAX_TOTAL_LEN, 1 + N_ARGS]),
+    a lengths array and an id index, so that CADDataset can memory-map them instead of opening one h5 per shape."""
+    raw_data = os.path.join(data_root, "cad_vec")
+    with open(os.path.join(data_root, "train_val_test_split.json"), "r") as fp:
+        all_data = json.load(fp)[phase]
+
+    vec_path, len_path, ids_path = packed_split_paths(data_root, phase)
+    os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+
+    packed = np.lib.format.open_memmap(vec_path, mode='w+', dtype=np.int16,
+                                       shape=(len(all_data), MAX_TOTAL_LEN, 1 + N_ARGS))
+    lengths = np.zeros(len(all_data), dtype=np.int16)
+    ids = []
+    n = 0
+    for data_id in tqdm(all_data, desc=phase):
+        h5_path = os.path.join(raw_data, data_id + ".h5")
+        if not os.path.exists(h5_path):
+            print("missing:", data_id)
+            continue
+        with h5py.File(h5_path, "r") as fp:
+            cad_vec = fp["vec"][:]
+        if cad_vec.shape[0] > MAX_TOTAL_LEN:
+            print("exceed length condition:", data_id, cad_vec.shape[0])
+            continue
+
+        packed[n, :cad_vec.shape[0]] = cad_vec
+        packed[n, cad_vec.shape[0]:] = EOS_VEC
+        lengths[n] = cad_vec.shape[0]
+        ids.append(data_id)
+        n += 1
+    packed.flush()
+    del packed
+
+    if n < len(all_data):
+        # drop the unused tail rows left by skipped shapes
+        full = np.load(vec_path, mmap_mode='r')
+        np.save(vec_path + ".tmp.npy", full[:n])
+        del full
+        os.replace(vec_path + ".tmp.npy", vec_path)
+
+    np.save(len_path, lengths[:n])
+    with open(ids_path, "w") as fp:
+        json.dump(ids, fp)
+    print("packed {} {}/{} shapes into {}".format(phase, n, len(all_data), vec_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_root', type=str, default="../data", help="path to source data folder")
+    parser.add_argument('--phases', type=str, nargs='+', default=['train', 'validation', 'test'])
+    args = parser.parse_args()
+
+    for phase in args.phases:
+        pack_split(args.data_root, phase)
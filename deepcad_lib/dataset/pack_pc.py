@@ -0,0 +1,59 @@
+import os
+import json
+import argparse
+import numpy as np
+import h5py
+from tqdm import tqdm
+import sys
+sys.path.append("..")
+from utils.pc_utils import read_ply, packed_pc_paths
+
+
+def pack_split(pc_root, split_path, zs_path, out_dir, phase, with_normal=False, dtype="float32"):
+    """pack the point clouds of one split into a single flat buffer plus an offsets table.
+    Only shapes whose ply file exists are kept; `rows` records their row in `{phase}_zs` of zs_path,
+    so that ShapeCodesDataset never has to skip missing files at load time."""
+    with open(split_path, "r") as fp:
+        all_data = json.load(fp)[phase]
+    with h5py.File(zs_path, 'r') as fp:
+        n_zs = fp["{}_zs".format(phase)].shape[0]
+
+    paths = packed_pc_paths(out_dir, phase)
+    n_channels = 6 if with_normal else 3
+    offsets = [0]
+    rows = []
+    ids = []
+    with open(paths["points"], "wb") as out_fp:
+        for row, data_id in enumerate(tqdm(all_data[:n_zs], desc=phase)):
+            pc_path = os.path.join(pc_root, data_id + '.ply')
+            if not os.path.exists(pc_path):
+                continue
+            pc = read_ply(pc_path, with_normal=with_normal).astype(dtype)
+            pc.tofile(out_fp)
+            offsets.append(offsets[-1] + pc.shape[0])
+            rows.append(row)
+            ids.append(data_id)
+
+    np.save(paths["offsets"], np.array(offsets, dtype=np.int64))
+    np.save(paths["rows"], np.array(rows, dtype=np.int64))
+    with open(paths["ids"], "w") as fp:
+        json.dump(ids, fp)
+    with open(paths["meta"], "w") as fp:
+        json.dump({"dtype": dtype, "n_channels": n_channels, "with_normal": with_normal}, fp)
+    print("packed {} {}/{} point clouds into {}".format(phase, len(rows), n_zs, paths["points"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pc_root', type=str, required=True, help="path to point clouds data folder")
+    parser.add_argument('--split_path', type=str, default="../data/train_val_test_split.json", help="path to train-val-test split")
+    parser.add_argument('--zs_path', type=str, required=True, help="path to all_zs_ckpt*.h5 the clouds are aligned to")
+    parser.add_argument('-o', '--out_dir', type=str, required=True, help="output folder for the packed store")
+    parser.add_argument('--phases', type=str, nargs='+', default=['train', 'validation', 'test'])
+    parser.add_argument('--with_normal', action='store_true', help="also pack point normals")
+    parser.add_argument('--dtype', type=str, default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for phase in args.phases:
+        pack_split(args.pc_root, args.split_path, args.zs_path, args.out_dir, phase, args.with_normal, args.dtype)
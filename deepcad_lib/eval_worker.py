@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import random
+import numpy as np
+import torch
+from dataset.cad_dataset import get_dataloader
+from config import ConfigAE
+from trainer import TrainerAE
+from cadlib.macro import EOS_IDX
+
+
+def list_checkpoints(model_dir):
+    """(modification time, name) of saved checkpoints, oldest first. name is what load_ckpt accepts."""
+    ckpts = []
+    for fname in os.listdir(model_dir):
+        match = re.match(r"(?:ckpt_epoch(\d+)|(latest))\.pth$", fname)
+        if match is None:
+            continue
+        try:
+            mtime = os.path.getmtime(os.path.join(model_dir, fname))
+        except FileNotFoundError: # pruned meanwhile
+            continue
+        ckpts.append((mtime, match.group(1) or match.group(2)))
+    return sorted(ckpts)
+
+
+def chamfer_distance(tr_agent, cfg, n_shapes):
+    """median chamfer distance between reconstructed solids and ground-truth point clouds
+    of the first n_shapes validation shapes, and the ratio of reconstructions that failed to build"""
+    from cadlib.visualize import create_CAD, CADsolid2pc
+    from cadlib.vector_batch import parse_cad_vectors
+    from cadlib.validate import validate_vectors, is_valid
+    from cadlib.shape_cache import extrude_cache
+    from evaluation.evaluate_ae_cd import chamfer_dist, normalize_pc
+    from utils import read_ply
+
+    dists = []
+    n_failed = 0
+    for data in get_dataloader('validation', cfg, shuffle=False, distributed=False):
+        if len(dists) + n_failed >= n_shapes:
+            break
+        with torch.no_grad():
+            outputs, _ = tr_agent.forward(data)
+            batch_out_vec = tr_agent.logits2vec(outputs)
+        gt_commands = data['command'].numpy()
+        seq_lens = [gt_commands[j].tolist().index(EOS_IDX) for j in range(batch_out_vec.shape[0])]
+        out_vecs = [batch_out_vec[j][:seq_lens[j]].astype(np.float64) for j in range(batch_out_vec.shape[0])]
+        cad_batch = parse_cad_vectors(out_vecs, is_numerical=True)
+        batch_issues = validate_vectors(out_vecs, is_numerical=True)
+
+        for j in range(batch_out_vec.shape[0]):
+            if len(dists) + n_failed >= n_shapes:
+                break
+            gt_pc_path = os.path.join(cfg.pc_root, data["id"][j] + '.ply')
+            if not os.path.exists(gt_pc_path):
+                continue
+            if not is_valid(batch_issues[j]): # would fail in OpenCASCADE anyway
+                n_failed += 1
+                continue
+            try:
+                shape = create_CAD(cad_batch.to_cad_sequence(j), cache=extrude_cache)
+                out_pc = CADsolid2pc(shape, cfg.n_points, data["id"][j])
+            except Exception:
+                n_failed += 1
+                continue
+            if np.max(np.abs(out_pc)) > 2: # normalize out-of-bound data
+                out_pc = normalize_pc(out_pc)
+
+            gt_pc = read_ply(gt_pc_path)
+            gt_pc = gt_pc[random.sample(list(range(gt_pc.shape[0])), cfg.n_points)]
+            dists.append(chamfer_dist(gt_pc, out_pc))
+
+    n_total = max(len(dists) + n_failed, 1)
+    return (np.median(dists) if len(dists) > 0 else float('nan')), n_failed / n_total
+
+
+def evaluate_checkpoint(tr_agent, cfg, val_loader):
+    """validation loss, argument accuracy and optionally chamfer distance of the loaded checkpoint,
+    written to the eval worker's tensorboard log (eval.events). Losses and chamfer distance are logged at the
+    training iteration (clock.step), as the trainer logs its losses, so that the curves line up"""
+    step = tr_agent.clock.step
+
+    losses = tr_agent.validate(val_loader)
+    for k, v in losses.items():
+        tr_agent.val_tb.add_scalar(k, v, step)
+
+    tr_agent.evaluate(val_loader)
+
+    if cfg.cd_samples > 0:
+        cd, invalid_ratio = chamfer_distance(tr_agent, cfg, cfg.cd_samples)
+        tr_agent.val_tb.add_scalar("chamfer_distance", cd, step)
+        tr_agent.val_tb.add_scalar("invalid_ratio", invalid_ratio, step)
+    tr_agent.val_tb.flush()
+    print("evaluated epoch {} step {}:".format(tr_agent.clock.epoch, step), losses)
+
+
+def main():
+    """Evaluate checkpoints of a training run in a separate process, so that training (with --external_eval)
+    never stops for validation. Each new or updated checkpoint in the model folder is evaluated once per training step.
+    e.g. python eval_worker.py --exp_name newDeepCAD -g 1
+    """
+    cfg = ConfigAE('eval')
+    tr_agent = TrainerAE(cfg)
+    val_loader = get_dataloader('validation', cfg, shuffle=False, distributed=False)
+
+    seen_mtime = {}
+    evaluated_steps = set()
+    while True:
+        for mtime, name in list_checkpoints(cfg.model_dir):
+            if seen_mtime.get(name) == mtime:
+                continue
+            seen_mtime[name] = mtime
+            tr_agent.load_ckpt(name)
+            # ckpt_epochN and latest of the same epoch are evaluated once
+            if tr_agent.clock.step in evaluated_steps:
+                continue
+            evaluate_checkpoint(tr_agent, cfg, val_loader)
+            evaluated_steps.add(tr_agent.clock.step)
+
+        if cfg.once:
+            break
+        time.sleep(cfg.poll_interval)
+
+
+if __name__ == '__main__':
+    main()
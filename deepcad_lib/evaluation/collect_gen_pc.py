@@ -8,11 +8,14 @@ import sys
 sys.path.append("..")
 from utils import write_ply
 from cadlib.visualize import vec2CADsolid, CADsolid2pc
+from cadlib.validate import validate_vector, is_valid, format_issues
+from cadlib.shape_cache import extrude_cache
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--src', type=str, default=None, required=True)
 parser.add_argument('--n_points', type=int, default=2000)
+parser.add_argument('--backend', type=str, default='mesh', choices=['mesh', 'brep'], help="sample a tessellation or the exact B-rep faces")
 args = parser.parse_args()
 
 SAVE_DIR = args.src + '_pc'
@@ -30,14 +33,19 @@ def process_one(path):
     with h5py.File(path, 'r') as fp:
         out_vec = fp["out_vec"][:].astype(np.float)
 
+    issues = validate_vector(out_vec)
+    if not is_valid(issues):
+        print("invalid CAD vector", data_id, format_issues(issues))
+        return None
+
     try:
-        shape = vec2CADsolid(out_vec)
+        shape = vec2CADsolid(out_vec, cache=extrude_cache)
     except Exception as e:
         print("create_CAD failed", data_id)
         return None
 
     try:
-        out_pc = CADsolid2pc(shape, args.n_points, data_id)
+        out_pc = CADsolid2pc(shape, args.n_points, data_id, backend=args.backend)
     except Exception as e:
         print("convert pc failed:", data_id)
         return None
@@ -12,7 +12,7 @@ from scipy.stats import entropy
 from sklearn.neighbors import NearestNeighbors
 import sys
 sys.path.append("..")
-from utils import read_ply
+from utils import read_ply, set_visible_gpus, get_device
 
 N_POINTS = 2000
 
@@ -271,7 +271,7 @@ def collect_src_pcs(args):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--src", type=str)
-    parser.add_argument('-g', '--gpu_ids', type=str, default=0, help="gpu to use, e.g. 0  0,1,2. CPU not supported.")
+    parser.add_argument('-g', '--gpu_ids', type=str, default=0, help="gpu to use, e.g. 0  0,1,2. Use cpu (or -1) to run on CPU.")
     parser.add_argument("--n_test", type=int, default=1000)
     parser.add_argument("--multi", type=int, default=3)
     parser.add_argument("--times", type=int, default=3)
@@ -281,7 +281,8 @@ def main():
 
     print("n_test: {}, multiplier: {}, repeat times: {}".format(args.n_test, args.multi, args.times))
 
-    os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
+    set_visible_gpus(args.gpu_ids)
+    device = get_device(args.gpu_ids)
 
     if args.output is None:
         args.output = args.src + '_eval_gen.txt'
@@ -296,8 +297,8 @@ def main():
 
         jsd = jsd_between_point_cloud_sets(sample_pcs, ref_pcs, in_unit_sphere=False)
 
-        sample_pcs = torch.tensor(sample_pcs).cuda()
-        ref_pcs = torch.tensor(ref_pcs).cuda()
+        sample_pcs = torch.tensor(sample_pcs).to(device)
+        ref_pcs = torch.tensor(ref_pcs).to(device)
         result = compute_cov_mmd(sample_pcs, ref_pcs, batch_size=args.batch_size)
         result.update({"JSD": jsd})
 
@@ -4,7 +4,7 @@ import h5py
 from utils import ensure_dir
 from config import ConfigLGAN
 from trainer import TrainerLatentWGAN
-from dataset.lgan_dataset import get_dataloader
+from dataset.lgan_dataset import get_device_sampler
 
 
 cfg = ConfigLGAN()
@@ -16,8 +16,8 @@ if not cfg.test:
     if cfg.cont:
         agent.load_ckpt(cfg.ckpt)
 
-    # create dataloader
-    train_loader = get_dataloader(cfg)
+    # sample batches directly from the latent codes on the training device
+    train_loader = get_device_sampler(cfg)
 
     agent.train(train_loader)
 else:
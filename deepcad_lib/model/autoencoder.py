@@ -1,8 +1,9 @@
+import torch.nn.functional as F
 from .layers.transformer import *
 from .layers.improved_transformer import *
 from .layers.positional_encoding import *
 from .model_utils import _make_seq_first, _make_batch_first, \
-    _get_padding_mask, _get_key_padding_mask, _get_group_mask
+    _get_padding_mask, _get_key_padding_mask, _get_group_mask, _get_segment_attn_mask
 
 
 class CADEmbedding(nn.Module):
@@ -25,7 +26,7 @@ class CADEmbedding(nn.Module):
 
         self.pos_encoding = PositionalEncodingLUT(cfg.d_model, max_len=seq_len+2)
 
-    def forward(self, commands, args, groups=None):
+    def forward(self, commands, args, groups=None, positions=None):
         S, N = commands.shape
 
         src = self.command_embed(commands.long()) + \
@@ -34,7 +35,7 @@ class CADEmbedding(nn.Module):
         if self.use_group:
             src = src + self.group_embed(groups.long())
 
-        src = self.pos_encoding(src)
+        src = self.pos_encoding(src, positions)
 
         return src
 
@@ -59,8 +60,9 @@ class Encoder(nn.Module):
     def __init__(self, cfg):
         super().__init__()
 
-        seq_len = cfg.max_total_len
+        seq_len = max(cfg.max_total_len, cfg.pack_len) if cfg.pack else cfg.max_total_len
         self.use_group = cfg.use_group_emb
+        self.n_heads = cfg.n_heads
         self.embedding = CADEmbedding(cfg, seq_len, use_group=self.use_group)
 
         encoder_layer = TransformerEncoderLayerImproved(cfg.d_model, cfg.n_heads, cfg.dim_feedforward, cfg.dropout)
@@ -78,6 +80,32 @@ class Encoder(nn.Module):
         z = (memory * padding_mask).sum(dim=0, keepdim=True) / padding_mask.sum(dim=0, keepdim=True) # (1, N, dim_z)
         return z
 
+    def forward_packed(self, commands, args, segment_ids, positions, n_segments):
+        """encode packed rows, each holding several sequences (without their EOS padding) back to back.
+
+        Args:
+            commands, args, segment_ids, positions: Shape [S, R, ...], segment id -1 marks padding
+            n_segments: number of packed sequences N
+        Returns:
+            z: Shape [1, N, d_model], one latent per segment
+        """
+        group_mask = _get_group_mask(commands, seq_dim=0, segment_ids=segment_ids) if self.use_group else None
+        attn_mask = _get_segment_attn_mask(segment_ids, self.n_heads, seq_dim=0)
+
+        src = self.embedding(commands, args, group_mask, positions)
+
+        memory = self.encoder(src, mask=attn_mask, src_key_padding_mask=None)
+
+        # masked mean pooling per segment
+        seg = segment_ids.reshape(-1)
+        valid = seg >= 0
+        memory = memory.reshape(-1, memory.size(-1))[valid]
+        seg = seg[valid]
+        z = memory.new_zeros(n_segments, memory.size(-1)).index_add_(0, seg, memory)
+        counts = torch.bincount(seg, minlength=n_segments).clamp_(min=1).unsqueeze(-1)
+        z = z / counts.to(z.dtype)
+        return z.unsqueeze(0)
+
 
 class FCN(nn.Module):
     def __init__(self, d_model, n_commands, n_args, args_dim=256):
@@ -89,16 +117,46 @@ class FCN(nn.Module):
         self.command_fcn = nn.Linear(d_model, n_commands)
         self.args_fcn = nn.Linear(d_model, n_args * args_dim)
 
-    def forward(self, out):
+    def forward(self, out, args_mask=None):
         S, N, _ = out.shape
 
         command_logits = self.command_fcn(out)  # Shape [S, N, n_commands]
 
+        if args_mask is not None:
+            return command_logits, self.masked_args_logits(out, args_mask)
+
         args_logits = self.args_fcn(out)  # Shape [S, N, n_args * args_dim]
         args_logits = args_logits.reshape(S, N, self.n_args, self.args_dim)  # Shape [S, N, n_args, args_dim]
 
         return command_logits, args_logits
 
+    def masked_args_logits(self, out, args_mask):
+        """argument logits of only the (position, arg) pairs selected by args_mask, projected arg by arg,
+        so the full [S, N, n_args, args_dim] tensor is never materialized.
+
+        Args:
+            out: Shape [S, N, d_model]
+            args_mask: bool, Shape [N, S', n_args] with S' <= S
+        Returns:
+            Shape [P, args_dim], in the same order as args_logits[args_mask] on the full logits
+        """
+        h = out[:args_mask.size(1)].transpose(0, 1)  # Shape [N, S', d_model]
+        idx = args_mask.nonzero(as_tuple=False)
+        if idx.size(0) == 0:
+            return out.new_zeros(0, self.args_dim)
+
+        weight = self.args_fcn.weight.view(self.n_args, self.args_dim, -1)
+        bias = self.args_fcn.bias.view(self.n_args, self.args_dim)
+        parts, order = [], []
+        for a in range(self.n_args):
+            sel = (idx[:, 2] == a).nonzero(as_tuple=True)[0]
+            if sel.numel() == 0:
+                continue
+            parts.append(F.linear(h[idx[sel, 0], idx[sel, 1]], weight[a], bias[a]))
+            order.append(sel)
+        args_logits = torch.cat(parts, dim=0)
+        return args_logits[torch.argsort(torch.cat(order))]
+
 
 class Decoder(nn.Module):
     def __init__(self, cfg):
@@ -113,11 +171,11 @@ class Decoder(nn.Module):
         args_dim = cfg.args_dim + 1
         self.fcn = FCN(cfg.d_model, cfg.n_commands, cfg.n_args, args_dim)
 
-    def forward(self, z):
+    def forward(self, z, args_mask=None):
         src = self.embedding(z)
         out = self.decoder(src, z, tgt_mask=None, tgt_key_padding_mask=None)
 
-        command_logits, args_logits = self.fcn(out)
+        command_logits, args_logits = self.fcn(out, args_mask)
 
         out_logits = (command_logits, args_logits)
         return out_logits
@@ -147,10 +205,19 @@ class CADTransformer(nn.Module):
         self.decoder = Decoder(cfg)
 
     def forward(self, commands_enc, args_enc,
-                z=None, return_tgt=True, encode_mode=False):
+                z=None, return_tgt=True, encode_mode=False, packed_enc=None, args_mask=None):
+        """packed_enc: optional dict with batch-first "command", "args", "segment_ids" and "positions" of packed rows.
+        If given, the encoder runs on the packed rows instead of commands_enc/args_enc, which are still used as targets.
+        args_mask: optional bool [N, S, n_args]. If given, "args_logits" only holds the [P, args_dim] logits
+        of the masked (position, arg) pairs, as needed by CADLoss."""
         commands_enc_, args_enc_ = _make_seq_first(commands_enc, args_enc)  # Possibly None, None
 
-        if z is None:
+        if z is None and packed_enc is not None:
+            packed = _make_seq_first(packed_enc["command"], packed_enc["args"],
+                                     packed_enc["segment_ids"], packed_enc["positions"])
+            z = self.encoder.forward_packed(*packed, n_segments=commands_enc.size(0))
+            z = self.bottleneck(z)
+        elif z is None:
             z = self.encoder(commands_enc_, args_enc_)
             z = self.bottleneck(z)
         else:
@@ -158,13 +225,18 @@ class CADTransformer(nn.Module):
 
         if encode_mode: return _make_batch_first(z)
 
-        out_logits = self.decoder(z)
-        out_logits = _make_batch_first(*out_logits)
+        out_logits = self.decoder(z, args_mask)
+        if args_mask is None:
+            out_logits = _make_batch_first(*out_logits)
+        else:
+            out_logits = (_make_batch_first(out_logits[0]), out_logits[1])
 
         res = {
             "command_logits": out_logits[0],
             "args_logits": out_logits[1]
         }
+        if args_mask is not None:
+            res["args_logits_masked"] = True
 
         if return_tgt:
             res["tgt_commands"] = commands_enc
@@ -37,7 +37,11 @@ class PositionalEncodingLUT(nn.Module):
     def _init_embeddings(self):
         nn.init.kaiming_normal_(self.pos_embed.weight, mode="fan_in")
 
-    def forward(self, x):
-        pos = self.position[:x.size(0)]
+    def forward(self, x, positions=None):
+        """positions: optional (S, N) position of every token, e.g. reset to 0 at the start of each packed segment"""
+        if positions is None:
+            pos = self.position[:x.size(0)]
+        else:
+            pos = positions.long()
         x = x + self.pos_embed(pos)
         return self.dropout(x)
@@ -41,24 +41,52 @@ def _get_padding_mask(commands, seq_dim=0, extended=False):
         if extended:
             # padding_mask doesn't include the final EOS, extend by 1 position to include it in the loss
             S = commands.size(seq_dim)
-            torch.narrow(padding_mask, seq_dim, 3, S-3).add_(torch.narrow(padding_mask, seq_dim, 0, S-3)).clamp_(max=1)
+            if S > 3:
+                torch.narrow(padding_mask, seq_dim, 3, S-3).add_(torch.narrow(padding_mask, seq_dim, 0, S-3)).clamp_(max=1)
 
         if seq_dim == 0:
             return padding_mask.unsqueeze(-1)
         return padding_mask
 
 
-def _get_group_mask(commands, seq_dim=0):
+def _get_group_mask(commands, seq_dim=0, segment_ids=None):
     """
     Args:
         commands: Shape [S, ...]
+        segment_ids: Shape [S, ...], optional. For packed sequences, group ids restart at every new segment.
     """
     with torch.no_grad():
         # group_mask = (commands == SOS_IDX).cumsum(dim=seq_dim)
-        group_mask = (commands == EXT_IDX).cumsum(dim=seq_dim)
+        is_ext = (commands == EXT_IDX).long()
+        group_mask = is_ext.cumsum(dim=seq_dim)
+        if segment_ids is not None:
+            is_start = segment_ids != torch.roll(segment_ids, 1, dims=seq_dim)
+            is_start.index_fill_(seq_dim, torch.tensor([0], device=commands.device), True)
+            # exclusive cumsum is non-decreasing, so cummax carries the value at each segment start forward
+            start_base = torch.where(is_start, group_mask - is_ext, torch.zeros_like(group_mask))
+            group_mask = group_mask - start_base.cummax(dim=seq_dim)[0]
         return group_mask
 
 
+def _get_segment_attn_mask(segment_ids, n_heads, seq_dim=0):
+    """Block-diagonal additive attention mask for packed sequences: tokens only attend within their own segment.
+    Padding positions (segment id -1) attend only to themselves to keep the softmax finite.
+
+    Args:
+        segment_ids: Shape [S, N]
+    Returns:
+        Shape [N * n_heads, S, S]
+    """
+    with torch.no_grad():
+        if seq_dim == 0:
+            segment_ids = segment_ids.transpose(0, 1)
+        S = segment_ids.size(1)
+        same = (segment_ids.unsqueeze(2) == segment_ids.unsqueeze(1)) & (segment_ids.unsqueeze(1) >= 0)
+        same = same | torch.eye(S, dtype=torch.bool, device=segment_ids.device).unsqueeze(0)
+        attn_mask = torch.zeros(same.shape, device=segment_ids.device).masked_fill_(~same, float('-inf'))
+        return attn_mask.repeat_interleave(n_heads, dim=0)
+
+
 def _get_visibility_mask(commands, seq_dim=0):
     """
     Args:
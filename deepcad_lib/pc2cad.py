@@ -2,7 +2,7 @@ import torch.nn as nn
 import torch
 import numpy as np
 import os
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 from tqdm import tqdm
 import argparse
 import h5py
@@ -12,7 +12,10 @@ import random
 import sys
 sys.path.append("..")
 from trainer.base import BaseTrainer
-from utils import cycle, ensure_dirs, ensure_dir, read_ply, write_ply
+from utils import cycle, ensure_dirs, ensure_dir, read_ply, write_ply, PackedPointClouds, set_visible_gpus, get_device, \
+    init_distributed, is_main_process, barrier, get_rank, get_world_size, set_loader_epoch
+from torch.utils.data.distributed import DistributedSampler
+from dataset.loader import make_dataloader
 try:
     from pointnet2_ops.pointnet2_modules import PointnetFPModule, PointnetSAModule
 except Exception as e:
@@ -25,6 +28,7 @@ class Config(object):
     n_points = 2048
     batch_size = 128
     num_workers = 4
+    prefetch_factor = 2 # batches prefetched by each worker
     nr_epochs = 200
     lr = 1e-4
     lr_step_size = 50
@@ -32,27 +36,35 @@ class Config(object):
     grad_clip = None
 
     save_frequency = 100
+    keep_ckpt = 0 # keep only the last x numbered checkpoints, 0 keeps all
+    log_frequency = 10 # average and write training losses/throughput every x steps
     val_frequency = 10
 
     def __init__(self, args):
         self.data_root = os.path.join(args.proj_dir, args.exp_name, "results/all_zs_ckpt{}.h5".format(args.ae_ckpt))
         self.pc_root = args.pc_root
+        self.packed_pc = args.packed_pc
         self.split_path = args.split_path
         self.exp_dir = os.path.join(args.proj_dir, args.exp_name, "pc2cad")
         self.log_dir = os.path.join(self.exp_dir, 'log')
         self.model_dir = os.path.join(self.exp_dir, 'model')
         self.gpu_ids = args.gpu_ids
+        self.device = get_device(args.gpu_ids)
+        init_distributed(self.device, args.dist_backend)
+        self.amp = args.amp
+        self.grad_accum = args.grad_accum
 
-        if (not args.test) and args.cont is not True and os.path.exists(self.exp_dir):
+        if (not args.test) and args.cont is not True and os.path.exists(self.exp_dir) and is_main_process():
             response = input('Experiment log/model already exists, overwrite? (y/n) ')
             if response != 'y':
                 exit()
             shutil.rmtree(self.exp_dir)
+        barrier()
         ensure_dirs([self.log_dir, self.model_dir])
-        if not args.test:
+        if not args.test and is_main_process():
             os.system("cp pc2cad.py {}".format(self.exp_dir))
             with open('{}/config.txt'.format(self.exp_dir), 'w') as f:
-                json.dump(self.__dict__, f, indent=2)
+                json.dump(self.__dict__, f, indent=2, default=str)
 
 
 class PointNet2(nn.Module):
@@ -144,10 +156,10 @@ class PointNet2(nn.Module):
 
 class TrainAgent(BaseTrainer):
     def build_net(self, config):
-        self.net = PointNet2().cuda()
+        self.net = PointNet2().to(config.device)
 
     def set_loss_function(self):
-        self.criterion = nn.MSELoss().cuda()
+        self.criterion = nn.MSELoss().to(self.device)
 
     def set_optimizer(self, config):
         """set optimizer and lr scheduler used in training"""
@@ -155,8 +167,8 @@ class TrainAgent(BaseTrainer):
         self.scheduler = torch.optim.lr_scheduler.StepLR(self.optimizer, config.lr_step_size)
 
     def forward(self, data):
-        points = data["points"].cuda()
-        code = data["code"].cuda()
+        points = data["points"].to(self.device)
+        code = data["code"].to(self.device)
 
         pred_code = self.net(points)
 
@@ -177,7 +189,18 @@ class ShapeCodesDataset(Dataset):
         with h5py.File(self.data_root, 'r') as fp:
             self.zs = fp["{}_zs".format(phase)][:]
 
+        # packed store from dataset/pack_pc.py: only valid shapes, aligned to rows of zs
+        self.store = PackedPointClouds(config.packed_pc, phase) if config.packed_pc is not None else None
+
     def __getitem__(self, index):
+        if self.store is not None:
+            data_id = self.store.ids[index]
+            pc = self.store[index]
+            sample_idx = np.sort(random.sample(range(pc.shape[0]), self.n_points))
+            pc = np.asarray(pc[sample_idx, :3])
+            shape_code = torch.tensor(self.zs[self.store.rows[index]], dtype=torch.float32)
+            return {"points": torch.tensor(pc, dtype=torch.float32), "code": shape_code, "id": data_id}
+
         data_id = self.all_data[index]
         pc_path = os.path.join(self.pc_root, data_id + '.ply')
         if not os.path.exists(pc_path):
@@ -190,6 +213,8 @@ class ShapeCodesDataset(Dataset):
         return {"points": pc, "code": shape_code, "id": data_id}
 
     def __len__(self):
+        if self.store is not None:
+            return len(self.store)
         return len(self.zs)
 
 
@@ -197,8 +222,10 @@ def get_dataloader(phase, config, shuffle=None):
     is_shuffle = phase == 'train' if shuffle is None else shuffle
 
     dataset = ShapeCodesDataset(phase, config)
-    dataloader = DataLoader(dataset, batch_size=config.batch_size, shuffle=is_shuffle, num_workers=config.num_workers)
-    return dataloader
+    sampler = None
+    if get_world_size() > 1:
+        sampler = DistributedSampler(dataset, num_replicas=get_world_size(), rank=get_rank(), shuffle=is_shuffle)
+    return make_dataloader(dataset, config, shuffle=is_shuffle, sampler=sampler)
 
 # 多加的后来
 if __name__ == '__main__':
@@ -206,19 +233,22 @@ if __name__ == '__main__':
     parser.add_argument('--proj_dir', type=str, default="proj_log",
                        help="path to project folder where models and logs will be saved")
     parser.add_argument('--pc_root', type=str, default="path_to_pc_data", help="path to point clouds data folder")
+    parser.add_argument('--packed_pc', type=str, default=None, help="path to packed point clouds from dataset/pack_pc.py, used instead of pc_root")
     parser.add_argument('--split_path', type=str, default="data/train_val_test_split.json", help="path to train-val-test split")
     parser.add_argument('--exp_name', type=str, required=True, help="name of this experiment")
     parser.add_argument('--ae_ckpt', type=str, required=True, help="desired checkpoint to restore")
     parser.add_argument('--continue', dest='cont', action='store_true', help="continue training from checkpoint")
     parser.add_argument('--ckpt', type=str, default='latest', required=False, help="desired checkpoint to restore")
     parser.add_argument('--test',action='store_true', help="test mode")
+    parser.add_argument('--dist_backend', type=str, default=None, choices=['nccl', 'gloo'], help="backend for multi-process training launched with torchrun")
+    parser.add_argument('--amp', type=str, default='none', choices=['none', 'fp16', 'bf16'], help="mixed precision training, bf16 also works on CPU")
+    parser.add_argument('--grad_accum', type=int, default=1, help="accumulate gradients over x steps before each optimizer step")
     parser.add_argument('--n_samples', type=int, default=100, help="number of samples to generate when testing")
     parser.add_argument('-g', '--gpu_ids', type=str, default="0",
-                       help="gpu to use, e.g. 0  0,1,2. CPU not supported.")
+                       help="gpu to use, e.g. 0  0,1,2. Use cpu (or -1) to run on CPU.")
     args = parser.parse_args()
 
-    if args.gpu_ids is not None:
-        os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
+    set_visible_gpus(args.gpu_ids)
 
     cfg = Config(args)
     print("data path:", cfg.data_root)
@@ -238,14 +268,15 @@ if __name__ == '__main__':
         clock = agent.clock
 
         for e in range(clock.epoch, cfg.nr_epochs):
+            set_loader_epoch(train_loader, e)
             # begin iteration
-            pbar = tqdm(train_loader)
+            pbar = tqdm(agent.metrics.timed(train_loader), total=len(train_loader), disable=not is_main_process())
             for b, data in enumerate(pbar):
                 # train step
                 outputs, losses = agent.train_func(data)
 
                 pbar.set_description("EPOCH[{}][{}]".format(e, b))
-                pbar.set_postfix({k: v.item() for k, v in losses.items()})
+                pbar.set_postfix(agent.metrics.last.get('train', {}))
 
                 # validation step
                 if clock.step % cfg.val_frequency == 0:
@@ -2,9 +2,10 @@ import torch.nn as nn
 import torch
 import numpy as np
 import os
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 from tqdm import tqdm
-from utils import TrainClock, cycle, ensure_dirs, ensure_dir
+from utils import TrainClock, cycle, ensure_dirs, ensure_dir, PackedPointClouds, set_visible_gpus, get_device, \
+    MetricsLogger
 import argparse
 import h5py
 import shutil
@@ -14,6 +15,7 @@ from plyfile import PlyData, PlyElement
 import sys
 sys.path.append("..")
 from agent import BaseAgent
+from dataset.loader import make_dataloader
 from pointnet2_ops.pointnet2_modules import PointnetFPModule, PointnetSAModule
 from plyfile import PlyData, PlyElement
 
@@ -31,6 +33,7 @@ class Config(object):
     n_points = 2048
     batch_size = 128
     num_workers = 8
+    prefetch_factor = 2 # batches prefetched by each worker
     nr_epochs = 200
     lr = 1e-4
     lr_step_size = 50
@@ -48,6 +51,8 @@ class Config(object):
         self.log_dir = os.path.join(self.exp_dir, 'log')
         self.model_dir = os.path.join(self.exp_dir, 'model')
         self.gpu_ids = args.gpu_ids
+        self.device = get_device(args.gpu_ids)
+        self.packed_pc = args.packed_pc
 
         if (not args.test) and args.cont is not True and os.path.exists(self.exp_dir):
             response = input('Experiment log/model already exists, overwrite? (y/n) ')
@@ -58,7 +63,7 @@ class Config(object):
         if not args.test:
             os.system("cp pc2cad.py {}".format(self.exp_dir))
             with open('{}/config.txt'.format(self.exp_dir), 'w') as f:
-                json.dump(self.__dict__, f, indent=2)
+                json.dump(self.__dict__, f, indent=2, default=str)
 
 
 class PointNet2(nn.Module):
@@ -186,14 +191,15 @@ class EncoderPointNet(nn.Module):
 
 class TrainAgent(BaseAgent):
     def build_net(self, config):
-        net = PointNet2()
+        self.device = config.device
+        net = PointNet2().to(config.device)
         if len(config.gpu_ids) > 1:
             net = nn.DataParallel(net)
         # net = EncoderPointNet()
         return net
 
     def set_loss_function(self):
-        self.criterion = nn.MSELoss().cuda()
+        self.criterion = nn.MSELoss().to(self.device)
 
     def set_optimizer(self, config):
         """set optimizer and lr scheduler used in training"""
@@ -201,8 +207,8 @@ class TrainAgent(BaseAgent):
         self.scheduler = torch.optim.lr_scheduler.StepLR(self.optimizer, config.lr_step_size)
 
     def forward(self, data):
-        points = data["points"].cuda()
-        code = data["code"].cuda()
+        points = data["points"].to(self.device)
+        code = data["code"].to(self.device)
 
         pred_code = self.net(points)
 
@@ -245,12 +251,24 @@ class ShapeCodesDataset(Dataset):
 
         self.noise = config.noise
 
+        # packed store from dataset/pack_pc.py (--with_normal): only valid shapes, aligned to rows of zs
+        self.store = PackedPointClouds(config.packed_pc, phase) if config.packed_pc is not None else None
+        if self.store is not None:
+            assert self.store.with_normal, "{} was packed without normals, repack it with " \
+                                           "dataset/pack_pc.py --with_normal".format(config.packed_pc)
+
     def __getitem__(self, index):
-        data_id = self.all_data[index]
-        pc_path = os.path.join(self.pc_root, data_id + '.ply')
-        if not os.path.exists(pc_path):
-            return self.__getitem__(index + 1)
-        pc_n = read_ply(pc_path, with_normal=True)
+        if self.store is not None:
+            data_id = self.store.ids[index]
+            pc_n = np.asarray(self.store[index], dtype=np.float32)
+            shape_code = torch.tensor(self.zs[self.store.rows[index]], dtype=torch.float32)
+        else:
+            data_id = self.all_data[index]
+            pc_path = os.path.join(self.pc_root, data_id + '.ply')
+            if not os.path.exists(pc_path):
+                return self.__getitem__(index + 1)
+            pc_n = read_ply(pc_path, with_normal=True)
+            shape_code = torch.tensor(self.zs[index], dtype=torch.float32)
         pc = pc_n[:, :3]
         normal = pc_n[:, -3:]
         sample_idx = random.sample(list(range(pc.shape[0])), self.n_points)
@@ -259,10 +277,11 @@ class ShapeCodesDataset(Dataset):
         normal = normal / (np.linalg.norm(normal, axis=1, keepdims=True) + 1e-6)
         pc = pc + np.random.uniform(-self.noise, self.noise, (pc.shape[0], 1)) * normal
         pc = torch.tensor(pc, dtype=torch.float32)
-        shape_code = torch.tensor(self.zs[index], dtype=torch.float32)
         return {"points": pc, "code": shape_code, "id": data_id}
 
     def __len__(self):
+        if self.store is not None:
+            return len(self.store)
         return len(self.zs)
 
 
@@ -270,8 +289,7 @@ def get_dataloader(phase, config, shuffle=None):
     is_shuffle = phase == 'train' if shuffle is None else shuffle
 
     dataset = ShapeCodesDataset(phase, config)
-    dataloader = DataLoader(dataset, batch_size=config.batch_size, shuffle=is_shuffle, num_workers=config.num_workers)
-    return dataloader
+    return make_dataloader(dataset, config, shuffle=is_shuffle)
 
 
 parser = argparse.ArgumentParser()
@@ -284,13 +302,13 @@ parser.add_argument('--ae_ckpt', type=str, required=True, help="desired checkpoi
 parser.add_argument('--continue', dest='cont', action='store_true', help="continue training from checkpoint")
 parser.add_argument('--ckpt', type=str, default='latest', required=False, help="desired checkpoint to restore")
 parser.add_argument('--test',action='store_true', help="test mode")
+parser.add_argument('--packed_pc', type=str, default=None, help="path to packed point clouds (with normals) from dataset/pack_pc.py")
 parser.add_argument('--n_samples', type=int, default=100, help="number of samples to generate when testing")
 parser.add_argument('-g', '--gpu_ids', type=str, default="0",
-                   help="gpu to use, e.g. 0  0,1,2. CPU not supported.")
+                   help="gpu to use, e.g. 0  0,1,2. Use cpu (or -1) to run on CPU.")
 args = parser.parse_args()
 
-if args.gpu_ids is not None:
-    os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
+set_visible_gpus(args.gpu_ids)
 
 cfg = Config(args)
 print("data path:", cfg.data_root)
@@ -310,16 +328,19 @@ if not args.test:
 
     # start training
     clock = agent.clock
+    # step time, data wait and losses without a per-step sync, in log/metrics.jsonl
+    metrics = MetricsLogger({}, os.path.join(cfg.log_dir, 'metrics.jsonl'), 10, cfg.device)
 
     for e in range(clock.epoch, cfg.nr_epochs):
         # begin iteration
-        pbar = tqdm(train_loader)
+        pbar = tqdm(metrics.timed(train_loader), total=len(train_loader))
         for b, data in enumerate(pbar):
             # train step
             outputs, losses = agent.train_func(data)
+            metrics.update(losses, clock.step, 'train', data["points"].shape[0])
 
             pbar.set_description("EPOCH[{}][{}]".format(e, b))
-            pbar.set_postfix({k: v.item() for k, v in losses.items()})
+            pbar.set_postfix(metrics.last.get('train', {}))
 
             # validation step
             if clock.step % cfg.val_frequency == 0:
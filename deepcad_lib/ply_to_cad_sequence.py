@@ -14,14 +14,15 @@ from pc2cad import PointNet2, read_ply
 from config.configAE import ConfigAE
 from trainer import TrainerAE
 from cadlib.macro import EOS_IDX
+from utils import set_visible_gpus, get_device
 
 N_POINTS = 2048
 
 
 def main(args):
 
-    device = torch.device(f"cuda:{args.gpu_ids}" if torch.cuda.is_available() else "cpu")
-    os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_ids)
+    set_visible_gpus(args.gpu_ids)
+    device = get_device(args.gpu_ids)
     print(f"Using device: {device}")
 
     # --- 步骤 1: 加载点云并计算法向量 ---
@@ -140,7 +141,7 @@ if __name__ == '__main__':
                         help="Desired AE checkpoint to restore (e.g., 'latest', '1000').")
     parser.add_argument('-o', '--output_dir', type=str, default='./reconstructions',
                         help="Directory to save the output .h5 file.")
-    parser.add_argument('-g', '--gpu_ids', type=str, default='0', help="GPU to use, e.g. '0'.")
+    parser.add_argument('-g', '--gpu_ids', type=str, default='0', help="GPU to use, e.g. '0'. Use 'cpu' (or -1) to run on CPU.")
 
     args = parser.parse_args()
     main(args)
\ No newline at end of file
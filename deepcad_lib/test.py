@@ -112,7 +112,7 @@ def decode(cfg):
     for i in range(0, len(zs), cfg.batch_size):
         with torch.no_grad():
             batch_z = torch.tensor(zs[i:i+cfg.batch_size], dtype=torch.float32).unsqueeze(1)
-            batch_z = batch_z.cuda()
+            batch_z = batch_z.to(tr_agent.device)
             outputs = tr_agent.decode(batch_z)
             batch_out_vec = tr_agent.logits2vec(outputs)
 
@@ -3,7 +3,7 @@ from tqdm import tqdm
 import argparse
 from dataset.cad_dataset import get_dataloader
 from config import ConfigAE
-from utils import cycle
+from utils import cycle, is_main_process, set_loader_epoch
 from trainer import TrainerAE
 
 
@@ -20,25 +20,27 @@ def main():
 
     # create dataloader
     train_loader = get_dataloader('train', cfg)
-    val_loader = get_dataloader('validation', cfg)
-    val_loader_all = get_dataloader('validation', cfg)
-    val_loader = cycle(val_loader)
+    if not cfg.external_eval:
+        val_loader = get_dataloader('validation', cfg)
+        val_loader_all = get_dataloader('validation', cfg, distributed=False)
+        val_loader = cycle(val_loader)
 
     # start training
     clock = tr_agent.clock
 
     for e in range(clock.epoch, cfg.nr_epochs):
+        set_loader_epoch(train_loader, e)
         # begin iteration
-        pbar = tqdm(train_loader)
+        pbar = tqdm(tr_agent.metrics.timed(train_loader), total=len(train_loader), disable=not is_main_process())
         for b, data in enumerate(pbar):
             # train step
             outputs, losses = tr_agent.train_func(data)
 
             pbar.set_description("EPOCH[{}][{}]".format(e, b))
-            pbar.set_postfix(OrderedDict({k: v.item() for k, v in losses.items()}))
+            pbar.set_postfix(OrderedDict(tr_agent.metrics.last.get('train', {})))
 
             # validation step
-            if clock.step % cfg.val_frequency == 0:
+            if not cfg.external_eval and clock.step % cfg.val_frequency == 0:
                 data = next(val_loader)
                 outputs, losses = tr_agent.val_func(data)
 
@@ -46,7 +48,7 @@ def main():
 
             tr_agent.update_learning_rate()
 
-        if clock.epoch % 5 == 0:
+        if not cfg.external_eval and clock.epoch % 5 == 0 and is_main_process():
             tr_agent.evaluate(val_loader_all)
 
         clock.tock()
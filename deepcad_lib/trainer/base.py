@@ -3,7 +3,9 @@ import torch
 import torch.optim as optim
 import torch.nn as nn
 from abc import abstractmethod
+from contextlib import nullcontext
 from tensorboardX import SummaryWriter
+from utils import get_world_size, is_main_process, broadcast_object, AsyncCheckpointer, MetricsLogger
 
 
 class BaseTrainer(object):
@@ -17,19 +19,55 @@ class BaseTrainer(object):
         self.model_dir = cfg.model_dir
         self.clock = TrainClock()
         self.batch_size = cfg.batch_size
+        self.device = cfg.device
+        self.checkpointer = AsyncCheckpointer(getattr(cfg, 'keep_ckpt', 0)) if is_main_process() else None
+
+        # mixed precision (fp16 with loss scaling, or bf16) and gradient accumulation over grad_accum steps
+        self.amp_dtype = {'fp16': torch.float16, 'bf16': torch.bfloat16}.get(cfg.amp)
+        self.amp_device = self.device.type
+        self.scaler = torch.amp.GradScaler(self.amp_device, enabled=self.amp_dtype == torch.float16)
+        self.grad_accum = max(1, cfg.grad_accum)
+        self.accum_count = 0
 
         # build network
         self.build_net(cfg)
 
+        # multi-process data parallel training when launched with torchrun
+        if get_world_size() > 1 and isinstance(getattr(self, 'net', None), nn.Module):
+            device_ids = [self.device.index] if self.device.type == 'cuda' else None
+            self.net = nn.parallel.DistributedDataParallel(self.net, device_ids=device_ids)
+
         # set loss function
         self.set_loss_function()
 
         # set optimizer
         self.set_optimizer(cfg)
 
-        # set tensorboard writer
-        self.train_tb = SummaryWriter(os.path.join(self.log_dir, 'train.events'))
-        self.val_tb = SummaryWriter(os.path.join(self.log_dir, 'val.events'))
+        # set tensorboard writer, only the main process writes logs. An eval worker (phase 'eval') runs next to
+        # the training process: it must not open the trainer's event files or append to its metrics.jsonl,
+        # its results go to a dedicated eval.events log
+        is_eval_worker = getattr(cfg, 'phase', None) == 'eval'
+        if is_main_process() and is_eval_worker:
+            self.train_tb = NullWriter()
+            self.val_tb = SummaryWriter(os.path.join(self.log_dir, 'eval.events'))
+        elif is_main_process():
+            self.train_tb = SummaryWriter(os.path.join(self.log_dir, 'train.events'))
+            self.val_tb = SummaryWriter(os.path.join(self.log_dir, 'val.events'))
+        else:
+            self.train_tb = NullWriter()
+            self.val_tb = NullWriter()
+
+        # losses are accumulated on device and written asynchronously every log_frequency steps
+        jsonl_path = os.path.join(self.log_dir, 'metrics.jsonl') if is_main_process() and not is_eval_worker else None
+        self.metrics = MetricsLogger({'train': self.train_tb, 'validation': self.val_tb}, jsonl_path,
+                                     getattr(cfg, 'log_frequency', 10), self.device)
+
+    @property
+    def net_module(self):
+        """the network without its DataParallel/DistributedDataParallel wrapper"""
+        if isinstance(self.net, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            return self.net.module
+        return self.net
 
     @abstractmethod
     def build_net(self, cfg):
@@ -45,42 +83,44 @@ class BaseTrainer(object):
         self.scheduler = optim.lr_scheduler.StepLR(self.optimizer, cfg.lr_step_size)
 
     def save_ckpt(self, name=None):
-        """save checkpoint during training for future restore"""
+        """save checkpoint during training for future restore, only on the main process"""
+        if not is_main_process():
+            return
         if name is None:
             save_path = os.path.join(self.model_dir, "ckpt_epoch{}.pth".format(self.clock.epoch))
             print("Saving checkpoint epoch {}...".format(self.clock.epoch))
         else:
             save_path = os.path.join(self.model_dir, "{}.pth".format(name))
 
-        if isinstance(self.net, nn.DataParallel):
-            model_state_dict = self.net.module.cpu().state_dict()
-        else:
-            model_state_dict = self.net.cpu().state_dict()
-
-        torch.save({
+        # snapshot into host buffers and write in the background, the live model stays on its device
+        self.checkpointer.save({
             'clock': self.clock.make_checkpoint(),
-            'model_state_dict': model_state_dict,
+            'model_state_dict': self.net_module.state_dict(),
             'optimizer_state_dict': self.optimizer.state_dict(),
             'scheduler_state_dict': self.scheduler.state_dict(),
+            'scaler_state_dict': self.scaler.state_dict(),
         }, save_path)
 
-        self.net.cuda()
-
     def load_ckpt(self, name=None):
         """load checkpoint from saved checkpoint"""
         name = name if name == 'latest' else "ckpt_epoch{}".format(name)
         load_path = os.path.join(self.model_dir, "{}.pth".format(name))
+        if self.checkpointer is not None:
+            self.checkpointer.wait()
         if not os.path.exists(load_path):
             raise ValueError("Checkpoint {} not exists.".format(load_path))
 
-        checkpoint = torch.load(load_path)
-        print("Loading checkpoint from {} ...".format(load_path))
-        if isinstance(self.net, nn.DataParallel):
-            self.net.module.load_state_dict(checkpoint['model_state_dict'])
-        else:
-            self.net.load_state_dict(checkpoint['model_state_dict'])
+        # read on the main process only, then share with the other processes
+        checkpoint = None
+        if is_main_process():
+            checkpoint = torch.load(load_path, map_location='cpu' if get_world_size() > 1 else self.device)
+            print("Loading checkpoint from {} ...".format(load_path))
+        checkpoint = broadcast_object(checkpoint)
+        self.net_module.load_state_dict(checkpoint['model_state_dict'])
         self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        if 'scaler_state_dict' in checkpoint:
+            self.scaler.load_state_dict(checkpoint['scaler_state_dict'])
         self.clock.restore_checkpoint(checkpoint['clock'])
 
     @abstractmethod
@@ -89,37 +129,60 @@ class BaseTrainer(object):
         """should return network outputs, losses(dict)"""
         raise NotImplementedError
 
+    def autocast(self):
+        """autocast context for forward passes, a no-op unless mixed precision is enabled"""
+        return torch.autocast(self.amp_device, dtype=self.amp_dtype, enabled=self.amp_dtype is not None)
+
     def update_network(self, loss_dict):
-        """update network by back propagation"""
-        loss = sum(loss_dict.values())
-        self.optimizer.zero_grad()
-        loss.backward()
+        """update network by back propagation, stepping the optimizer once every grad_accum calls"""
+        loss = sum(loss_dict.values()) / self.grad_accum
+        self.accum_count += 1
+        # skip the gradient all-reduce of DDP until the last accumulation step
+        if self.accum_count < self.grad_accum and isinstance(self.net, nn.parallel.DistributedDataParallel):
+            sync_context = self.net.no_sync()
+        else:
+            sync_context = nullcontext()
+        with sync_context:
+            self.scaler.scale(loss).backward()
+        if self.accum_count < self.grad_accum:
+            return
+        self.accum_count = 0
+
         if self.cfg.grad_clip is not None:
+            self.scaler.unscale_(self.optimizer)
             nn.utils.clip_grad_norm_(self.net.parameters(), self.cfg.grad_clip)
-        self.optimizer.step()
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        self.optimizer.zero_grad()
 
     def update_learning_rate(self):
         """record and update learning rate"""
+        if self.accum_count != 0: # only after an actual optimizer step
+            return
         self.train_tb.add_scalar('learning_rate', self.optimizer.param_groups[-1]['lr'], self.clock.epoch)
         self.scheduler.step()
 
-    def record_losses(self, loss_dict, mode='train'):
-        """record loss to tensorboard"""
-        losses_values = {k: v.item() for k, v in loss_dict.items()}
+    def record_losses(self, loss_dict, mode='train', n_samples=None):
+        """record loss (averaged over steps and processes) to tensorboard, without a device sync"""
+        self.metrics.update(loss_dict, self.clock.step, mode, n_samples)
 
-        tb = self.train_tb if mode == 'train' else self.val_tb
-        for k, v in losses_values.items():
-            tb.add_scalar(k, v, self.clock.step)
+    @staticmethod
+    def batch_size_of(data):
+        """number of samples in a collated batch"""
+        for v in data.values():
+            if torch.is_tensor(v):
+                return v.shape[0]
+        return None
 
     def train_func(self, data):
         """one step of training"""
         self.net.train()
 
-        outputs, losses = self.forward(data)
+        with self.autocast():
+            outputs, losses = self.forward(data)
 
         self.update_network(losses)
-        if self.clock.step % 10 == 0:
-            self.record_losses(losses, 'train')
+        self.record_losses(losses, 'train', self.batch_size_of(data))
 
         return outputs, losses
 
@@ -127,18 +190,38 @@ class BaseTrainer(object):
         """one step of validation"""
         self.net.eval()
 
-        with torch.no_grad():
+        with torch.no_grad(), self.autocast():
             outputs, losses = self.forward(data)
 
         self.record_losses(losses, 'validation')
 
         return outputs, losses
 
+    def validate(self, val_loader):
+        """mean losses over a whole validation loader"""
+        self.net.eval()
+
+        loss_sums = {}
+        n_batches = 0
+        with torch.no_grad(), self.autocast():
+            for data in val_loader:
+                _, losses = self.forward(data)
+                for k, v in losses.items():
+                    loss_sums[k] = loss_sums.get(k, 0) + v.float()
+                n_batches += 1
+        return {k: (v / n_batches).item() for k, v in loss_sums.items()}
+
     def visualize_batch(self, data, tb, **kwargs):
         """write visualization results to tensorboard writer"""
         raise NotImplementedError
 
 
+class NullWriter(object):
+    """stand-in for SummaryWriter on non-main processes, drops everything"""
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
 class TrainClock(object):
     """ Clock object to track epoch and step during training
     """
@@ -22,12 +22,18 @@ class CADLoss(nn.Module):
         visibility_mask = _get_visibility_mask(tgt_commands, seq_dim=-1)
         padding_mask = _get_padding_mask(tgt_commands, seq_dim=-1, extended=True) * visibility_mask.unsqueeze(-1)
 
-        command_logits, args_logits = output["command_logits"], output["args_logits"]
+        # targets may be trimmed to the batch's own length (see collate_trim_padding), the decoder always outputs max_total_len
+        S = tgt_commands.shape[-1]
+        command_logits, args_logits = output["command_logits"][:, :S], output["args_logits"]
 
         mask = self.cmd_args_mask[tgt_commands.long()]
 
+        # args_logits_masked: the model already gathered only the masked (position, arg) logits, see FCN.masked_args_logits
+        if not output.get("args_logits_masked", False):
+            args_logits = args_logits[:, :S][mask.bool()]
+
         loss_cmd = F.cross_entropy(command_logits[padding_mask.bool()].reshape(-1, self.n_commands), tgt_commands[padding_mask.bool()].reshape(-1).long())
-        loss_args = F.cross_entropy(args_logits[mask.bool()].reshape(-1, self.args_dim), tgt_args[mask.bool()].reshape(-1).long() + 1)  # shift due to -1 PAD_VAL
+        loss_args = F.cross_entropy(args_logits.reshape(-1, self.args_dim), tgt_args[mask.bool()].reshape(-1).long() + 1)  # shift due to -1 PAD_VAL
 
         loss_cmd = self.weights["loss_cmd_weight"] * loss_cmd
         loss_args = self.weights["loss_args_weight"] * loss_args
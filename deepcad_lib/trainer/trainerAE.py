@@ -10,7 +10,7 @@ from cadlib.macro import *
 
 class TrainerAE(BaseTrainer):
     def build_net(self, cfg):
-        self.net = CADTransformer(cfg).cuda()
+        self.net = CADTransformer(cfg).to(cfg.device)
 
     def set_optimizer(self, cfg):
         """set optimizer and lr scheduler used in training"""
@@ -18,21 +18,24 @@ class TrainerAE(BaseTrainer):
         self.scheduler = GradualWarmupScheduler(self.optimizer, 1.0, cfg.warmup_step)
 
     def set_loss_function(self):
-        self.loss_func = CADLoss(self.cfg).cuda()
+        self.loss_func = CADLoss(self.cfg).to(self.device)
 
     def forward(self, data):
-        commands = data['command'].cuda() # (N, S)
-        args = data['args'].cuda()  # (N, S, N_ARGS)
+        commands = data['command'].to(self.device) # (N, S)
+        args = data['args'].to(self.device)  # (N, S, N_ARGS)
 
-        outputs = self.net(commands, args)
+        # in training only the argument logits used by the loss are computed; full logits are kept for eval/test outputs
+        args_mask = self.loss_func.cmd_args_mask[commands.long()].bool() if self.net.training else None
+        packed_enc = {k: v.to(self.device) for k, v in data['packed'].items()} if 'packed' in data else None
+        outputs = self.net(commands, args, packed_enc=packed_enc, args_mask=args_mask)
         loss_dict = self.loss_func(outputs)
 
         return outputs, loss_dict
 
     def encode(self, data, is_batch=False):
         """encode into latent vectors"""
-        commands = data['command'].cuda()
-        args = data['args'].cuda()
+        commands = data['command'].to(self.device)
+        args = data['args'].to(self.device)
         if not is_batch:
             commands = commands.unsqueeze(0)
             args = args.unsqueeze(0)
@@ -49,7 +52,7 @@ class TrainerAE(BaseTrainer):
         out_command = torch.argmax(torch.softmax(outputs['command_logits'], dim=-1), dim=-1)  # (N, S)
         out_args = torch.argmax(torch.softmax(outputs['args_logits'], dim=-1), dim=-1) - 1  # (N, S, N_ARGS)
         if refill_pad: # fill all unused element to -1
-            mask = ~torch.tensor(CMD_ARGS_MASK).bool().cuda()[out_command.long()]
+            mask = ~torch.tensor(CMD_ARGS_MASK, device=out_command.device).bool()[out_command.long()]
             out_args[mask] = -1
 
         out_cad_vec = torch.cat([out_command.unsqueeze(-1), out_args], dim=-1)
@@ -70,10 +73,11 @@ class TrainerAE(BaseTrainer):
 
         for i, data in enumerate(pbar):
             with torch.no_grad():
-                commands = data['command'].cuda()
-                args = data['args'].cuda()
-                outputs = self.net(commands, args)
-                out_args = torch.argmax(torch.softmax(outputs['args_logits'], dim=-1), dim=-1) - 1
+                commands = data['command'].to(self.device)
+                args = data['args'].to(self.device)
+                outputs = self.net_module(commands, args)
+                out_args = outputs['args_logits'][:, :commands.shape[1]]
+                out_args = torch.argmax(torch.softmax(out_args, dim=-1), dim=-1) - 1
                 out_args = out_args.long().detach().cpu().numpy()  # (N, S, n_args)
 
             gt_commands = commands.squeeze(1).long().detach().cpu().numpy() # (N, S)
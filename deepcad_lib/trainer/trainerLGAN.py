@@ -18,6 +18,9 @@ class TrainerLatentWGAN(BaseTrainer):
         self.save_frequency = cfg.save_frequency
         self.gp_lambda = cfg.gp_lambda
         self.n_dim = cfg.n_dim
+        # one loss scaler per optimizer, so that an inf/NaN step of D does not change G's scale and vice versa
+        self.scalerD = self.scaler
+        self.scalerG = torch.amp.GradScaler(self.amp_device, enabled=self.scaler.is_enabled())
 
         # build netD and netG
         self.build_net(cfg)
@@ -26,8 +29,8 @@ class TrainerLatentWGAN(BaseTrainer):
         self.set_optimizer(cfg)
 
     def build_net(self, cfg):
-        self.netD = Discriminator(cfg.h_dim, cfg.z_dim).cuda()
-        self.netG = Generator(cfg.n_dim, cfg.h_dim, cfg.z_dim).cuda()
+        self.netD = Discriminator(cfg.h_dim, cfg.z_dim).to(cfg.device)
+        self.netG = Generator(cfg.n_dim, cfg.h_dim, cfg.z_dim).to(cfg.device)
 
     def eval(self):
         self.netD.eval()
@@ -46,46 +49,51 @@ class TrainerLatentWGAN(BaseTrainer):
         else:
             save_path = os.path.join(self.model_dir, "{}.pth".format(name))
 
-        torch.save({
+        self.checkpointer.save({
             'clock': self.clock.make_checkpoint(),
-            'netG_state_dict': self.netG.cpu().state_dict(),
-            'netD_state_dict': self.netD.cpu().state_dict(),
+            'netG_state_dict': self.netG.state_dict(),
+            'netD_state_dict': self.netD.state_dict(),
             'optimizerG_state_dict': self.optimizerG.state_dict(),
             'optimizerD_state_dict': self.optimizerD.state_dict(),
+            'scaler_state_dict': self.scalerD.state_dict(),
+            'scalerG_state_dict': self.scalerG.state_dict(),
         }, save_path)
 
-        self.netG.cuda()
-        self.netD.cuda()
-
     def load_ckpt(self, name=None):
         """load checkpoint from saved checkpoint"""
         name = name if name == 'latest' else "ckpt_epoch{}".format(name)
         load_path = os.path.join(self.model_dir, "{}.pth".format(name))
+        self.checkpointer.wait()
         if not os.path.exists(load_path):
             raise ValueError("Checkpoint {} not exists.".format(load_path))
 
-        checkpoint = torch.load(load_path)
+        checkpoint = torch.load(load_path, map_location=self.device)
         print("Loading checkpoint from {} ...".format(load_path))
         self.netG.load_state_dict(checkpoint['netG_state_dict'])
         self.netD.load_state_dict(checkpoint['netD_state_dict'])
         self.optimizerG.load_state_dict(checkpoint['optimizerG_state_dict'])
         self.optimizerD.load_state_dict(checkpoint['optimizerD_state_dict'])
+        if 'scaler_state_dict' in checkpoint:
+            self.scalerD.load_state_dict(checkpoint['scaler_state_dict'])
+        if 'scalerG_state_dict' in checkpoint:
+            self.scalerG.load_state_dict(checkpoint['scalerG_state_dict'])
         self.clock.restore_checkpoint(checkpoint['clock'])
 
     def calc_gradient_penalty(self, netD, real_data, fake_data):
-        alpha = torch.rand(self.batch_size, 1)
+        alpha = torch.rand(self.batch_size, 1, device=self.device)
         alpha = alpha.expand(real_data.size())
-        alpha = alpha.cuda() # if use_cuda else alpha
 
         interpolates = alpha * real_data.detach() + ((1 - alpha) * fake_data.detach())
 
-        interpolates = interpolates.cuda()
+        interpolates = interpolates.to(self.device)
         interpolates.requires_grad_(True)
 
+        # the critic runs in fp32 here, outside autocast: in fp16 the gradients w.r.t. the interpolates underflow
+        # without loss scaling, and with it the scale (65536 by default) overflows to inf in the fp16 backward.
+        # In fp32 the gradients need no scaling; the penalty is scaled with the rest of D_cost
         disc_interpolates = netD(interpolates)
-
         gradients = autograd.grad(outputs=disc_interpolates, inputs=interpolates,
-                                  grad_outputs=torch.ones(disc_interpolates.size()).cuda(),
+                                  grad_outputs=torch.ones_like(disc_interpolates),
                                   create_graph=True, retain_graph=True, only_inputs=True)[0]
 
         gradients = gradients.view(gradients.size(0), -1)
@@ -93,13 +101,8 @@ class TrainerLatentWGAN(BaseTrainer):
         return gradient_penalty
 
     def train(self, dataloader):
-        """training process"""
-        data = cycle(dataloader)
-
-        one = torch.FloatTensor([1])
-        mone = one * -1
-        one = one.cuda()
-        mone = mone.cuda()
+        """training process, dataloader is a DataLoader or an endless DeviceBatchSampler"""
+        data = self.metrics.timed(cycle(dataloader))
 
         pbar = tqdm(range(self.clock.step, self.n_iters))
         for iteration in pbar:
@@ -110,34 +113,36 @@ class TrainerLatentWGAN(BaseTrainer):
                 p.requires_grad = True  # they are set to False below in netG update
 
             for iter_d in range(self.critic_iters):
-                real_data = next(data)
+                self.netD.zero_grad()
 
-                real_data = real_data.cuda()
-                real_data.requires_grad_(True)
+                # accumulate gradients of grad_accum batches before each step
+                for _ in range(self.grad_accum):
+                    real_data = next(data)
 
-                self.netD.zero_grad()
+                    real_data = real_data.to(self.device)
+                    real_data.requires_grad_(True)
+
+                    with self.autocast():
+                        # train with real
+                        D_real = self.netD(real_data)
+                        D_real = D_real.mean(dim=0, keepdim=True)
 
-                # train with real
-                D_real = self.netD(real_data)
-                D_real = D_real.mean(dim=0, keepdim=True)
-                D_real.backward(mone)
+                        # train with fake
+                        noise = torch.randn(self.batch_size, self.n_dim, device=self.device)
+                        fake = self.netG(noise).detach()
+                        inputv = fake
+                        D_fake = self.netD(inputv)
+                        D_fake = D_fake.mean(dim=0, keepdim=True)
 
-                # train with fake
-                noise = torch.randn(self.batch_size, self.n_dim)
-                noise = noise.cuda()
-                fake = self.netG(noise).detach()
-                inputv = fake
-                D_fake = self.netD(inputv)
-                D_fake = D_fake.mean(dim=0, keepdim=True)
-                D_fake.backward(one)
+                    # train with gradient penalty
+                    gradient_penalty = self.calc_gradient_penalty(self.netD, real_data, fake.data)
 
-                # train with gradient penalty
-                gradient_penalty = self.calc_gradient_penalty(self.netD, real_data, fake.data)
-                gradient_penalty.backward()
+                    D_cost = D_fake - D_real + gradient_penalty
+                    Wasserstein_D = D_real - D_fake
+                    self.scalerD.scale(D_cost.sum() / self.grad_accum).backward()
 
-                D_cost = D_fake - D_real + gradient_penalty
-                Wasserstein_D = D_real - D_fake
-                self.optimizerD.step()
+                self.scalerD.step(self.optimizerD)
+                self.scalerD.update()
 
             # if not FIXED_GENERATOR:
             ############################
@@ -147,21 +152,23 @@ class TrainerLatentWGAN(BaseTrainer):
                 p.requires_grad = False  # to avoid computation
             self.netG.zero_grad()
 
-            noise = torch.randn(self.batch_size, self.n_dim)
-            noise = noise.cuda()
-            noise.requires_grad_(True)
+            for _ in range(self.grad_accum):
+                noise = torch.randn(self.batch_size, self.n_dim, device=self.device)
+                noise.requires_grad_(True)
 
-            fake = self.netG(noise)
-            G = self.netD(fake)
-            G = G.mean(dim=0, keepdim=True)
-            G.backward(mone)
-            G_cost = -G
-            self.optimizerG.step()
+                with self.autocast():
+                    fake = self.netG(noise)
+                    G = self.netD(fake)
+                    G = G.mean(dim=0, keepdim=True)
+                G_cost = -G
+                self.scalerG.scale(G_cost.sum() / self.grad_accum).backward()
+            self.scalerG.step(self.optimizerG)
+            self.scalerG.update()
 
             # Write logs and save samples
-            pbar.set_postfix({"D_loss": D_cost.item(), "G_loss": G_cost.item()})
-            self.train_tb.add_scalars("loss", {"D_loss": D_cost.item(), "G_loss": G_cost.item()}, global_step=self.clock.step)
-            self.train_tb.add_scalar("wasserstein distance", Wasserstein_D.item(), global_step=self.clock.step)
+            self.record_losses({"D_loss": D_cost, "G_loss": G_cost, "wasserstein distance": Wasserstein_D},
+                               'train', self.batch_size * self.critic_iters * self.grad_accum)
+            pbar.set_postfix(self.metrics.last.get('train', {}))
 
             # save model
             self.clock.tick()
@@ -176,7 +183,7 @@ class TrainerLatentWGAN(BaseTrainer):
         generated_z = []
         z_scores = []
         for i in range(chunk_num):
-            noise = torch.randn(self.batch_size, self.n_dim).cuda()
+            noise = torch.randn(self.batch_size, self.n_dim, device=self.device)
             with torch.no_grad():
                 fake = self.netG(noise)
                 G_score = self.netD(fake)
@@ -187,7 +194,7 @@ class TrainerLatentWGAN(BaseTrainer):
             print("chunk {} finished.".format(i))
 
         remains = n_samples - self.batch_size * chunk_num
-        noise = torch.randn(remains, self.n_dim).cuda()
+        noise = torch.randn(remains, self.n_dim, device=self.device)
         with torch.no_grad():
             fake = self.netG(noise)
             G_score = self.netD(fake)
@@ -1,2 +1,6 @@
 from .file_utils import *
 from .pc_utils import *
+from .device_utils import *
+from .dist_utils import *
+from .ckpt_utils import *
+from .metrics_utils import *
@@ -0,0 +1,99 @@
+import os
+import glob
+import time
+import tracemalloc
+import argparse
+import h5py
+import numpy as np
+import sys
+sys.path.append("..")
+from cadlib.extrude import CADSequence
+from cadlib.curves import Line, Arc, Circle
+from cadlib.macro import *
+
+
+def random_cad_vector(rng):
+    """a random but well-formed quantized CAD vector: 1-3 extrudes of 1-3 loops, each one circle or 2-6 lines/arcs"""
+    rows = []
+    for _ in range(rng.randint(1, 4)):
+        for _ in range(rng.randint(1, 4)):
+            rows.append(SOL_VEC)
+            if rng.rand() < 0.3:
+                rows.append([CIRCLE_IDX, *rng.randint(0, 256, 2), PAD_VAL, PAD_VAL, rng.randint(1, 128),
+                             *[PAD_VAL] * N_ARGS_EXT])
+                continue
+            for _ in range(rng.randint(2, 7)):
+                if rng.rand() < 0.5:
+                    rows.append([LINE_IDX, *rng.randint(0, 256, 2), PAD_VAL, PAD_VAL, PAD_VAL, *[PAD_VAL] * N_ARGS_EXT])
+                else:
+                    rows.append([ARC_IDX, *rng.randint(0, 256, 2), rng.randint(1, 256), rng.randint(0, 2), PAD_VAL,
+                                 *[PAD_VAL] * N_ARGS_EXT])
+        ext_param = [*rng.randint(0, 256, N_ARGS_PLANE + N_ARGS_TRANS + 2), rng.randint(0, 4), rng.randint(0, 3)]
+        rows.append([EXT_IDX, *[PAD_VAL] * N_ARGS_SKETCH, *ext_param])
+    rows.append(EOS_VEC)
+    return np.array(rows, dtype=np.int64)
+
+
+def load_vectors(src, num):
+    paths = sorted(glob.glob(os.path.join(src, "**", "*.h5"), recursive=True))[:num]
+    vecs = []
+    for path in paths:
+        with h5py.File(path, 'r') as fp:
+            vecs.append(fp["vec"][:])
+    return vecs
+
+
+def timed(name, func, n_items):
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    print("{:24} {:8.3f}s {:12.1f} /sec".format(name, elapsed, n_items / elapsed))
+    return result
+
+
+def object_memory(make, n):
+    """average bytes allocated per object by make(i)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [make(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return (after - before) / n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="micro-benchmark of cadlib object creation, from_vector and to_vector")
+    parser.add_argument('--src', type=str, default=None, help="folder of cad_vec h5 files, random vectors if not given")
+    parser.add_argument('--num', type=int, default=20000, help="number of vectors")
+    parser.add_argument('--n_curves', type=int, default=1000000, help="number of curve objects to create")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    vecs = load_vectors(args.src, args.num) if args.src is not None else \
+        [random_cad_vector(rng) for _ in range(args.num)]
+    n_rows = sum(len(vec) for vec in vecs)
+    print("{} vectors, {} rows".format(len(vecs), n_rows))
+
+    points = rng.randint(0, 256, (args.n_curves, 2))
+    ref_vec = np.array([1.0, 0.0])
+    timed("Line()", lambda: [Line(points[i - 1], points[i]) for i in range(args.n_curves)], args.n_curves)
+    timed("Arc()", lambda: [Arc(points[i - 1], points[i], points[i], 1.0, start_angle=0, end_angle=1.0,
+                                ref_vec=ref_vec) for i in range(args.n_curves)], args.n_curves)
+    timed("Circle()", lambda: [Circle(points[i], 10) for i in range(args.n_curves)], args.n_curves)
+    n_mem = min(args.n_curves, 100000)
+    print("bytes per object: Line {:.0f}, Arc {:.0f}, Circle {:.0f} (numpy arrays shared)".format(
+        object_memory(lambda i: Line(points[i - 1], points[i]), n_mem),
+        object_memory(lambda i: Arc(points[i - 1], points[i], points[i], 1.0, start_angle=0, end_angle=1.0,
+                                    ref_vec=ref_vec), n_mem),
+        object_memory(lambda i: Circle(points[i], 10), n_mem)))
+
+    cad_seqs = timed("CADSequence.from_vector", lambda: [CADSequence.from_vector(vec, is_numerical=True)
+                                                         for vec in vecs], len(vecs))
+    for cad_seq in cad_seqs:
+        for ext in cad_seq.seq:
+            ext.extent_one, ext.extent_two = np.clip([ext.extent_one, ext.extent_two], -1.0, 1.0)
+    timed("CADSequence.numericalize", lambda: [cad_seq.numericalize() for cad_seq in cad_seqs], len(vecs))
+    timed("CADSequence.to_vector", lambda: [cad_seq.to_vector(MAX_N_EXT, MAX_N_LOOPS, MAX_N_CURVES, MAX_TOTAL_LEN)
+                                            for cad_seq in cad_seqs], len(vecs))
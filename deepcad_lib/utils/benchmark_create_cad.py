@@ -0,0 +1,100 @@
+import time
+import argparse
+import numpy as np
+from OCC.Core.BRepGProp import brepgprop
+from OCC.Core.GProp import GProp_GProps
+import sys
+sys.path.append("..")
+from cadlib.extrude import CADSequence
+from cadlib.visualize import create_CAD, vecs2CADsolids
+from cadlib.validate import validate_vector, is_valid
+from cadlib.macro import *
+
+
+def random_solid_vector(rng, n_ext, p_cut=0.2):
+    """a quantized CAD vector of n_ext overlapping boxes and cylinders, joined or (with probability p_cut) cut"""
+    rows = []
+    for i in range(n_ext):
+        rows.append(SOL_VEC)
+        if rng.rand() < 0.5:
+            rows.append([CIRCLE_IDX, 128, 128, PAD_VAL, PAD_VAL, rng.randint(32, 128), *[PAD_VAL] * N_ARGS_EXT])
+        else:
+            lo, hi = rng.randint(0, 96, 2), rng.randint(160, 256, 2)
+            for x, y in [(hi[0], lo[1]), (hi[0], hi[1]), (lo[0], hi[1]), (lo[0], lo[1])]:
+                rows.append([LINE_IDX, x, y, PAD_VAL, PAD_VAL, PAD_VAL, *[PAD_VAL] * N_ARGS_EXT])
+        operation = EXTRUDE_OPERATIONS.index("CutFeatureOperation") if i > 0 and rng.rand() < p_cut else \
+            EXTRUDE_OPERATIONS.index("JoinFeatureOperation")
+        ext_param = [*rng.choice([64, 128, 192], N_ARGS_PLANE), *rng.randint(96, 160, 3), rng.randint(64, 128),
+                     rng.randint(144, 224), 128, operation, EXTENT_TYPE.index("OneSideFeatureExtentType")]
+        rows.append([EXT_IDX, *[PAD_VAL] * N_ARGS_SKETCH, *ext_param])
+    rows.append(EOS_VEC)
+    return np.array(rows, dtype=np.int64)
+
+
+def candidate_vectors(rng, n_candidates, n_ext, n_shared):
+    """n_candidates vectors of n_ext extrudes that share their first n_shared extrudes"""
+    base = random_solid_vector(rng, n_ext)
+    base_cut = np.flatnonzero(base[:, 0] == EXT_IDX)[n_shared - 1] + 1 if n_shared > 0 else 0
+    vecs = [base]
+    for _ in range(n_candidates - 1):
+        vec = random_solid_vector(rng, n_ext)
+        cut = np.flatnonzero(vec[:, 0] == EXT_IDX)[n_shared - 1] + 1 if n_shared > 0 else 0
+        vecs.append(np.concatenate([base[:base_cut], vec[cut:]], axis=0))
+    return vecs
+
+
+def volume(shape):
+    props = GProp_GProps()
+    brepgprop.VolumeProperties(shape, props)
+    return props.Mass()
+
+
+def time_build(cad_seqs, **kwargs):
+    shapes = []
+    t0 = time.perf_counter()
+    for cad_seq in cad_seqs:
+        try:
+            shapes.append(create_CAD(cad_seq, **kwargs))
+        except Exception:
+            shapes.append(None)
+    return time.perf_counter() - t0, shapes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="create_CAD with pairwise vs. grouped parallel boolean operations")
+    parser.add_argument('--num', type=int, default=20, help="number of sequences per extrude count")
+    parser.add_argument('--max_n_ext', type=int, default=10)
+    parser.add_argument('--fuzzy', type=float, default=0.0)
+    parser.add_argument('--n_candidates', type=int, default=8, help="candidates per job for the prefix cache")
+    parser.add_argument('--n_shared', type=int, default=6, help="extrudes shared by the candidates")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    print("{:>5} {:>12} {:>12} {:>8} {:>10} {:>8}".format("n_ext", "pairwise(s)", "grouped(s)", "speedup", "max dV",
+                                                        "failed"))
+    for n_ext in range(1, args.max_n_ext + 1):
+        vecs = [random_solid_vector(rng, n_ext) for _ in range(args.num)]
+        vecs = [vec for vec in vecs if is_valid(validate_vector(vec))]
+        cad_seqs = [CADSequence.from_vector(vec, is_numerical=True) for vec in vecs]
+        t_pair, shapes_pair = time_build(cad_seqs, parallel=False, group=False)
+        t_group, shapes_group = time_build(cad_seqs, parallel=True, fuzzy=args.fuzzy, group=True)
+        # grouping must not change the solid
+        diffs = [abs(volume(a) - volume(b)) / max(volume(a), 1e-12) for a, b in zip(shapes_pair, shapes_group)
+                 if a is not None and b is not None]
+        n_failed = "{}/{}".format(shapes_pair.count(None), shapes_group.count(None))
+        print("{:5d} {:12.3f} {:12.3f} {:7.2f}x {:10.2e} {:>8}".format(n_ext, t_pair, t_group, t_pair / t_group,
+                                                                       max(diffs) if len(diffs) > 0 else 0.0, n_failed))
+
+    # several candidates of one job, sharing a prefix: without and with BodyPrefixCache (both pairwise)
+    jobs = [candidate_vectors(rng, args.n_candidates, args.max_n_ext, args.n_shared) for _ in range(args.num)]
+    t0 = time.perf_counter()
+    for vecs in jobs:
+        time_build([CADSequence.from_vector(vec, is_numerical=True) for vec in vecs])
+    t_plain = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for vecs in jobs:
+        vecs2CADsolids(vecs)
+    t_prefix = time.perf_counter() - t0
+    print("{} jobs of {} candidates sharing {}/{} extrudes: {:.3f}s without, {:.3f}s with prefix cache".format(
+        args.num, args.n_candidates, args.n_shared, args.max_n_ext, t_plain, t_prefix))
@@ -0,0 +1,84 @@
+import argparse
+import numpy as np
+import sys
+sys.path.append("..")
+from cadlib.extrude import CADSequence
+from cadlib.curves import Line, Arc, Circle
+from cadlib.vector_batch import parse_cad_vectors
+from cadlib.validate import validate_vectors, validate_vector, format_issues
+from cadlib.macro import *
+from benchmark_cadlib import random_cad_vector
+
+
+def curve_values(curve):
+    if isinstance(curve, Circle):
+        return [curve.center, [curve.radius]]
+    if isinstance(curve, Arc):
+        return [curve.start_point, curve.mid_point, curve.end_point]
+    return [curve.start_point, curve.end_point]
+
+
+def same_sequence(a: CADSequence, b: CADSequence):
+    """True if both sequences have the same extrude parameters, loops and curves"""
+    if len(a.seq) != len(b.seq):
+        return False
+    for ext_a, ext_b in zip(a.seq, b.seq):
+        params_a = [ext_a.operation, ext_a.extent_type, ext_a.extent_one, ext_a.extent_two, ext_a.sketch_size]
+        params_b = [ext_b.operation, ext_b.extent_type, ext_b.extent_one, ext_b.extent_two, ext_b.sketch_size]
+        if not np.allclose(params_a, params_b) or not np.allclose(ext_a.sketch_pos, ext_b.sketch_pos):
+            return False
+        loops_a, loops_b = ext_a.profile.children, ext_b.profile.children
+        if [len(l.children) for l in loops_a] != [len(l.children) for l in loops_b]:
+            return False
+        for loop_a, loop_b in zip(loops_a, loops_b):
+            for curve_a, curve_b in zip(loop_a.children, loop_b.children):
+                if type(curve_a) != type(curve_b):
+                    return False
+                for u, v in zip(curve_values(curve_a), curve_values(curve_b)):
+                    if not np.allclose(u, v, equal_nan=True):
+                        return False
+    return True
+
+
+def check_parse(vecs):
+    """parse_cad_vectors must give, for every valid vector, the same sequence as CADSequence.from_vector,
+    whatever its neighbours in the batch are"""
+    batch = parse_cad_vectors(vecs, is_numerical=True)
+    n_failed = 0
+    for i, vec in enumerate(vecs):
+        if not batch.valid[i]:
+            continue
+        if not same_sequence(batch.to_cad_sequence(i), CADSequence.from_vector(vec, is_numerical=True)):
+            print("parse mismatch:", i)
+            n_failed += 1
+    return n_failed
+
+
+def check_validate(vecs):
+    """validate_vectors on a batch must report, for every vector, exactly what validate_vector reports for it alone"""
+    batch_issues = validate_vectors(vecs)
+    n_failed = 0
+    for i, vec in enumerate(vecs):
+        issues = validate_vector(vec)
+        if batch_issues[i] != issues:
+            print("validate mismatch: {}: batch [{}], alone [{}]".format(
+                i, format_issues(batch_issues[i]), format_issues(issues)))
+            n_failed += 1
+    return n_failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="check the batched CAD vector parser and validator against the per-vector ones")
+    parser.add_argument('--num', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    vecs = [random_cad_vector(rng) for _ in range(args.num)]
+    # every 7th vector starts its first extrude without SOL, its curves must not leak into the previous vector
+    for i in range(1, args.num, 7):
+        vecs[i][0, 0] = LINE_IDX
+    n_failed = check_parse(vecs[:2]) + check_parse(vecs) + check_validate(vecs)
+    print("{} mismatches".format(n_failed))
+    sys.exit(1 if n_failed > 0 else 0)
@@ -0,0 +1,93 @@
+import os
+import re
+import atexit
+import queue
+import threading
+import torch
+
+
+class AsyncCheckpointer(object):
+    """Write checkpoints on a background thread so that training never waits on disk.
+    `save` snapshots every tensor of the state into host (pinned, for CUDA tensors) buffers with asynchronous copies
+    and returns immediately; the writer thread waits for the copies, saves to a temporary file and atomically renames it.
+    Buffers of finished writes are reused by later snapshots. With keep_last > 0 only the newest keep_last checkpoints
+    whose file name matches `pattern` (numbered checkpoints, not 'latest') are kept.
+    """
+    def __init__(self, keep_last=0, pattern=r"ckpt_epoch(\d+)\.pth$"):
+        self.keep_last = keep_last
+        self.pattern = re.compile(pattern)
+        self._queue = queue.Queue()
+        self._free_buffers = []
+        self._lock = threading.Lock()
+        self._error = None
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        atexit.register(self.wait)
+
+    def save(self, state, path):
+        """snapshot state (nested dicts/lists of tensors and python values) and queue it to be written to path"""
+        self._raise_error()
+        with self._lock:
+            old_buffers = self._free_buffers.pop() if self._free_buffers else []
+        buffers = []
+        host_state = self._snapshot(state, iter(old_buffers), buffers)
+
+        event = None
+        if any(b.is_pinned() for b in buffers):
+            event = torch.cuda.Event()
+            event.record()
+        self._queue.put((host_state, path, event, buffers))
+
+    def wait(self):
+        """block until all queued checkpoints are on disk"""
+        self._queue.join()
+        self._raise_error()
+
+    def _snapshot(self, obj, old_buffers, buffers):
+        if torch.is_tensor(obj):
+            buf = next(old_buffers, None)
+            if buf is None or buf.shape != obj.shape or buf.dtype != obj.dtype:
+                buf = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+            buf.copy_(obj.detach(), non_blocking=True)
+            buffers.append(buf)
+            return buf
+        if isinstance(obj, dict):
+            return {k: self._snapshot(v, old_buffers, buffers) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)([self._snapshot(v, old_buffers, buffers) for v in obj])
+        return obj
+
+    def _worker(self):
+        while True:
+            host_state, path, event, buffers = self._queue.get()
+            try:
+                if event is not None:
+                    event.synchronize()
+                tmp_path = path + ".tmp"
+                torch.save(host_state, tmp_path)
+                os.replace(tmp_path, path)
+                self._prune(os.path.dirname(path))
+            except Exception as e:
+                self._error = e
+            finally:
+                with self._lock:
+                    if len(self._free_buffers) < 2:
+                        self._free_buffers.append(buffers)
+                self._queue.task_done()
+
+    def _prune(self, ckpt_dir):
+        if self.keep_last <= 0:
+            return
+        numbered = []
+        for name in os.listdir(ckpt_dir):
+            match = self.pattern.match(name)
+            if match is not None:
+                numbered.append((int(match.group(1)), name))
+        numbered.sort()
+        for _, name in numbered[:-self.keep_last]:
+            os.remove(os.path.join(ckpt_dir, name))
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("failed to write checkpoint") from error
@@ -0,0 +1,21 @@
+import os
+import torch
+
+
+def is_cpu(gpu_ids):
+    """whether gpu_ids asks for CPU explicitly ('cpu' or -1)"""
+    return gpu_ids is not None and str(gpu_ids).strip().lower() in ('cpu', '-1')
+
+
+def set_visible_gpus(gpu_ids):
+    """restrict CUDA to gpu_ids, must be called before CUDA is initialized"""
+    if gpu_ids is not None and not is_cpu(gpu_ids):
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_ids)
+
+
+def get_device(gpu_ids=None):
+    """torch device to run on: the first visible GPU (the LOCAL_RANK-th one under torchrun),
+    or CPU if gpu_ids is 'cpu'/-1 or no GPU is available"""
+    if is_cpu(gpu_ids) or not torch.cuda.is_available():
+        return torch.device('cpu')
+    return torch.device('cuda:{}'.format(int(os.environ.get("LOCAL_RANK", 0))))
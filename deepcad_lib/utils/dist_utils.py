@@ -0,0 +1,61 @@
+import os
+import torch
+import torch.distributed as dist
+
+
+def init_distributed(device, backend=None):
+    """initialize the default process group when launched by torchrun (WORLD_SIZE > 1).
+    backend defaults to nccl on GPU and gloo on CPU."""
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1 or is_distributed():
+        return
+    if backend is None:
+        backend = "nccl" if device.type == "cuda" else "gloo"
+    if device.type == "cuda":
+        torch.cuda.set_device(device)
+    dist.init_process_group(backend=backend)
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def reduce_mean(tensor):
+    """average a tensor over all processes"""
+    if not is_distributed():
+        return tensor
+    tensor = tensor.clone()
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor / get_world_size()
+
+
+def broadcast_object(obj, src=0):
+    """send a picklable object from process src to all processes"""
+    if not is_distributed():
+        return obj
+    obj_list = [obj]
+    dist.broadcast_object_list(obj_list, src=src)
+    return obj_list[0]
+
+
+def set_loader_epoch(dataloader, epoch):
+    """reshuffle distributed/bucketed samplers of a DataLoader for a new epoch"""
+    for sampler in (dataloader.sampler, dataloader.batch_sampler):
+        if hasattr(sampler, "set_epoch"):
+            sampler.set_epoch(epoch)
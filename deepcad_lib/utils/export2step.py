@@ -10,6 +10,8 @@ import sys
 sys.path.append("..")
 from cadlib.extrude import CADSequence
 from cadlib.visualize import vec2CADsolid, create_CAD
+from cadlib.validate import validate_vector, validate_cad_sequence, is_valid, format_issues
+from cadlib.shape_cache import extrude_cache
 from file_utils import ensure_dir
 
 
@@ -36,17 +38,24 @@ for path in out_paths:
         if args.form == "h5":
             with h5py.File(path, 'r') as fp:
                 out_vec = fp["out_vec"][:].astype(np.float64)
-                out_shape = vec2CADsolid(out_vec)
+            issues = validate_vector(out_vec)
+            if is_valid(issues):
+                out_shape = vec2CADsolid(out_vec, cache=extrude_cache)
         else:
             with open(path, 'r') as fp:
                 data = json.load(fp)
             cad_seq = CADSequence.from_dict(data)
             cad_seq.normalize()
-            out_shape = create_CAD(cad_seq)
+            issues = validate_cad_sequence(cad_seq)
+            if is_valid(issues):
+                out_shape = create_CAD(cad_seq, cache=extrude_cache)
 
     except Exception as e:
         print("load and create failed.")
         continue
+    if not is_valid(issues):
+        print("invalid CAD sequence:", format_issues(issues))
+        continue
     
     if args.filter:
         analyzer = BRepCheck_Analyzer(out_shape)
@@ -58,3 +67,5 @@ for path in out_paths:
     save_path = os.path.join(save_dir, name + ".step")
     write_step_file(out_shape, save_path)
 
+
+print("extrude cache:", extrude_cache.stats())
@@ -0,0 +1,124 @@
+import json
+import time
+import atexit
+import queue
+import threading
+import torch
+from .dist_utils import reduce_mean
+
+
+class MetricsLogger(object):
+    """Low-overhead scalar logging for training loops.
+    Losses are summed on their own device and only every `flush_every` training updates (every update for other
+    modes) averaged over steps and processes, copied to the host asynchronously and written to tensorboard and a
+    JSON-lines file by a background thread, so a training step never waits on a device sync.
+    Iterating the train loader through `timed` also records, per flush window, the mean step time, the time spent
+    waiting for data, samples/sec (per process) and peak device memory; a high perf/data_wait_ratio means the run
+    is input-bound.
+    """
+    def __init__(self, writers, jsonl_path=None, flush_every=10, device=None):
+        self.writers = writers  # mode -> SummaryWriter
+        self.flush_every = flush_every
+        self.device = device
+        self.last = {}  # mode -> latest flushed losses, e.g. for progress bars
+        self._sums = {}
+        self._counts = {}
+        self._reset_window()
+        self._jsonl = open(jsonl_path, 'a') if jsonl_path is not None else None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def timed(self, iterable):
+        """iterate over a data loader, accumulating the time spent waiting for each batch"""
+        self._reset_window()
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                data = next(it)
+            except StopIteration:
+                return
+            self._data_wait += time.perf_counter() - t0
+            yield data
+
+    def update(self, loss_dict, step, mode='train', n_samples=None):
+        """accumulate a dict of loss tensors without synchronizing, flushing when the window is full"""
+        sums = self._sums.setdefault(mode, {})
+        for k, v in loss_dict.items():
+            v = v.detach().float().mean()
+            sums[k] = sums[k] + v if k in sums else v
+        self._counts[mode] = self._counts.get(mode, 0) + 1
+        if mode == 'train':
+            self._n_steps += 1
+            self._n_samples += n_samples or 0
+
+        if self._counts[mode] >= (self.flush_every if mode == 'train' else 1):
+            self.flush(step, mode)
+
+    def flush(self, step, mode='train'):
+        """average the accumulated losses and hand them to the writer thread"""
+        sums = self._sums.pop(mode, None)
+        count = self._counts.pop(mode, 0)
+        if not sums:
+            return
+        names = list(sums.keys())
+        values = reduce_mean(torch.stack([sums[k] for k in names]) / count)
+        host = torch.empty(values.shape, dtype=values.dtype, pin_memory=values.is_cuda)
+        host.copy_(values, non_blocking=True)
+        event = None
+        if values.is_cuda:
+            event = torch.cuda.Event()
+            event.record()
+
+        stats = self._window_stats() if mode == 'train' else {}
+        self._queue.put((mode, step, names, host, event, stats))
+
+    def close(self):
+        """wait for pending writes and close the JSON-lines file"""
+        self._queue.join()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+    def _reset_window(self):
+        self._t_window = time.perf_counter()
+        self._data_wait = 0.
+        self._n_steps = 0
+        self._n_samples = 0
+
+    def _window_stats(self):
+        elapsed = max(time.perf_counter() - self._t_window, 1e-9)
+        n_steps = max(self._n_steps, 1)
+        stats = {
+            'perf/step_time': elapsed / n_steps,
+            'perf/data_wait': self._data_wait / n_steps,
+            'perf/data_wait_ratio': self._data_wait / elapsed,
+            'perf/samples_per_sec': self._n_samples / elapsed,
+        }
+        if self.device is not None and self.device.type == 'cuda':
+            stats['perf/peak_mem_mb'] = torch.cuda.max_memory_allocated(self.device) / 2 ** 20
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self._reset_window()
+        return stats
+
+    def _worker(self):
+        while True:
+            mode, step, names, host, event, stats = self._queue.get()
+            try:
+                if event is not None:
+                    event.synchronize()
+                losses = dict(zip(names, host.tolist()))
+                self.last[mode] = losses
+                values = dict(losses, **stats)
+
+                tb = self.writers.get(mode)
+                if tb is not None:
+                    for k, v in values.items():
+                        tb.add_scalar(k, v, step)
+                if self._jsonl is not None:
+                    self._jsonl.write(json.dumps(dict(mode=mode, step=step, time=time.time(), **values)) + '\n')
+                    self._jsonl.flush()
+            finally:
+                self._queue.task_done()
@@ -1,15 +1,25 @@
+import os
+import json
 import numpy as np
 from plyfile import PlyData, PlyElement
 
 
-def read_ply(path):
+def read_ply(path, with_normal=False):
     with open(path, 'rb') as f:
         plydata = PlyData.read(f)
         x = np.array(plydata['vertex']['x'])
         y = np.array(plydata['vertex']['y'])
         z = np.array(plydata['vertex']['z'])
         vertex = np.stack([x, y, z], axis=1)
-    return vertex
+        if with_normal:
+            nx = np.array(plydata['vertex']['nx'])
+            ny = np.array(plydata['vertex']['ny'])
+            nz = np.array(plydata['vertex']['nz'])
+            normals = np.stack([nx, ny, nz], axis=1)
+    if with_normal:
+        return np.concatenate([vertex, normals], axis=1)
+    else:
+        return vertex
 
 
 def write_ply(points, filename, text=False):
@@ -19,3 +29,53 @@ def write_ply(points, filename, text=False):
     el = PlyElement.describe(vertex, 'vertex', comments=['vertices'])
     with open(filename, mode='wb') as f:
         PlyData([el], text=text).write(f)
+
+
+def packed_pc_paths(packed_dir, phase):
+    """paths of the packed point buffer, offsets table, zs row index and meta file of one split"""
+    return {
+        "points": os.path.join(packed_dir, "{}_points.bin".format(phase)),
+        "offsets": os.path.join(packed_dir, "{}_offsets.npy".format(phase)),
+        "rows": os.path.join(packed_dir, "{}_rows.npy".format(phase)),
+        "ids": os.path.join(packed_dir, "{}_ids.json".format(phase)),
+        "meta": os.path.join(packed_dir, "{}_meta.json".format(phase)),
+    }
+
+
+class PackedPointClouds(object):
+    """Read-only view of point clouds packed by dataset/pack_pc.py.
+    All clouds of a split live in one memory-mapped buffer; shape i spans points[offsets[i]:offsets[i + 1]]
+    and corresponds to row rows[i] of the `{phase}_zs` array in all_zs_ckpt*.h5.
+    """
+    def __init__(self, packed_dir, phase):
+        paths = packed_pc_paths(packed_dir, phase)
+        with open(paths["meta"], "r") as fp:
+            meta = json.load(fp)
+        self.points_path = paths["points"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.n_channels = meta["n_channels"]
+        self.with_normal = meta["with_normal"]
+        self.offsets = np.load(paths["offsets"])
+        self.rows = np.load(paths["rows"])
+        with open(paths["ids"], "r") as fp:
+            self.ids = json.load(fp)
+        self._points = None # opened lazily, once per worker
+
+    @property
+    def points(self):
+        if self._points is None:
+            self._points = np.memmap(self.points_path, dtype=self.dtype, mode='r',
+                                     shape=(int(self.offsets[-1]), self.n_channels))
+        return self._points
+
+    def __getitem__(self, index):
+        return self.points[self.offsets[index]:self.offsets[index + 1]]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getstate__(self):
+        # do not pickle the memmap into DataLoader workers
+        state = self.__dict__.copy()
+        state["_points"] = None
+        return state
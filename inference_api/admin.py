@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import InferenceJob
+
+
+@admin.register(InferenceJob)
+class InferenceJobAdmin(admin.ModelAdmin):
+    list_display = ('file_id', 'fingerprint', 'status', 'created_at')
+    search_fields = ('file_id', 'fingerprint')
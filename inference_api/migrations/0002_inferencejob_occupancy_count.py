@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+def fill_occupancy_count(apps, schema_editor):
+    # popcount of the packed occupancy grid, inlined so that the migration does not depend on app code
+    InferenceJob = apps.get_model('inference_api', 'InferenceJob')
+    for job in InferenceJob.objects.exclude(occupancy=None).iterator():
+        job.occupancy_count = sum(bin(byte).count('1') for byte in bytes(job.occupancy))
+        job.save(update_fields=['occupancy_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inference_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inferencejob',
+            name='occupancy_count',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_occupancy_count, migrations.RunPython.noop),
+    ]
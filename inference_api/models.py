@@ -1,3 +1,29 @@
 from django.db import models
 
-# Create your models here.
+
+class InferenceJob(models.Model):
+    """一次推理任务，记录上传点云的几何指纹及其 STEP 结果，用于近似重复上传的缓存命中"""
+    STATUS_PENDING = 'pending'
+    STATUS_SUCCESS = 'success'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_ERROR, 'Error'),
+    ]
+
+    file_id = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=40, db_index=True, blank=True)
+    occupancy = models.BinaryField(null=True, blank=True)
+    # 占据体素数：相似度检索先按它在数据库里筛出候选，再逐个计算 Jaccard 相似度
+    occupancy_count = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result_url = models.CharField(max_length=512, blank=True)
+    result_filename = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_id} ({self.status})"
@@ -14,6 +14,10 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import api_view, parser_classes
 from django.http import JsonResponse, StreamingHttpResponse
 
+from .models import InferenceJob
+from ml_scripts.fingerprint import (load_ply_points, compute_fingerprint, occupancy_count, occupancy_count_range,
+                                    occupancy_similarity)
+
 # 全局锁，确保一次只有一个推理任务在GPU上运行
 inference_lock = threading.Lock()
 
@@ -34,6 +38,28 @@ def upload_ply_view(request):
     return JsonResponse({'file_id': filename})
 
 
+def find_cached_job(fingerprint, occupancy, exclude_pk=None):
+    """查找指纹相同或占据网格足够相似的已成功任务（不含 exclude_pk 这个任务本身），没有则返回 None"""
+    done_jobs = InferenceJob.objects.filter(status=InferenceJob.STATUS_SUCCESS).exclude(pk=exclude_pk)
+    exact = done_jobs.filter(fingerprint=fingerprint).first()
+    if exact is not None:
+        return exact
+
+    threshold = getattr(settings, 'FINGERPRINT_SIMILARITY', None)
+    if threshold is None:
+        return None
+    # 先用占据体素数的索引在数据库里筛出可能足够相似的任务，只对这些候选计算 Jaccard 相似度
+    count = occupancy_count(occupancy)
+    lo, hi = occupancy_count_range(count, threshold)
+    candidates = done_jobs.filter(occupancy_count__gte=lo)
+    if hi is not None:
+        candidates = candidates.filter(occupancy_count__lte=hi)
+    for job in candidates.exclude(occupancy=None).iterator():
+        if occupancy_similarity(bytes(job.occupancy), occupancy) >= threshold:
+            return job
+    return None
+
+
 def stream_inference_response(ply_filename):
     """生成器函数，用于流式传输推理过程的响应（增强诊断版）"""
 
@@ -41,8 +67,39 @@ def stream_inference_response(ply_filename):
     connect_message = json.dumps({'type': 'status', 'data': 'Connection established. Awaiting GPU allocation...'})
     yield f"data: {connect_message}\n\n"
 
+    # 预处理阶段计算几何指纹，近似重复的上传直接返回之前的 STEP 结果，不占用推理槽位
+    job, _ = InferenceJob.objects.get_or_create(file_id=ply_filename)
+    try:
+        points = load_ply_points(os.path.join(settings.MEDIA_ROOT, 'uploads', ply_filename))
+        job.fingerprint, job.occupancy = compute_fingerprint(points)
+        job.occupancy_count = occupancy_count(job.occupancy)
+        job.save(update_fields=['fingerprint', 'occupancy', 'occupancy_count'])
+        cached_job = find_cached_job(job.fingerprint, job.occupancy, exclude_pk=job.pk)
+    except Exception as e:
+        print(f"Fingerprint failed for {ply_filename}: {e}")
+        cached_job = None
+
+    if cached_job is not None:
+        job.status = InferenceJob.STATUS_SUCCESS
+        job.result_url = cached_job.result_url
+        job.result_filename = cached_job.result_filename
+        job.save(update_fields=['status', 'result_url', 'result_filename'])
+        status_message = json.dumps({'type': 'status', 'data': 'Near-identical upload found, serving cached result.'})
+        yield f"data: {status_message}\n\n"
+        result_message = json.dumps({'type': 'result', 'data': {
+            "status": "success",
+            "url": cached_job.result_url,
+            "filename": cached_job.result_filename,
+            "cached": True,
+        }})
+        yield f"data: {result_message}\n\n"
+        close_message = json.dumps({'type': 'status', 'data': 'Stream closed.'})
+        yield f"data: {close_message}\n\n"
+        return
+
     # 尝试获取锁
     if not inference_lock.acquire(blocking=False):
+        record_job_error(job)
         time.sleep(0.1)
         error_message = json.dumps({'type': 'error', 'data': 'GPU is busy. Please try again later.'})
         yield f"data: {error_message}\n\n"
@@ -140,10 +197,18 @@ def stream_inference_response(ply_filename):
 
             elif line_stripped.startswith('RESULT::'):
                 data_json = line_stripped[len('RESULT::'):]
-                message = json.dumps({'type': 'result', **json.loads(data_json)})
+                result = json.loads(data_json)
+                record_job_result(job, result.get('data'))
+                message = json.dumps({'type': 'result', **result})
+                yield f"data: {message}\n\n"
+
+            elif line_stripped.startswith('PREVIEW::'):
+                data_json = line_stripped[len('PREVIEW::'):]
+                message = json.dumps({'type': 'preview', **json.loads(data_json)})
                 yield f"data: {message}\n\n"
 
             elif line_stripped.startswith('ERROR::'):
+                record_job_error(job)
                 data_json = line_stripped[len('ERROR::'):]
                 message = json.dumps({'type': 'error', **json.loads(data_json)})
                 yield f"data: {message}\n\n"
@@ -155,17 +220,38 @@ def stream_inference_response(ply_filename):
         process.wait()
 
         if process.returncode != 0:
+            record_job_error(job)
             error_message = json.dumps(
                 {'type': 'error', 'data': f"Inference script exited with a non-zero code: {process.returncode}."})
             yield f"data: {error_message}\n\n"
 
     finally:
         inference_lock.release()
+        # 脚本没有给出任何结果（异常退出、客户端断开等）时，任务不能一直停留在 pending
+        if job.status == InferenceJob.STATUS_PENDING:
+            record_job_error(job)
         close_message = json.dumps({'type': 'status', 'data': 'Stream closed.'})
         yield f"data: {close_message}\n\n"
 
 
 
+def record_job_result(job, result):
+    """将推理结果写入任务记录，只有成功的任务才会被用作缓存"""
+    if isinstance(result, dict) and result.get('status') == 'success':
+        job.status = InferenceJob.STATUS_SUCCESS
+        job.result_url = result.get('url', '')
+        job.result_filename = result.get('filename', '')
+    else:
+        job.status = InferenceJob.STATUS_ERROR
+    job.save(update_fields=['status', 'result_url', 'result_filename'])
+
+
+def record_job_error(job):
+    """将任务标记为失败，失败的任务不会被用作缓存"""
+    job.status = InferenceJob.STATUS_ERROR
+    job.save(update_fields=['status'])
+
+
 def process_ply_view(request):  # <--- 不再需要 @api_view(['GET'])
     """处理SSE请求，现在是一个纯粹的 Django 视图"""
     if request.method != 'GET':
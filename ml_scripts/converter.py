@@ -3,6 +3,9 @@ import os
 import h5py
 import numpy as np
 from cadlib.visualize import vec2CADsolid
+from cadlib.validate import validate_vector, is_valid, format_issues
+from cadlib.shape_cache import extrude_cache
+from cadlib.preview import vec2preview, save_preview_json
 from OCC.Core.BRepCheck import BRepCheck_Analyzer
 from OCC.Extend.DataExchange import write_step_file
 
@@ -16,8 +19,17 @@ def h5_to_step(h5_path, output_step_path):
     try:
         with h5py.File(h5_path, 'r') as fp:
             out_vec = fp["out_vec"][:].astype(np.float64)
-            # 核心转换步骤
-            out_shape = vec2CADsolid(out_vec)
+    except Exception as e:
+        raise ValueError(f"Failed to read vector from H5 file. Reason: {e}")
+
+    # 先做廉价的数值检查，注定失败的向量不再交给 OpenCASCADE
+    issues = validate_vector(out_vec)
+    if not is_valid(issues):
+        raise ValueError(f"Invalid CAD vector: {format_issues(issues)}")
+
+    try:
+        # 核心转换步骤
+        out_shape = vec2CADsolid(out_vec, cache=extrude_cache)
     except Exception as e:
         # 在向量到实体转换时失败
         raise ValueError(f"Failed to create 3D solid from vector. Reason: {e}")
@@ -36,4 +48,13 @@ def h5_to_step(h5_path, output_step_path):
     except Exception as e:
         raise IOError(f"Failed to write STEP file. Reason: {e}")
 
-    return True
\ No newline at end of file
+    return True
+
+def vec_to_preview(out_vec, output_json_path):
+    """
+    不经过 OpenCASCADE，直接将 CAD 向量拉伸为三角网格并写成 JSON，用于在 STEP 生成前即时预览。
+    布尔运算不求值，每个拉伸体作为一个带操作类型的部件。失败时抛出异常。
+    """
+    vertices, faces, parts = vec2preview(np.asarray(out_vec, dtype=np.float64))
+    save_preview_json(vertices, faces, parts, output_json_path)
+    return True
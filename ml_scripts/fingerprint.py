@@ -0,0 +1,80 @@
+# backend/ml_scripts/fingerprint.py
+import hashlib
+import numpy as np
+
+# 体素网格分辨率：足够粗，点序变化、重采样和微小变换不会改变占据情况
+FINGERPRINT_GRID = 16
+# 默认相似度阈值（占据体素的 Jaccard 系数）
+DEFAULT_SIMILARITY = 0.9
+
+
+def load_ply_points(ply_path):
+    """读取 PLY 文件中的点坐标，返回 (N, 3) 的 float 数组。"""
+    import open3d as o3d
+    pcd = o3d.io.read_point_cloud(ply_path)
+    return np.asarray(pcd.points)
+
+
+def normalize_points(points):
+    """将点云平移到包围盒中心，并缩放到 [-1, 1] 立方体内。"""
+    points = np.asarray(points, dtype=np.float64)[:, :3]
+    bbox_min = points.min(axis=0)
+    bbox_max = points.max(axis=0)
+    center = (bbox_min + bbox_max) / 2.0
+    scale = np.max(bbox_max - bbox_min) / 2.0
+    if scale <= 0:
+        scale = 1.0
+    return (points - center) / scale
+
+
+def voxel_occupancy(points, grid_size=FINGERPRINT_GRID):
+    """将归一化后的点云体素化为粗粒度占据网格（扁平化的 bool 数组）。"""
+    normed = normalize_points(points)
+    idx = np.floor((normed + 1.0) / 2.0 * grid_size).astype(np.int64)
+    idx = np.clip(idx, 0, grid_size - 1)
+    occupancy = np.zeros((grid_size, grid_size, grid_size), dtype=bool)
+    occupancy[idx[:, 0], idx[:, 1], idx[:, 2]] = True
+    return occupancy.reshape(-1)
+
+
+def compute_fingerprint(points, grid_size=FINGERPRINT_GRID):
+    """
+    计算点云的几何指纹。
+
+    Returns:
+        (str, bytes): 占据网格的 sha1 十六进制哈希，以及按位打包的占据网格，
+        后者用于近似匹配时计算相似度。
+    """
+    occupancy = voxel_occupancy(points, grid_size)
+    packed = np.packbits(occupancy).tobytes()
+    digest = hashlib.sha1(packed).hexdigest()
+    return digest, packed
+
+
+def occupancy_count(packed):
+    """打包占据网格中被占据的体素数，作为相似度检索的数据库预筛选键。"""
+    return int(np.count_nonzero(np.unpackbits(np.frombuffer(packed, dtype=np.uint8))))
+
+
+def occupancy_count_range(count, threshold):
+    """
+    Jaccard 相似度不低于 threshold 的占据网格，其占据体素数所在的闭区间。
+
+    |A∩B| <= min(|A|, |B|) 且 |A∪B| >= max(|A|, |B|)，因此 J(A, B) >= t 要求
+    min/max >= t，即 t*|A| <= |B| <= |A|/t。上界为 None 表示不设上限（t <= 0）。
+    """
+    if threshold <= 0:
+        return 0, None
+    return int(np.ceil(threshold * count - 1e-9)), int(np.floor(count / threshold + 1e-9))
+
+
+def occupancy_similarity(packed_a, packed_b):
+    """两个打包占据网格之间的 Jaccard 相似度。"""
+    if len(packed_a) != len(packed_b):
+        return 0.0
+    a = np.unpackbits(np.frombuffer(packed_a, dtype=np.uint8)).astype(bool)
+    b = np.unpackbits(np.frombuffer(packed_b, dtype=np.uint8)).astype(bool)
+    union = np.count_nonzero(a | b)
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(a & b) / union
@@ -31,8 +31,9 @@ from extract_commands import get_command_sequence_string
 from deepcad_lib.pc2cad import PointNet2
 from deepcad_lib.config.configAE import ConfigAE
 from deepcad_lib.trainer import TrainerAE
+from deepcad_lib.utils import get_device
 # 在 run_inference.py 中
-from ml_scripts.converter import h5_to_step
+from ml_scripts.converter import h5_to_step, vec_to_preview
 
 
 N_POINTS = 2048
@@ -46,6 +47,10 @@ def print_result(message):
     """将最终结果编码为单行的JSON字符串并打印"""
     print(f"RESULT::{json.dumps({'data': message})}", flush=True)
 
+def print_preview(message):
+    """打印预览网格的地址，编码为JSON"""
+    print(f"PREVIEW::{json.dumps({'data': message})}", flush=True)
+
 def print_error(message):
     """打印错误信息，编码为JSON"""
     print(f"ERROR::{json.dumps({'data': message})}", flush=True)
@@ -56,7 +61,7 @@ def run_pipeline(ply_file_path, output_dir, pc_model_path, proj_dir, ae_exp_name
     try:
         # --- 步骤 1: 加载和处理点云 ---
         print_status("Step 1/4: Loading and processing point cloud...")
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        device = get_device()
         pcd = o3d.io.read_point_cloud(ply_file_path)
         if not pcd.has_normals():
             pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
@@ -128,6 +133,17 @@ def run_pipeline(ply_file_path, output_dir, pc_model_path, proj_dir, ae_exp_name
         with h5py.File(output_h5_path, 'w') as f:
             f.create_dataset('out_vec', data=cad_vec, dtype=np.int32)
 
+        # 先发送不依赖 OpenCASCADE 的预览网格，STEP 随后生成
+        output_preview_path = os.path.join(output_dir, f"{base_name}_preview.json")
+        try:
+            vec_to_preview(cad_vec, output_preview_path)
+            print_preview({
+                "url": f"/media/results/{os.path.basename(output_preview_path)}",
+                "filename": os.path.basename(output_preview_path)
+            })
+        except Exception as e:
+            print_status(f"Preview mesh skipped: {e}")
+
         print_status("Step 5/5: Converting to STEP format...")
         output_step_path = os.path.join(output_dir, f"{base_name}_reconstructed.step")
 